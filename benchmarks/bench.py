@@ -0,0 +1,358 @@
+'''
+benchmarks for the blotter hot paths, results are written as json so runs
+of two releases can be compared
+Example:
+    python -m benchmarks.bench --sizes 1k,100k,1M --output results.json
+    python -m benchmarks.bench --sizes 1k,100k,1M --compare results.json
+'''
+import io
+import gc
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import builtins
+import platform
+import tracemalloc
+import contextlib
+import datetime as dt
+
+from blotter import Blotter, Fill
+from blotter.input import consume
+from blotter.stream import consume_stream
+
+SUFFIXES = {'k': 1000, 'M': 1000000}
+# latency is timed on at most this many operations per benchmark
+SAMPLES = 100000
+
+
+def parse_size(value):
+    '''
+    value -> '1000', '10k' or '10M'
+    @returns int
+    '''
+    if value[-1] in SUFFIXES:
+        return int(float(value[:-1]) * SUFFIXES[value[-1]])
+    return int(value)
+
+
+def generate_fills(n, tickers=10, imbalance=0.5, partial=0.2, reuse=0.0, seed=0):
+    '''
+    synthetic fill rows, the same arguments always give the same rows
+    tickers -> number of ExchangeTickers, prices random walk by whole ticks
+    imbalance -> probability that a new order buys
+    partial -> probability that a fill is another partial fill of its ticker's working order
+    reuse -> probability that a new order takes an earlier OrderID
+    @returns Generator of (orderid, ticker, pricelevel, orderfilled)
+    '''
+    rng = random.Random(seed)
+    names = [f'T{i:04d}' for i in range(tickers)]
+    prices = dict.fromkeys(names, 100.0)
+    working = {}
+    orderid = 0
+    for _ in range(n):
+        ticker = rng.choice(names)
+        order = working.get(ticker)
+        if order is None or rng.random() >= partial:
+            if orderid and rng.random() < reuse:
+                oid = rng.randrange(orderid)
+            else:
+                orderid += 1
+                oid = orderid
+            order = working[ticker] = (oid, 1 if rng.random() < imbalance else -1)
+        price = prices[ticker] = round(prices[ticker] + rng.randint(-2, 2) * 0.0025, 4)
+        yield order[0], ticker, price, order[1] * rng.randint(1, 5)
+
+
+def percentile(samples, q):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))] / 1000
+
+
+class Case:
+    '''
+    a benchmark: setup builds its input outside the timing, run returns
+    (operations, sampled latencies in ns)
+    '''
+    def __init__(self, name, setup, run):
+        self.name = name
+        self.setup = setup
+        self.run = run
+
+
+def _rows(rows, history):
+    return rows, history
+
+
+def _add_fill(state, stride):
+    rows, history = state
+    blotters, create = {}, Fill.create
+    samples, clock = [], time.perf_counter_ns
+    for i, row in enumerate(rows):
+        fill = create(*row)
+        blotter = blotters.get(row[1])
+        if blotter is None:
+            blotter = blotters[row[1]] = Blotter(row[1], history=history)
+        if i % stride:
+            blotter.add_fill(fill)
+        else:
+            start = clock()
+            blotter.add_fill(fill)
+            samples.append(clock() - start)
+    return i + 1, samples
+
+
+def _by_ticker(rows):
+    by_ticker = {}
+    for row in rows:
+        by_ticker.setdefault(row[1], []).append(row)
+    return by_ticker
+
+
+def _initialize(bulk):
+    def setup(rows, history):
+        by_ticker = _by_ticker(rows)
+        if not bulk:
+            by_ticker = {t: [Fill.create(*row) for row in r] for t, r in by_ticker.items()}
+        return by_ticker, history
+
+    def run(state, stride):
+        by_ticker, history = state
+        samples, clock = [], time.perf_counter_ns
+        n = 0
+        for ticker, fills in by_ticker.items():
+            start = clock()
+            Blotter(ticker, history=history).initialize_from_list(fills, bulk=bulk)
+            samples.append(clock() - start)
+            n += len(fills)
+        return n, samples
+    return setup, run
+
+
+def _loaded(rows, history):
+    blotters = {}
+    for row in rows:
+        blotter = blotters.get(row[1])
+        if blotter is None:
+            blotter = blotters[row[1]] = Blotter(row[1], history=history)
+        blotter.add_fill(Fill.create(*row))
+    return list(blotters.values())
+
+
+def _query(method, calls=1000):
+    def run(blotters, stride):
+        samples, clock = [], time.perf_counter_ns
+        for i in range(calls):
+            query = getattr(blotters[i % len(blotters)], method)
+            start = clock()
+            query()
+            samples.append(clock() - start)
+        return calls, samples
+    return run
+
+
+def _marks(rows, history):
+    rows = list(rows)
+    return _loaded(rows, history), [row[2] for row in rows]
+
+
+def _update_from_marketdata(state, stride):
+    blotters, prices = state
+    samples, clock = [], time.perf_counter_ns
+    k = len(blotters)
+    for i, price in enumerate(prices):
+        blotter = blotters[i % k]
+        if i % stride:
+            blotter.update_from_marketdata(price)
+        else:
+            start = clock()
+            blotter.update_from_marketdata(price)
+            samples.append(clock() - start)
+    return len(prices), samples
+
+
+def _lines(rows, history):
+    lines = [f"{'B' if q > 0 else 'S'} {abs(q)} {ticker} {price}" for _, ticker, price, q in rows]
+    return lines, history
+
+
+def _consume(state, stride):
+    '''
+    the interactive parser, fed by replacing input() until the lines run out
+    '''
+    lines, history = state
+    contracts = {t: {} for t in {line.split()[2] for line in lines}}
+    samples, clock = [], time.perf_counter_ns
+    feed = iter(lines)
+    last = [None, 0]
+
+    def read(prompt=''):
+        now = clock()
+        if last[0] is not None and not last[1] % stride:
+            samples.append(now - last[0])
+        last[1] += 1
+        last[0] = clock()
+        try:
+            return next(feed)
+        except StopIteration:
+            raise EOFError
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+        builtin, builtins.input = builtins.input, read
+        try:
+            consume(contracts)
+        except EOFError:
+            pass
+        finally:
+            builtins.input = builtin
+    return len(lines), samples
+
+
+def _csv(rows, history):
+    return ''.join(f'{oid},{ticker},{price},{q}\n' for oid, ticker, price, q in rows), history
+
+
+def _consume_stream(state, stride):
+    text, history = state
+    with open(os.devnull, 'w') as null:
+        consume_stream(io.StringIO(text), out=null, history=history)
+    return text.count('\n'), []
+
+
+CASES = [Case('add_fill', _rows, _add_fill),
+         Case('initialize_from_list', *_initialize(False)),
+         Case('initialize_from_list_bulk', *_initialize(True)),
+         Case('get_open_positions', _loaded, _query('get_open_positions')),
+         Case('get_closed_positions', _loaded, _query('get_closed_positions', 100)),
+         Case('update_from_marketdata', _marks, _update_from_marketdata),
+         Case('consume', _lines, _consume),
+         Case('consume_stream', _csv, _consume_stream)]
+
+
+def measure(case, rows, stride=1, history=True, memory=True):
+    '''
+    rows -> callable returning a fresh iterable of fill rows
+    stride -> time the latency of every stride-th operation
+    memory -> repeat the case under tracemalloc for its peak allocation
+    @returns Dict
+    '''
+    state = case.setup(rows(), history)
+    gc.collect()
+    start = time.perf_counter()
+    ops, samples = case.run(state, stride)
+    elapsed = time.perf_counter() - start
+    del state
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            case.run(case.setup(rows(), history), stride)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {'name': case.name, 'ops': ops, 'seconds': elapsed,
+            'ops_per_sec': ops / elapsed if elapsed else None,
+            'p50_us': percentile(samples, 0.5), 'p99_us': percentile(samples, 0.99),
+            'peak_bytes': peak}
+
+
+def run_suite(sizes, names=None, tickers=10, imbalance=0.5, partial=0.2, reuse=0.0, seed=0,
+              history=True, memory=True, out=sys.stderr):
+    '''
+    sizes -> fill counts to run every case at
+    names -> subset of CASES to run
+    @returns Dict of the run metadata and one result per case and size
+    '''
+    cases = [c for c in CASES if names is None or c.name in names]
+    params = dict(tickers=tickers, imbalance=imbalance, partial=partial, reuse=reuse, seed=seed)
+    results = []
+    for size in sizes:
+        rows = lambda: generate_fills(size, **params)
+        for case in cases:
+            result = dict(measure(case, rows, max(1, size // SAMPLES), history, memory), fills=size)
+            results.append(result)
+            if out is not None:
+                print(format_result(result), file=out, flush=True)
+    return {'meta': dict(params, history=history, version=version(), python=platform.python_version(),
+                         platform=platform.platform(), time=dt.datetime.now().isoformat()),
+            'results': results}
+
+
+def version():
+    try:
+        from importlib.metadata import version
+        return version('blotter')
+    except Exception:
+        return None
+
+
+def format_result(result):
+    p50, p99, peak = result['p50_us'], result['p99_us'], result['peak_bytes']
+    return f"{result['name']:<28}{result['fills']:>10} fills" + \
+           f"{result['ops_per_sec'] or 0:>14,.0f} ops/s" + \
+           (f'{p50:>10.2f} p50us{p99:>10.2f} p99us' if p50 is not None else ' ' * 30) + \
+           (f'{peak / 2**20:>10.1f} MiB' if peak is not None else '')
+
+
+def compare(baseline, current, threshold=0.1, out=sys.stderr):
+    '''
+    baseline, current -> Dicts from run_suite
+    threshold -> relative throughput drop reported as a regression
+    @returns List of (name, fills, ratio) regressions
+    '''
+    before = {(r['name'], r['fills']): r for r in baseline['results']}
+    regressions = []
+    for r in current['results']:
+        old = before.get((r['name'], r['fills']))
+        if old is None or not old['ops_per_sec'] or not r['ops_per_sec']:
+            continue
+        ratio = r['ops_per_sec'] / old['ops_per_sec']
+        flag = ' REGRESSION' if ratio < 1 - threshold else ''
+        if flag:
+            regressions.append((r['name'], r['fills'], ratio))
+        print(f"{r['name']:<28}{r['fills']:>10} fills{ratio:>8.2f}x{flag}", file=out)
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench', description='blotter benchmarks')
+    parser.add_argument('--sizes', default='1k,10k,100k', help='fill counts, k and M suffixes (default: %(default)s)')
+    parser.add_argument('--cases', help='comma separated subset of: ' + ', '.join(c.name for c in CASES))
+    parser.add_argument('--tickers', type=int, default=10)
+    parser.add_argument('--imbalance', type=float, default=0.5, help='probability that an order buys')
+    parser.add_argument('--partial', type=float, default=0.2, help='probability of another partial fill of the working order')
+    parser.add_argument('--reuse', type=float, default=0.0, help='probability that an order reuses an earlier OrderID')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-history', action='store_true', help='drop booked fills, as consume_stream does by default')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+    parser.add_argument('--output', help='write the json results here (default: stdout)')
+    parser.add_argument('--compare', help='json results of an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.1, help='throughput drop reported as a regression')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_suite([parse_size(s) for s in args.sizes.split(',')],
+                        args.cases.split(',') if args.cases else None,
+                        args.tickers, args.imbalance, args.partial, args.reuse, args.seed,
+                        history=not args.no_history, memory=not args.no_memory)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    else:
+        json.dump(results, sys.stdout, indent=1)
+        print()
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(json.load(f), results, args.threshold):
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
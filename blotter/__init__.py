@@ -1,5 +1,17 @@
 from .blot import Blotter
 from .fill import Fill
+from .store import FillStore
+from .portfolio import Portfolio
+from .conflate import Conflator
+from .journal import Journal
+from .ledger import Ledger
+from .shard import ShardedPortfolio
+from .stats import Stats
+from .policies import PolicyBlotter
+from .series import Series
+from .snapshot import SnapshotTable, SnapshotReader
+from .events import EventBus
+from .limits import Limits
 from .directions import DIRECTIONS
 #from fill import Fill
 
@@ -1,5 +1,69 @@
+import sys
+import asyncio
+import argparse
+
 from .input import consume
+from .stream import consume_stream, load_contracts, READERS
+from .journal import Journal
+from .ledger import Ledger
+from .shard import ShardedPortfolio
+from .server import serve, generate_load
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m blotter',
+                                     description='trade blotting profit and loss calculator')
+    parser.add_argument('--file', help="stream fills from a file, '-' for stdin (default: interactive)")
+    parser.add_argument('--format', default='csv', choices=sorted(READERS),
+                        help='csv rows of OrderID,ExchangeTicker,PriceLevel,OrderFilled[,TransactionTime] or json lines')
+    parser.add_argument('--contracts', help='json file of contract specs keyed by ExchangeTicker')
+    parser.add_argument('--snapshot-every', type=int, help='print blotters every N fills')
+    parser.add_argument('--snapshot-interval', type=float, help='print blotters every N seconds')
+    parser.add_argument('--keep-history', action='store_true', help='keep booked fills in memory while streaming')
+    parser.add_argument('--journal', help='journal fills to this file and restore from it on start')
+    parser.add_argument('--checkpoint-every', type=int, default=100000,
+                        help='snapshot the journaled blotters every N fills (default: %(default)s)')
+    parser.add_argument('--ledger', help='append every FIFO match to this file')
+    parser.add_argument('--workers', type=int, help='shard tickers over N worker processes')
+    parser.add_argument('--serve', metavar='ADDRESS', help="run the fill server on host:port or unix:/path")
+    parser.add_argument('--load', type=int, metavar='N', help='send N random fills to the server at --connect')
+    parser.add_argument('--connect', metavar='ADDRESS', default='127.0.0.1:7070', help='server for --load (default: %(default)s)')
+    return parser.parse_args(argv)
 
-if __name__ == '__main__':
-    consume()
 
+def main(argv=None):
+    args = parse_args(argv)
+    contracts = load_contracts(args.contracts) if args.contracts else None
+    if args.serve:
+        try:
+            return asyncio.run(serve(args.serve, contracts, history=args.keep_history))
+        except KeyboardInterrupt:
+            return
+    if args.load:
+        rate, snapshot = asyncio.run(generate_load(args.connect, args.load))
+        print(f'{int(rate)} fills/s', snapshot['portfolio'])
+        return snapshot
+    if args.file is None:
+        return consume(contracts)
+    kwargs = dict(fmt=args.format, contracts=contracts, snapshot_every=args.snapshot_every,
+                  snapshot_interval=args.snapshot_interval, history=args.keep_history)
+    journal = kwargs['journal'] = Journal(args.journal, args.checkpoint_every) if args.journal else None
+    kwargs['ledger'] = Ledger(args.ledger) if args.ledger else None
+    kwargs['workers'] = args.workers
+    portfolio = None
+    try:
+        if args.file == '-':
+            portfolio = consume_stream(sys.stdin, **kwargs)
+        else:
+            with open(args.file, newline='') as stream:
+                portfolio = consume_stream(stream, **kwargs)
+        return portfolio
+    finally:
+        if journal is not None:
+            journal.close()
+        if isinstance(portfolio, ShardedPortfolio):
+            portfolio.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,64 @@
-from .log import Logger, LOGGING_ENABLED
+from time import perf_counter_ns
+from collections import deque
+
+from .log import Logger, LOGGING_ENABLED, register_event
 from .fill import Fill
 from .directions import DIRECTIONS
-from .util import calc_pnl, calc_avg_open_price
+from .lots import get_policy
+from .positions import OpenPositions
+from .bulk import load_columns, columns_from_rows
+from .util import calc_pnl, calc_avg_open_price, to_ticks, from_ticks
+from .stats import TimedLogger, DEPTH
+from .timeindex import TimeIndex
+from .whatif import WhatIf
+from .series import Series
+from .export import export, FILLS, MATCHES
+from .events import EventBus
+
+def format_blotter(fields):
+    '''
+    fields -> Blotter.fields
+    @returns str
+    '''
+    name, net_position, ticker, avg_open_price, total_pnl = fields
+    if avg_open_price:
+        avg_open_price = round(avg_open_price, 6)
+    else:
+        avg_open_price = 'None'
+    if not net_position:
+        direction = DIRECTIONS.FLAT
+    else:
+        direction = DIRECTIONS.LONG if net_position > 0 else DIRECTIONS.SHORT
+    return f'>{name.upper()}|' + \
+           f'{direction.name}|'+ \
+           f'{abs(net_position)}|' + \
+           f'{ticker}|' + \
+           f'{avg_open_price}|' + \
+           f'{round(total_pnl, 2)}|' + \
+           f'|'
+
+
+register_event('BLOTTER', format_blotter)
+
 
 class Blotter:
     def __init__(self, 
                  ticker, 
                  contract_multiplier=1, 
                  tick_value=12.5, 
-                 tick_size=0.0025
+                 tick_size=0.0025,
+                 store=None,
+                 history=True,
+                 journal=None,
+                 ledger=None,
+                 ticks=False,
+                 stats=None,
+                 time_index=False,
+                 undo=0,
+                 policy='fifo',
+                 series=None,
+                 snapshots=None,
+                 events=None
                  ):
         self.ticker = ticker
         self.net_position = 0
@@ -16,14 +66,72 @@ class Blotter:
         self.realized_pnl = 0
         self.unrealized_pnl = 0
         self.total_pnl = 0
+        # ticks=True matches on integer tick prices and accumulates realized pnl in
+        # tick_value units, avg_open_price and realized_pnl are converted from these
+        self.ticks = ticks
+        self.avg_open_ticks = 0
+        self.realized_ticks = 0
         #
-        self.trades = []
-        self.positions = []
+        self.store = store
+        self.history = history  # False leaves trades empty, open fills stay in positions and lots, booked ones drop their Offsets
+        self.trades = [] if store is None else store
+        self.positions = OpenPositions()
+        self.lots = get_policy(policy)()  # fifo, lifo, hifo or average, see lots.POLICIES
+        self.journal = journal
+        self.ledger = ledger
+        self.times = TimeIndex() if time_index else None
+        # the last undo updates with the lot state they overwrote, for bust and correct
+        self.undo = deque(maxlen=undo) if undo else None
+        # a Dict of Series kwargs builds one Series per Blotter, e.g. from Portfolio kwargs
+        self.series = Series(**series) if isinstance(series, dict) else series
+        self.snapshots = snapshots  # SnapshotTable, may be shared by every Blotter of a Portfolio
+        if snapshots is not None:
+            snapshots.add(self)
+        self.events = events  # EventBus, see subscribe
+        if journal is not None and journal.target is None:
+            journal.target = self
         #
         self.contract_multiplier = contract_multiplier
         self.tick_value = tick_value
         self.tick_size = tick_size
         self.logger = self.get_logger()
+        self.stats = None
+        if stats is not None:
+            self.instrument(stats)
+
+    def instrument(self, stats):
+        '''
+        record counters and latency histograms into stats, None turns it off,
+        the timed methods are bound on this instance only so an uninstrumented
+        Blotter runs the plain ones
+        stats -> Stats
+        @returns Blotter
+        '''
+        for name in ('update', 'get_open_positions', 'update_from_marketdata'):
+            self.__dict__.pop(name, None)
+        if isinstance(self.logger, TimedLogger):
+            self.logger = self.logger.logger
+        if self.stats is not None:
+            self.stats.untrack(self)
+        self.stats = stats
+        if stats is not None:
+            cls = type(self)
+            stats.track('open_lots', self, self.lots.__len__)
+            stats.track('open_orders', self, self.positions.__len__)
+            stats.track('trades', self, lambda: len(self.trades))
+            self.update = self._instrumented_update
+            self.get_open_positions = stats.timed('open_positions_us', cls.get_open_positions.__get__(self))
+            self.update_from_marketdata = stats.timed('mark_us', cls.update_from_marketdata.__get__(self))
+            self.logger = TimedLogger(self.logger, stats)
+        return self
+
+    def _instrumented_update(self, fill, mark=None):
+        stats = self.stats
+        start = perf_counter_ns()
+        type(self).update(self, fill, mark)
+        stats.observe('update_us', (perf_counter_ns() - start) / 1000)
+        stats.incr('fills')
+        return self
 
     def get_logger(self):
         logger = Logger(self.__class__.__name__)
@@ -45,18 +153,15 @@ class Blotter:
             return DIRECTIONS.FLAT
         return DIRECTIONS.LONG if self.net_position > 0 else DIRECTIONS.SHORT
 
+    @property
+    def fields(self):
+        '''
+        @returns Tuple of the values shown by str, for deferred log formatting
+        '''
+        return (self.__class__.__name__, self.net_position, self.ticker, self.avg_open_price, self.total_pnl)
+
     def __str__(self):
-        if self.avg_open_price:
-            avg_open_price = round(self.avg_open_price, 6)
-        else:
-            avg_open_price = 'None'
-        return f'>{self.__class__.__name__.upper()}|' + \
-               f'{self.net_direction.name}|'+ \
-               f'{abs(self.net_position)}|' + \
-               f'{self.ticker}|' + \
-               f'{avg_open_price}|' + \
-               f'{round(self.total_pnl, 2)}|' + \
-               f'|'
+        return format_blotter(self.fields)
 
     def __repr__(self):
         return self.__str__()
@@ -72,92 +177,353 @@ class Blotter:
             raise ValueError(msg)
         self.update(fill)
 
+    def subscribe(self, callback, **kwargs):
+        '''
+        receive change events of this Blotter in batches, see events.Subscription
+        callback -> callable taking a List of events
+        kwargs -> kinds, size, interval, thresholds
+        @returns events.Subscription, events.EventBus.unsubscribe stops it
+        '''
+        if self.events is None:
+            self.events = EventBus()
+        return self.events.subscribe(callback, **kwargs)
+
     def get_closed_positions(self):
         booked = [t for t in self.trades if t.Booked]
         return booked
 
+    def export(self, target, view='trades', fmt='csv', **kwargs):
+        '''
+        stream a view to csv or a structured .npy in chunks, see export.write_csv and export.write_npy
+        target -> path or open file
+        view -> trades, open, closed or matches (needs a ledger or time index)
+        @returns int number of rows written
+        '''
+        schema = FILLS
+        if view == 'trades':
+            rows = self.trades
+        elif view == 'open':
+            rows = self.get_open_positions()
+        elif view == 'closed':
+            rows = (t for t in self.trades if t.Booked)
+        elif view == 'matches':
+            if self.ledger is not None:
+                rows = iter(self.ledger)
+            else:
+                rows = self.get_time_index().matches
+            schema = MATCHES
+        else:
+            raise ValueError(f'Unknown export view {view!r}, expected trades, open, closed or matches')
+        return export(target, rows, fmt, schema, **kwargs)
+
+    def compact(self):
+        '''
+        drop booked fills and their Offsets from trades, with a ledger their matches stay queryable
+        @returns int number of fills dropped
+        '''
+        if self.store is not None:
+            raise ValueError(f'Cannot compact a {self.store.__class__.__name__} backed Blotter')
+        kept = []
+        for t in self.trades:
+            if t.Booked:
+                t.Offsets.clear()
+            else:
+                kept.append(t)
+        dropped = len(self.trades) - len(kept)
+        self.trades = kept
+        return dropped
+
+    @property
+    def totals(self):
+        return (self.net_position, self.avg_open_price, self.avg_open_ticks, self.realized_pnl,
+                self.realized_ticks, self.unrealized_pnl, self.total_pnl)
+
+    @totals.setter
+    def totals(self, totals):
+        self.net_position, self.avg_open_price, self.avg_open_ticks, self.realized_pnl, \
+            self.realized_ticks, self.unrealized_pnl, self.total_pnl = totals
+
+    def bust(self, exec_id):
+        '''
+        remove a fill, only the updates from it onwards are unwound and the later fills re-matched
+        exec_id -> ExecID of one of the last undo fills
+        @returns Fill removed
+        '''
+        return self.rebook(exec_id)[0]
+
+    def correct(self, exec_id, PriceLevel=None, OrderFilled=None):
+        '''
+        amend the price and/or quantity of a fill, see bust
+        @returns Fill booked in its place
+        '''
+        def amend(fill):
+            corrected = Fill(fill)
+            if PriceLevel is not None:
+                corrected.PriceLevel = float(PriceLevel)
+            if OrderFilled is not None:
+                corrected.OrderFilled = corrected.OpenQuantity = float(OrderFilled)
+            return corrected
+        return self.rebook(exec_id, amend)[1]
+
+    def rebook(self, exec_id, amend=None):
+        '''
+        roll the blotter back to before the fill with exec_id using the undo log,
+        then update it again with the fills that followed, as fresh copies
+        amend -> callable returning the Fill booked in place of the removed one, None busts it
+        @returns Tuple of (removed Fill, amended Fill or None)
+        '''
+        if self.undo is None:
+            raise ValueError(f'{self.ticker} Blotter keeps no undo log, create it with undo=N')
+        if self.journal is not None or self.ledger is not None or self.times is not None:
+            raise ValueError('Cannot bust or correct a fill already written to a journal, ledger or time index')
+        log = self.undo
+        for k in range(len(log) - 1, -1, -1):
+            if log[k][0].ExecID == exec_id:
+                break
+        else:
+            raise ValueError(f'ExecID {exec_id} is not among the last {len(log)} fills of {self.ticker}')
+        busted = Fill(log[k][0])
+        amended = None
+        if amend is not None:
+            # an invalid correction raises here, before anything is unwound
+            amended = amend(busted)
+            amended.Direction
+
+        lots = self.lots
+        reopened = []
+        records = [log.pop() for _ in range(len(log) - k)]
+        for fill, totals, touched in records:
+            lots.discard(fill)
+            for lot, open_quantity, real_pnl, booked, booked_at, partial, partial_at, offsets in reversed(touched):
+                if lot.Booked and not booked:
+                    lots.restore(lot)
+                    reopened.append(lot)
+                lot.OpenQuantity, lot.RealPnl, lot.Booked, lot.BookedAt = open_quantity, real_pnl, booked, booked_at
+                lot.BookedPartial, lot.BookedPartialAt, lot.Offsets = partial, partial_at, offsets
+            self.totals = totals
+
+        removed = [r[0] for r in reversed(records)]
+        later = [Fill(f) for f in removed[1:]]
+        gone = set(removed)
+        if self.store is not None:
+            self.store.truncate(removed[0].row)
+        elif self.history:
+            trades = self.trades
+            i = len(trades) - 1
+            while i > 0 and trades[i] is not removed[0]:
+                i -= 1
+            trades[i:] = [t for t in trades[i:] if t not in gone]
+        open_fills = [f for p in self.positions.orders.values() for f in p.fills if f not in gone]
+        open_fills.extend(f for f in reopened if f not in gone)
+        self.positions = OpenPositions()
+        for f in sorted(open_fills, key=lambda f: f.TransactionTime):
+            self.positions.add(f)
+
+        if amended is not None:
+            later.insert(0, amended)
+        if LOGGING_ENABLED:
+            self.logger.info(f'{"CORRECT" if amend else "BUST"} {exec_id}, rebooking {len(later)} fills')
+        for f in later:
+            self.update(f)
+        return busted, amended
+
     def get_open_positions(self):
         '''
         @returns List
         '''
-        positions = {}
-        not_booked = [t for t in self.trades if not t.Booked]
-        for t in not_booked:
-            position = positions.get(t.OrderID)
-            if not position:
-                positions[t.OrderID] = t
+        return self.positions.snapshot()
+
+    def get_time_index(self):
+        if self.times is None:
+            raise ValueError(f'{self.ticker} Blotter has no time index, create it with time_index=True')
+        return self.times
+
+    def fills_between(self, start=None, end=None):
+        '''
+        start, end -> datetime, end exclusive
+        @returns List of Fill in TransactionTime order
+        '''
+        return self.get_time_index().between(start, end)
+
+    def matches_between(self, start=None, end=None):
+        '''
+        @returns List of ledger.Match booked in [start, end)
+        '''
+        return self.get_time_index().matches_between(start, end)
+
+    def as_of(self, when, last_price=None):
+        '''
+        when -> datetime
+        last_price -> fills in unrealized_pnl at this price
+        @returns timeindex.AsOf
+        '''
+        state = self.get_time_index().as_of(when)
+        if last_price is None:
+            return state
+        unrealized_pnl = 0
+        if state.net_position:
+            unrealized_pnl = (last_price - state.avg_open_price) * state.net_position \
+                * self.contract_multiplier / self.tick_size * self.tick_value
+        return state._replace(unrealized_pnl=unrealized_pnl)
+
+    def what_if(self, fills=(), last_price=None):
+        '''
+        apply hypothetical fills over this Blotter without changing it
+        fills -> Iterable of Fill or (orderfilled, pricelevel)
+        last_price -> marks the scenario after the fills
+        @returns whatif.WhatIf, result() gives its totals
+        '''
+        scenario = WhatIf(self)
+        for fill in fills:
+            if isinstance(fill, tuple):
+                scenario.add(*fill)
             else:
-                price = ((position.PriceLevel * abs(position.OpenQuantity)) + (t.PriceLevel * abs(t.OpenQuantity))) \
-                            / (abs(position.OpenQuantity) + abs(t.OpenQuantity))
-                position.PriceLevel = price
-                position.OrderFilled += t.OrderFilled
-                position.OpenQuantity += t.OpenQuantity
-                position.BookedPartial = int(any([t.BookedPartial for t in filter(lambda x: x.OrderID==t.OrderID, not_booked)]))
-                position.Offsets += t.Offsets
-                position.UnrealPnl += t.UnrealPnl
-                position.RealPnl += t.RealPnl
-                # store the most recent ExecID, ClOrderID
-                position.ExecID = t.ExecID
-                position.ClOrderID = t.ClOrderID
-        return sorted(positions.values(), key=lambda x: x.TransactionTime)
+                scenario.add_fill(fill)
+        if last_price is not None:
+            scenario.update_from_marketdata(last_price)
+        return scenario
 
     def get_fifo_trade_by_direction(self, direction):
         '''
-        direction -> type(DIRECTIONS)
+        direction -> type(DIRECTIONS).value
         @returns Fill or None  
         '''
-        for t in self.trades:
-            if t.Direction.value == direction and not t.Booked:
-                return t
+        return self.lots.peek(direction)
 
     def close_existing_positions(self, trade):
         '''
         trade -> Fill
         @returns Blotter
         '''
-        closing_trade = self.get_fifo_trade_by_direction(-1*trade.Direction.value)
-        if trade.Booked or not closing_trade:
-            return
+        direction = -1*trade.Direction.value
+        lots, positions = self.lots, self.positions
+        average = lots.average
+        if self.ticks:
+            trade_ticks = to_ticks(trade.PriceLevel, self.tick_size)
+        walked = popped = 0
+        while not trade.Booked:
+            closing_trade = lots.peek(direction)
+            if not closing_trade:
+                break
+            walked += 1
 
-        pnl = calc_pnl(closing_trade.OpenQuantity, 
-                       closing_trade.PriceLevel, 
-                       trade.OpenQuantity, 
-                       trade.PriceLevel
-        )  * self.contract_multiplier / self.tick_size * self.tick_value
-        self.realized_pnl += pnl
+            if self.ticks:
+                pnl_ticks = calc_pnl(closing_trade.OpenQuantity,
+                                     self.avg_open_ticks if average else to_ticks(closing_trade.PriceLevel, self.tick_size),
+                                     trade.OpenQuantity,
+                                     trade_ticks
+                ) * self.contract_multiplier
+                self.realized_ticks += pnl_ticks
+                pnl = pnl_ticks * self.tick_value
+                self.realized_pnl = self.realized_ticks * self.tick_value
+            else:
+                pnl = calc_pnl(closing_trade.OpenQuantity, 
+                               self.avg_open_price if average else closing_trade.PriceLevel, 
+                               trade.OpenQuantity, 
+                               trade.PriceLevel
+                )  * self.contract_multiplier / self.tick_size * self.tick_value
+                self.realized_pnl += pnl
 
-        closing_trade.book(pnl, trade)
-        return self.close_existing_positions(trade)
+            open_quantity, real_pnl, partial = \
+                closing_trade.OpenQuantity, closing_trade.RealPnl, closing_trade.BookedPartial
+            if self.undo is not None:
+                self.undo[-1][2].append((closing_trade, open_quantity, real_pnl, closing_trade.Booked,
+                                         closing_trade.BookedAt, partial, closing_trade.BookedPartialAt,
+                                         list(closing_trade.Offsets)))
+            if self.ledger is not None or self.times is not None:
+                matched = open_quantity if abs(open_quantity) <= abs(trade.OpenQuantity) else -trade.OpenQuantity
+                if self.ledger is not None:
+                    self.ledger.record(closing_trade, trade, matched, pnl)
+                if self.times is not None:
+                    self.times.record(closing_trade, trade, matched, pnl)
+            closing_trade.book(pnl, trade)
+            positions.refresh(closing_trade, open_quantity, real_pnl, partial)
+            if self.events is not None:
+                self.events.booked(self, closing_trade)
+            if closing_trade.Booked:
+                lots.pop(direction)
+                popped += 1
+                if not self.history:
+                    closing_trade.Offsets.clear()
+        if trade.Booked and not self.history:
+            trade.Offsets.clear()
+        if self.events is not None and walked:
+            self.events.booked(self, trade)
+        if self.stats is not None:
+            # every match books both fills, fully or partially
+            full = popped + bool(trade.Booked)
+            self.stats.observe('lots_walked', walked, DEPTH)
+            self.stats.incr('bookings_full', full)
+            self.stats.incr('bookings_partial', 2 * walked - full)
+        return self
 
-    def update(self, fill):
+    def update(self, fill, mark=None):
         '''
         trade -> Fill
+        mark -> last price to revalue at before the totals are sampled and published,
+                so a caller marking after every fill (Portfolio) takes one sample per fill
         @returns Blotter
         '''
+        # validated before the fill is recorded anywhere, a rejected fill leaves no trace
+        is_closing_trade = self.net_position and (self.net_position > 0) != (fill.Direction is DIRECTIONS.LONG)
+        if self.ticks:
+            price, avg = to_ticks(fill.PriceLevel, self.tick_size), self.avg_open_ticks
+        else:
+            price, avg = fill.PriceLevel, self.avg_open_price
+        if self.store is not None:
+            fill = self.store.append(fill)
+        elif self.history:
+            self.trades.append(fill)
+        if self.times is not None:
+            self.times.add(fill)
+        if self.undo is not None:
+            self.undo.append((fill, self.totals, []))
         if LOGGING_ENABLED:
-            fill.logger.info(f'{fill}')
-        is_closing_trade = self.net_position and self.net_direction != fill.Direction
+            fill.logger.event('FILL', fill.fields)
 
         if is_closing_trade:
             self.close_existing_positions(fill)
                                 
         elif self.net_position:
-            self.avg_open_price = calc_avg_open_price(self.net_position, self.avg_open_price, fill.OpenQuantity, fill.PriceLevel)
+            avg = calc_avg_open_price(self.net_position, avg, fill.OpenQuantity, price)
         else:
-            self.avg_open_price = fill.PriceLevel
+            avg = price
 
         if is_closing_trade and abs(self.net_position) < abs(fill.OpenQuantity):
-            self.avg_open_price = fill.PriceLevel
+            avg = price
+        elif is_closing_trade and self.lots.average and fill.OpenQuantity:
+            # average cost values the next close against avg, a reversal opens at the fill price
+            avg = price
 
         self.total_pnl = self.realized_pnl + self.unrealized_pnl
         self.net_position += fill.OrderFilled
 
         if not self.net_position:
-            self.avg_open_price = None
+            avg = None
+        if self.ticks:
+            self.avg_open_ticks = avg
+            self.avg_open_price = None if avg is None else from_ticks(avg, self.tick_size)
+        else:
+            self.avg_open_price = avg
 
-        self.trades.append(fill)
+        if not fill.Booked:
+            self.positions.add(fill)
+            if fill.OrderFilled:
+                self.lots.add(fill)
+        if mark is not None:
+            self.revalue(mark)
+        if self.times is not None:
+            self.times.mark(self)
+        if self.series is not None:
+            self.series.sample(self)
+        if self.journal is not None:
+            self.journal.append(fill)
+        if self.snapshots is not None:
+            self.snapshots.publish(self)
+        if self.events is not None:
+            self.events.applied(self, fill)
         if LOGGING_ENABLED:
-            self.logger.info(self)
+            self.logger.event('BLOTTER', self.fields)
         return self
 
     def update_from_marketdata(self, last_price):
@@ -165,16 +531,63 @@ class Blotter:
         last_price -> float
         @returns Blotter
         '''
-        self.unrealized_pnl = (last_price - self.avg_open_price) * self.net_position
-        self.total_pnl = self.realized_pnl + self.unrealized_pnl
+        self.revalue(last_price)
+        if self.series is not None:
+            self.series.sample(self)
+        if self.snapshots is not None:
+            self.snapshots.publish(self)
+        if self.events is not None:
+            self.events.marked(self)
         return self
 
-    def initialize_from_list(self, fills:list):
+    def revalue(self, last_price):
+        '''
+        unrealized_pnl and total_pnl at last_price, without sampling or publishing them
+        '''
+        if self.net_position and self.ticks:
+            self.unrealized_pnl = (to_ticks(last_price, self.tick_size) - self.avg_open_ticks) * self.net_position \
+                * self.contract_multiplier * self.tick_value
+        elif self.net_position:
+            self.unrealized_pnl = (last_price - self.avg_open_price) * self.net_position \
+                * self.contract_multiplier / self.tick_size * self.tick_value
+        else:
+            self.unrealized_pnl = 0
+        self.total_pnl = self.realized_pnl + self.unrealized_pnl
+
+    def initialize_from_list(self, fills:list, bulk=False):
         '''
         fills -> List
+        bulk -> match the whole list in one pass, rows may be Fill or tuples of
+                (orderid, ticker, pricelevel, orderfilled[, transactiontime])
         @returns Blotter
         '''
+        if bulk:
+            return self.initialize_from_columns(*columns_from_rows(self, fills))
         for f in fills:
             self.add_fill(f)
         return self
 
+    def initialize_from_columns(self, orderfilled, pricelevel, orderid=None, transactiontime=None, execid=None,
+                                clorderid=None):
+        '''
+        orderfilled, pricelevel -> sequence or numpy array
+        orderid, transactiontime, execid, clorderid -> sequence or numpy array
+        @returns Blotter
+        '''
+        if self.times is not None:
+            raise ValueError('A time indexed Blotter needs its fills one at a time, bulk loads keep no history of totals')
+        store = load_columns(self, orderfilled, pricelevel, orderid, transactiontime, execid, clorderid)
+        if self.series is not None:
+            # one sample for the whole load
+            self.series.sample(self)
+        if self.journal is not None:
+            self.journal.extend(store)
+        if self.snapshots is not None:
+            self.snapshots.publish(self)
+        if self.events is not None:
+            # a bulk load reports no per fill events, only the thresholds it crossed
+            self.events.marked(self)
+        if LOGGING_ENABLED:
+            self.logger.info(self)
+        return self
+
@@ -0,0 +1,349 @@
+import copy
+import itertools
+import datetime as dt
+from array import array
+from collections import deque
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .fill import BaseFill, _exec_ids
+from .store import FillStore, StoredFill, to_micros
+from .util import calc_pnl, calc_avg_open_price, to_ticks, from_ticks
+
+
+def columns_from_rows(blotter, rows):
+    '''
+    rows -> iterable of Fill or (orderid, ticker, pricelevel, orderfilled[, transactiontime[, execid[, clorderid]]])
+    @returns Tuple of column lists, in initialize_from_columns order
+    '''
+    orderfilled, pricelevel, orderid, transactiontime, execid, clorderid = [], [], [], [], [], []
+    for row in rows:
+        if isinstance(row, BaseFill):
+            row = (row.OrderID, row.ExchangeTicker, row.PriceLevel, row.OrderFilled, row.TransactionTime,
+                   row.ExecID, row.ClOrderID)
+        if row[1] != blotter.ticker:
+            raise ValueError(f'Warning: attempt to add fill to blotter with incorrect ExchangeTicker ({row[1]})')
+        orderid.append(row[0])
+        pricelevel.append(float(row[2]))
+        orderfilled.append(float(row[3]))
+        transactiontime.append(row[4] if len(row) > 4 else None)
+        # a row without ids gets a fresh ExecID and its OrderID as ClOrderID, as Fill.create
+        execid.append(next(_exec_ids) if len(row) <= 5 or row[5] is None else row[5])
+        clorderid.append(row[0] if len(row) <= 6 or row[6] is None else row[6])
+    if not any(t is not None for t in transactiontime):
+        transactiontime = None
+    return orderfilled, pricelevel, orderid, transactiontime, execid, clorderid
+
+
+def load_columns(blotter, orderfilled, pricelevel, orderid=None, transactiontime=None, execid=None, clorderid=None):
+    '''
+    append columns to the blotter store and FIFO match them in one pass, a
+    blotter with history=False and no store matches them in a FillStore of
+    its own and keeps only the open fills, detached from it
+    orderfilled, pricelevel -> sequence or numpy array
+    orderid, execid, clorderid -> sequence, defaults to the row number / a fresh ExecID / the OrderID
+    transactiontime -> sequence of datetime or numpy datetime64, defaults to now
+    @returns FillStore holding the loaded rows
+    '''
+    if len(blotter.trades) or blotter.net_position or len(blotter.lots):
+        raise ValueError('Bulk load requires an empty Blotter')
+    if blotter.lots.name != 'fifo':
+        raise ValueError(f'Bulk loads match FIFO, add fills one at a time for the {blotter.lots.name} policy')
+    store = blotter.store
+    detached = store is None and not blotter.history
+    if store is None:
+        store = FillStore()
+        if not detached:
+            blotter.store = blotter.trades = store
+    n = len(orderfilled)
+    if len(pricelevel) != n:
+        raise ValueError('orderfilled and pricelevel must have the same length')
+    now = dt.datetime.now()
+
+    store.OrderID.extend(range(n) if orderid is None else _tolist(orderid))
+    store.ClOrderID.extend(store.OrderID if clorderid is None else _tolist(clorderid))
+    store.ExecID.extend(itertools.islice(_exec_ids, n) if execid is None else _tolist(execid))
+    store.ExchangeTicker.extend(itertools.repeat(blotter.ticker, n))
+    store.TransactionTime.extend(_micros(transactiontime, n, now))
+    _extend(store.PriceLevel, pricelevel)
+    _extend(store.OrderFilled, orderfilled)
+    store.OpenQuantity.extend(store.OrderFilled)
+    for column in (store.UnrealPnl, store.RealPnl, store.Booked, store.BookedPartial, store.BookedAt, store.BookedPartialAt):
+        column.frombytes(bytes(n * column.itemsize))
+    store.Offsets.extend(itertools.repeat(None, n))
+
+    matches = None if blotter.ledger is None else []
+    try:
+        if np is not None and _integral(store.OrderFilled):
+            open_rows = _match_vectorized(blotter, store, to_micros(now), matches)
+        else:
+            open_rows = _match(blotter, store, to_micros(now), matches)
+    except ValueError:
+        store.truncate(0)
+        raise
+    if matches:
+        blotter.ledger.extend_rows(store, *matches)
+
+    for row in open_rows:
+        fill = StoredFill(store, row)
+        if detached:
+            fill = _detach(fill)
+        blotter.positions.add(fill)
+        if fill.OrderFilled:
+            blotter.lots.add(fill)
+    blotter.total_pnl = blotter.realized_pnl + blotter.unrealized_pnl
+    return store
+
+
+def _detach(fill):
+    '''
+    copy an open StoredFill out of its store, the booked fills it was matched
+    against drop their Offsets as Blotter.update does with history=False
+    @returns Fill
+    '''
+    fill = copy.copy(fill)
+    offsets = []
+    for offset in fill.Offsets:
+        offset = copy.copy(offset)
+        offset.Offsets = []
+        offsets.append(offset)
+    fill.Offsets = offsets
+    return fill
+
+
+def _tolist(values):
+    return values.tolist() if hasattr(values, 'tolist') else list(values)
+
+
+def _extend(column, values):
+    if np is not None and isinstance(values, np.ndarray):
+        column.frombytes(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    else:
+        column.extend(map(float, values))
+
+
+def _micros(transactiontime, n, now):
+    if transactiontime is None:
+        return array('q', [to_micros(now)]) * n
+    if np is not None and isinstance(transactiontime, np.ndarray) \
+            and np.issubdtype(transactiontime.dtype, np.datetime64):
+        return array('q', transactiontime.astype('datetime64[us]').astype(np.int64).tobytes())
+    return (to_micros(now if t is None else t) for t in transactiontime)
+
+
+def _integral(column):
+    q = np.frombuffer(column, dtype=np.float64)
+    return bool(np.all(q == np.round(q)))
+
+
+def _match(blotter, store, now, matches=None):
+    '''
+    scalar FIFO pass over the store columns, mirrors Blotter.update
+    matches -> List, receives (resting rows, incoming rows, quantities, pnls) when given
+    @returns List of open rows
+    '''
+    qty, px, oq, real = store.OrderFilled, store.PriceLevel, store.OpenQuantity, store.RealPnl
+    booked, partial, booked_at, partial_at = store.Booked, store.BookedPartial, store.BookedAt, store.BookedPartialAt
+    offsets = store.Offsets
+    multiplier, tick_size, tick_value = blotter.contract_multiplier, blotter.tick_size, blotter.tick_value
+    ticks = blotter.ticks
+    net = blotter.net_position
+    if ticks:
+        # integer tick prices, realized accumulates in tick_value units
+        px = array('q', (to_ticks(x, tick_size) for x in px))
+        avg, realized = blotter.avg_open_ticks, blotter.realized_ticks
+    else:
+        avg, realized = blotter.avg_open_price, blotter.realized_pnl
+    queue = deque()
+    idle = []
+    opens, closes, quantities, pnls = [], [], [], []
+
+    for i in range(len(store)):
+        q = qty[i]
+        p = px[i]
+        if net and not q:
+            raise ValueError('Received Fill with 0 quantity')
+        closing = net and (net > 0) != (q > 0)
+        if closing:
+            while queue:
+                j = queue[0]
+                cq = oq[j]
+                tq = oq[i]
+                # the factors are applied in Blotter.update's order so the pnl is identical to the last bit
+                if ticks:
+                    units = calc_pnl(cq, px[j], tq, p) * multiplier
+                    pnl = units * tick_value
+                else:
+                    units = pnl = calc_pnl(cq, px[j], tq, p) * multiplier / tick_size * tick_value
+                realized += units
+                if matches is not None:
+                    opens.append(j)
+                    closes.append(i)
+                    quantities.append(cq if abs(cq) <= abs(tq) else -tq)
+                    pnls.append(pnl)
+                if offsets[i] is None:
+                    offsets[i] = []
+                if offsets[j] is None:
+                    offsets[j] = []
+                offsets[i].append(j)
+                offsets[j].append(i)
+                partial[i] = partial[j] = 1
+                partial_at[i] = partial_at[j] = now
+                if abs(cq) < abs(tq):
+                    oq[i] = tq + cq
+                    oq[j] = 0
+                    booked[j] = booked_at[j] = 1
+                    real[j] += pnl
+                    real[i] = 0
+                    queue.popleft()
+                else:
+                    oq[j] = cq + tq
+                    oq[i] = 0
+                    booked[i] = booked_at[i] = 1
+                    real[i] += pnl
+                    real[j] = 0
+                    if not oq[j]:
+                        booked[j] = 1
+                        queue.popleft()
+                    break
+            if abs(net) < abs(oq[i]):
+                avg = p
+        elif net:
+            avg = calc_avg_open_price(net, avg, q, p)
+        else:
+            avg = p
+        net += q
+        if not net:
+            avg = None
+        if not booked[i]:
+            if q:
+                queue.append(i)
+            else:
+                idle.append(i)
+
+    blotter.net_position = net
+    if ticks:
+        blotter.avg_open_ticks, blotter.realized_ticks = avg, realized
+        blotter.avg_open_price = None if avg is None else from_ticks(avg, tick_size)
+        blotter.realized_pnl = realized * tick_value
+    else:
+        blotter.avg_open_price, blotter.realized_pnl = avg, realized
+    if matches is not None:
+        matches.extend((opens, closes, quantities, pnls))
+    return sorted(idle + list(queue))
+
+
+def _match_vectorized(blotter, store, now, matches=None):
+    '''
+    FIFO matches the k-th unit bought with the k-th unit sold, so every booking
+    is a segment of the merged cumulative buy/sell quantities
+    matches -> List, receives (resting rows, incoming rows, quantities, pnls) when given
+    @returns List of open rows
+    '''
+    q = np.array(store.OrderFilled, dtype=np.float64)
+    p = np.array(store.PriceLevel, dtype=np.float64)
+    if blotter.ticks:
+        p = np.rint(p / blotter.tick_size).astype(np.int64)
+    n = len(q)
+    position = np.cumsum(q)
+    before = position - q
+    if np.any((before != 0) & (q == 0)):
+        raise ValueError('Received Fill with 0 quantity')
+
+    buys = np.flatnonzero(q > 0)
+    sells = np.flatnonzero(q < 0)
+    cum_buys = np.cumsum(q[buys])
+    cum_sells = np.cumsum(-q[sells])
+    matched = min(cum_buys[-1] if len(buys) else 0, cum_sells[-1] if len(sells) else 0)
+
+    oq = q.copy()
+    real = np.zeros(n)
+    booked = np.zeros(n, dtype=np.int8)
+    booked_at = np.zeros(n, dtype=np.int8)
+    partial = np.zeros(n, dtype=np.int8)
+    realized = blotter.realized_ticks if blotter.ticks else blotter.realized_pnl
+    if matched > 0:
+        hi = np.union1d(cum_buys[cum_buys <= matched], cum_sells[cum_sells <= matched])
+        m = np.diff(hi, prepend=0)
+        b = np.searchsorted(cum_buys, hi)
+        s = np.searchsorted(cum_sells, hi)
+        buy_rows, sell_rows = buys[b], sells[s]
+        buy_ends, sell_ends = cum_buys[b] == hi, cum_sells[s] == hi
+        # the earlier fill is the resting lot, events happen in arrival order of the later one
+        incoming_buy = buy_rows > sell_rows
+        order = np.argsort(np.maximum(buy_rows, sell_rows), kind='stable')
+        m, buy_rows, sell_rows = m[order], buy_rows[order], sell_rows[order]
+        buy_ends, sell_ends, incoming_buy = buy_ends[order], sell_ends[order], incoming_buy[order]
+        t = np.where(incoming_buy, buy_rows, sell_rows)
+        c = np.where(incoming_buy, sell_rows, buy_rows)
+        t_ends = np.where(incoming_buy, buy_ends, sell_ends)
+        c_ends = np.where(incoming_buy, sell_ends, buy_ends)
+
+        diff = np.where(incoming_buy, p[c] - p[t], p[t] - p[c])
+        if blotter.ticks:
+            # quantities are integral here, so the tick pnl sums exactly in int64
+            units = m.astype(np.int64) * diff * blotter.contract_multiplier
+            realized = realized + units.sum().item()
+            pnl = units * blotter.tick_value
+        else:
+            pnl = m * diff * blotter.contract_multiplier / blotter.tick_size * blotter.tick_value
+            realized = np.cumsum(np.concatenate(([realized], pnl)))[-1].item()
+        if matches is not None:
+            matches.extend((c.tolist(), t.tolist(), (np.sign(q[c]) * m).tolist(), pnl.tolist()))
+
+        filled = np.bincount(np.concatenate((buy_rows, sell_rows)), weights=np.concatenate((m, m)), minlength=n)
+        oq = np.sign(q) * (np.abs(q) - filled)
+        partial[filled > 0] = 1
+        booked[(filled > 0) & (oq == 0)] = 1
+        # _book goes to the resting lot only when it is strictly smaller than the incoming fill
+        receiver = np.where(c_ends & ~t_ends, c, t)
+        booked_at[receiver] = 1
+
+        events = np.arange(len(m))
+        rows = np.concatenate((c, t))
+        counterparts = np.concatenate((t, c))
+        by_row = np.lexsort((np.concatenate((events, events)), rows))
+        rows, counterparts = rows[by_row], counterparts[by_row]
+        events = np.concatenate((events, events))[by_row]
+        last = np.flatnonzero(np.append(rows[1:] != rows[:-1], True))
+        received = receiver[events[last]] == rows[last]
+        real[rows[last]] = np.where(received, pnl[events[last]], 0)
+        store.bulk_offsets = (np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=n)))), counterparts)
+        store.BookedPartialAt[:] = array('q', (partial.astype(np.int64) * now).tobytes())
+
+    store.OpenQuantity[:] = array('d', oq.tobytes())
+    store.RealPnl[:] = array('d', real.tobytes())
+    store.Booked[:] = array('b', booked.tobytes())
+    store.BookedAt[:] = array('b', booked_at.tobytes())
+    store.BookedPartial[:] = array('b', partial.tobytes())
+
+    blotter.net_position = position[-1].item() if n else blotter.net_position
+    if blotter.ticks:
+        avg = _avg_open_price(q, p, before, position, blotter.avg_open_ticks)
+        blotter.avg_open_ticks, blotter.realized_ticks = avg, realized
+        blotter.avg_open_price = None if avg is None else from_ticks(avg, blotter.tick_size)
+        blotter.realized_pnl = realized * blotter.tick_value
+    else:
+        blotter.realized_pnl = realized
+        blotter.avg_open_price = _avg_open_price(q, p, before, position, blotter.avg_open_price)
+    return np.flatnonzero(booked == 0).tolist()
+
+
+def _avg_open_price(q, p, before, position, avg):
+    '''
+    replay Blotter.update's average price from the last point it was reset
+    '''
+    if not len(q):
+        return avg
+    remaining = np.where(np.abs(q) > np.abs(before), q + before, 0)
+    closing = (before != 0) & (np.sign(before) != np.sign(q))
+    resets = np.flatnonzero((before == 0) | (closing & (np.abs(before) < np.abs(remaining))) | (position == 0))
+    start = resets[-1]
+    avg = None if position[start] == 0 else p[start].item()
+    opening = start + 1 + np.flatnonzero(~closing[start + 1:])
+    for net, qty, px in zip(before[opening].tolist(), q[opening].tolist(), p[opening].tolist()):
+        avg = calc_avg_open_price(net, avg, qty, px)
+    return avg
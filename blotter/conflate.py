@@ -0,0 +1,89 @@
+import time
+
+from .log import Logger, LOGGING_ENABLED
+
+
+class Conflator:
+    '''
+    keeps only the latest price per ticker in front of a Portfolio and reprices
+    on an interval or on demand, superseded ticks are counted as dropped
+
+    the interval is only checked when a tick arrives, so once a burst ends
+    its last prices wait for the next tick; call poll from a timer (e.g.
+    loop.call_later or a feed's idle callback) to apply them after a quiet interval
+    Example:
+        conflator = Conflator(portfolio, interval=0.25)
+        conflator.update_from_marketdata('ZSN19', 9.0025)
+        conflator.poll()
+        conflator.flush()
+    '''
+    def __init__(self, portfolio, interval=None, clock=time.monotonic):
+        '''
+        portfolio -> Portfolio
+        interval -> seconds between automatic flushes, None flushes only on demand
+        clock -> callable returning seconds
+        '''
+        self.portfolio = portfolio
+        self.interval = interval
+        self.clock = clock
+        self.pending = {}
+        self.last_flush = clock()
+        #
+        self.received = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.logger = Logger(self.__class__.__name__)
+
+    def __len__(self):
+        return len(self.pending)
+
+    def __str__(self):
+        return f'>{self.__class__.__name__.upper()}|' + \
+               f'{self.received}|' + \
+               f'{self.dropped}|' + \
+               f'{len(self.pending)}|' + \
+               f'{self.flushes}|'
+
+    def __repr__(self):
+        return self.__str__()
+
+    def update_from_marketdata(self, ticker, last_price):
+        '''
+        ticker -> str
+        last_price -> float
+        @returns Conflator
+        '''
+        self.received += 1
+        if ticker in self.pending:
+            self.dropped += 1
+        self.pending[ticker] = last_price
+        if self.interval is not None and self.clock() - self.last_flush >= self.interval:
+            self.flush()
+        return self
+
+    def update(self, ticker, last_price):
+        return self.update_from_marketdata(ticker, last_price)
+
+    def poll(self):
+        '''
+        flush when prices are pending and the interval has passed since the last flush
+        @returns int number of tickers repriced
+        '''
+        if self.pending and self.interval is not None and self.clock() - self.last_flush >= self.interval:
+            return self.flush()
+        return 0
+
+    def flush(self):
+        '''
+        mark the portfolio at the latest pending price of every ticker
+        @returns int number of tickers repriced
+        '''
+        self.last_flush = self.clock()
+        if not self.pending:
+            return 0
+        pending, self.pending = self.pending, {}
+        self.portfolio.mark(pending)
+        self.flushes += 1
+        if LOGGING_ENABLED:
+            self.logger.debug(f'FLUSHED {len(pending)} {self}')
+        return len(pending)
@@ -0,0 +1,206 @@
+import time
+import collections
+
+from .log import Logger, LOGGING_ENABLED
+
+FillApplied = collections.namedtuple('FillApplied', ('ticker', 'exec_id', 'order_id', 'quantity', 'price',
+                                                     'net_position', 'avg_open_price', 'realized_pnl'))
+# a fill matched against the other side, open_quantity is what is left of it
+LotBooked = collections.namedtuple('LotBooked', ('ticker', 'exec_id', 'order_id', 'open_quantity', 'real_pnl'))
+LotBookedPartial = collections.namedtuple('LotBookedPartial', LotBooked._fields)
+PositionFlat = collections.namedtuple('PositionFlat', ('ticker', 'exec_id', 'previous', 'realized_pnl'))
+PositionFlip = collections.namedtuple('PositionFlip', ('ticker', 'exec_id', 'previous', 'net_position'))
+# total_pnl crossed threshold, above is the side it is on now
+PnlThreshold = collections.namedtuple('PnlThreshold', ('ticker', 'threshold', 'total_pnl', 'above'))
+
+EVENTS = (FillApplied, LotBooked, LotBookedPartial, PositionFlat, PositionFlip, PnlThreshold)
+
+
+class Subscription:
+    '''
+    a callback receiving the events it asked for as lists, a batch is
+    delivered once size events are pending or interval seconds have passed
+    since the last one, both checked after each update or mark
+    '''
+    def __init__(self, callback, kinds=None, size=1024, interval=None, thresholds=(), clock=time.monotonic):
+        '''
+        callback -> callable taking a List of events
+        kinds -> event types delivered (e.g. (LotBooked, PositionFlat)), None for all
+        size -> pending events that trigger a delivery, 1 delivers after every update
+        interval -> seconds between deliveries, None waits for size or flush
+        thresholds -> total_pnl levels reported by PnlThreshold when a ticker crosses them
+        clock -> callable returning seconds
+        '''
+        if size < 1:
+            raise ValueError(f'Subscription needs size >= 1, got {size}')
+        self.callback = callback
+        self.kinds = None if kinds is None else frozenset(kinds)
+        self.size = size
+        self.interval = interval
+        self.thresholds = tuple(sorted(thresholds))
+        self.clock = clock
+        self.pending = []
+        self.last_flush = clock()
+        self.logger = Logger(self.__class__.__name__)
+        #
+        self.delivered = 0
+        self.batches = 0
+        self.errors = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def __str__(self):
+        return f'>{self.__class__.__name__.upper()}|' + \
+               f'{self.delivered}|' + \
+               f'{self.batches}|' + \
+               f'{len(self.pending)}|' + \
+               f'{self.errors}|'
+
+    def __repr__(self):
+        return self.__str__()
+
+    def wants(self, kind):
+        return self.kinds is None or kind in self.kinds
+
+    def due(self):
+        if len(self.pending) >= self.size:
+            return True
+        return self.interval is not None and bool(self.pending) and self.clock() - self.last_flush >= self.interval
+
+    def flush(self):
+        '''
+        deliver the pending events, a callback that raises loses its batch
+        but never unwinds the update that triggered the delivery
+        @returns int number of events delivered
+        '''
+        self.last_flush = self.clock()
+        if not self.pending:
+            return 0
+        batch, self.pending = self.pending, []
+        try:
+            self.callback(batch)
+        except Exception as e:
+            self.errors += 1
+            if LOGGING_ENABLED:
+                self.logger.error(f'Dropped {len(batch)} events, callback raised {e!r}')
+            return 0
+        self.batches += 1
+        self.delivered += len(batch)
+        return len(batch)
+
+
+class EventBus:
+    '''
+    typed change events of one or more Blotters, buffered per Subscription
+    and handed over in batches so a burst of fills costs a few callbacks,
+    events nobody subscribed to are never built
+    Example:
+        blotter = Blotter('ZCN19')
+        blotter.subscribe(hedger.on_events, kinds=(PositionFlat, PositionFlip), size=1)
+        blotter.subscribe(ui.on_events, interval=0.25, thresholds=(-5000, 5000))
+        portfolio.subscribe(risk.on_events, size=10000)
+    '''
+    def __init__(self):
+        self.subscriptions = []
+        self.totals = {}    # ticker -> total_pnl at the last threshold check
+        self.kinds = set()
+        self.watching = []  # subscriptions with thresholds
+        self.logger = Logger(self.__class__.__name__)
+
+    def __len__(self):
+        return len(self.subscriptions)
+
+    def __str__(self):
+        return f'>{self.__class__.__name__.upper()}|' + \
+               f'{len(self.subscriptions)}|' + \
+               f'{sum(len(s) for s in self.subscriptions)}|'
+
+    def __repr__(self):
+        return self.__str__()
+
+    def subscribe(self, callback, **kwargs):
+        '''
+        callback -> callable taking a List of events
+        kwargs -> see Subscription
+        @returns Subscription
+        '''
+        subscription = Subscription(callback, **kwargs)
+        self.subscriptions.append(subscription)
+        self.index()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        '''
+        deliver what is pending and stop the subscription
+        '''
+        subscription.flush()
+        self.subscriptions.remove(subscription)
+        self.index()
+
+    def index(self):
+        kinds = set()
+        for s in self.subscriptions:
+            kinds.update(EVENTS if s.kinds is None else s.kinds)
+        self.kinds = kinds
+        self.watching = [s for s in self.subscriptions if s.thresholds and s.wants(PnlThreshold)]
+
+    def emit(self, event):
+        kind = type(event)
+        for s in self.subscriptions:
+            if s.kinds is None or kind in s.kinds:
+                s.pending.append(event)
+
+    def booked(self, blotter, fill):
+        '''
+        fill -> Fill just matched, fully or partially
+        '''
+        kind = LotBooked if fill.Booked else LotBookedPartial
+        if kind in self.kinds:
+            self.emit(kind(blotter.ticker, fill.ExecID, fill.OrderID, fill.OpenQuantity, fill.RealPnl))
+
+    def applied(self, blotter, fill):
+        '''
+        after Blotter.update
+        fill -> Fill applied
+        '''
+        kinds = self.kinds
+        if FillApplied in kinds:
+            self.emit(FillApplied(blotter.ticker, fill.ExecID, fill.OrderID, fill.OrderFilled, fill.PriceLevel,
+                                  blotter.net_position, blotter.avg_open_price, blotter.realized_pnl))
+        position = blotter.net_position
+        previous = position - fill.OrderFilled
+        if not position:
+            if previous and PositionFlat in kinds:
+                self.emit(PositionFlat(blotter.ticker, fill.ExecID, previous, blotter.realized_pnl))
+        elif previous and (previous > 0) != (position > 0) and PositionFlip in kinds:
+            self.emit(PositionFlip(blotter.ticker, fill.ExecID, previous, position))
+        self.marked(blotter)
+
+    def marked(self, blotter):
+        '''
+        after the blotter's pnl changed, report thresholds crossed and deliver due batches
+        '''
+        if self.watching:
+            total = blotter.total_pnl
+            before = self.totals.get(blotter.ticker, 0)
+            self.totals[blotter.ticker] = total
+            if total != before:
+                low, high = (before, total) if before < total else (total, before)
+                for s in self.watching:
+                    for threshold in s.thresholds:
+                        if low < threshold <= high:
+                            s.pending.append(PnlThreshold(blotter.ticker, threshold, total, total >= threshold))
+        for s in self.subscriptions:
+            if s.pending and s.due():
+                s.flush()
+
+    def flush(self):
+        '''
+        deliver everything pending, e.g. from a timer or at the end of a session
+        @returns int number of events delivered
+        '''
+        n = sum(s.flush() for s in self.subscriptions)
+        if LOGGING_ENABLED and n:
+            self.logger.debug(f'FLUSHED {n} {self}')
+        return n
@@ -0,0 +1,155 @@
+import csv
+import struct
+import operator
+
+from .store import FillStore, to_micros
+from .journal import from_micros
+
+# (name, kind), kinds are U for ids and tickers, f8, M8[us] and ?
+FILLS = (('OrderID', 'U'), ('ClOrderID', 'U'), ('ExecID', 'U'), ('ExchangeTicker', 'U'),
+         ('TransactionTime', 'M8[us]'), ('PriceLevel', 'f8'), ('OrderFilled', 'f8'),
+         ('OpenQuantity', 'f8'), ('RealPnl', 'f8'), ('UnrealPnl', 'f8'),
+         ('Booked', '?'), ('BookedPartial', '?'))
+
+MATCHES = (('ExchangeTicker', 'U'), ('OpenExecID', 'U'), ('CloseExecID', 'U'), ('OpenOrderID', 'U'),
+           ('CloseOrderID', 'U'), ('Quantity', 'f8'), ('OpenPrice', 'f8'), ('ClosePrice', 'f8'),
+           ('RealPnl', 'f8'), ('TransactionTime', 'M8[us]'))
+
+# rows formatted and written per chunk
+CHUNK = 4096
+NAT = -2**63
+MAGIC = b'\x93NUMPY\x01\x00'
+# digits reserved in the .npy header for the row count written when the stream ends
+SHAPE_DIGITS = 20
+
+
+def chunks(rows, names, chunk=CHUNK):
+    '''
+    rows -> Iterable of Fill or Match, or a FillStore read a column slice at a time
+    @returns Generator of Tuples of columns in names order, a FillStore gives its
+             stored values (integer microseconds for times, 0 or 1 for flags)
+    '''
+    if isinstance(rows, FillStore):
+        columns = [getattr(rows, name) for name in names]
+        for start in range(0, len(rows), chunk):
+            yield tuple(c[start:start + chunk] for c in columns)
+        return
+    get = operator.attrgetter(*names)
+    if len(names) == 1:
+        get = lambda row, get=get: (get(row),)
+    batch = []
+    for row in rows:
+        batch.append(get(row))
+        if len(batch) == chunk:
+            yield tuple(zip(*batch))
+            batch = []
+    if batch:
+        yield tuple(zip(*batch))
+
+
+def csv_column(kind, stored):
+    '''
+    @returns callable converting a column to the values written, None writes it as is
+    '''
+    if kind == 'f8':
+        return lambda column: map(float, column)
+    if stored and kind == 'M8[us]':
+        return lambda column: map(from_micros, column)
+    if kind == '?':
+        # stored flags are 0 or 1 and open positions count partial bookings, one spelling for all
+        return lambda column: map(bool, column)
+
+
+def write_csv(f, rows, schema=FILLS, chunk=CHUNK):
+    '''
+    f -> text file
+    rows -> Iterable of Fill or Match, or a FillStore, read once
+    schema -> FILLS or MATCHES
+    @returns int number of rows written
+    '''
+    names = [name for name, _ in schema]
+    writer = csv.writer(f)
+    writer.writerow(names)
+    stored = isinstance(rows, FillStore)
+    converters = [csv_column(kind, stored) for _, kind in schema]
+    n = 0
+    for columns in chunks(rows, names, chunk):
+        writer.writerows(zip(*(c if convert is None else convert(c) for convert, c in zip(converters, columns))))
+        n += len(columns[0])
+    return n
+
+
+def npy_header(schema, n, width):
+    descr = [(name, f'<U{width}' if kind == 'U' else '|b1' if kind == '?' else f'<{kind}')
+             for name, kind in schema]
+    shape = f'({n},)'.ljust(SHAPE_DIGITS + 2)
+    header = f"{{'descr': {descr!r}, 'fortran_order': False, 'shape': {shape}, }}"
+    # magic, version and header length take 10 bytes, the whole header is padded to 64
+    header += ' ' * (-(10 + len(header) + 1) % 64) + '\n'
+    return MAGIC + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+def npy_column(name, kind, width, stored):
+    '''
+    @returns struct code of the field and a callable converting a column for it, None packs it as is
+    '''
+    if kind == 'U':
+        def convert(column):
+            text = ['' if v is None else str(v) for v in column]
+            longest = max(text, key=len)
+            if len(longest) > width:
+                raise ValueError(f'{name} {longest!r} is longer than the export width {width}')
+            return [t.encode('utf-32-le') for t in text]
+        return f'{4 * width}s', convert
+    if kind == 'M8[us]':
+        if stored:
+            return 'q', lambda column: [v or NAT for v in column]
+        return 'q', lambda column: [NAT if v is None else to_micros(v) for v in column]
+    if kind == '?':
+        return '?', None
+    return 'd', None
+
+
+def write_npy(f, rows, schema=FILLS, chunk=CHUNK, width=32):
+    '''
+    a structured .npy, np.load(path) reads it back as one record per row
+    f -> seekable binary file, the row count is written into the header when the rows run out
+    rows -> Iterable of Fill or Match, or a FillStore, read once
+    width -> characters kept for ids and tickers, longer values raise ValueError
+    @returns int number of rows written
+    '''
+    stored = isinstance(rows, FillStore)
+    codes, converters = zip(*(npy_column(name, kind, width, stored) for name, kind in schema))
+    pack = struct.Struct('<' + ''.join(codes)).pack
+    start = f.tell()
+    f.write(npy_header(schema, 0, width))
+    n = 0
+    for columns in chunks(rows, [name for name, _ in schema], chunk):
+        columns = [c if convert is None else convert(c) for convert, c in zip(converters, columns)]
+        f.write(b''.join(map(pack, *columns)))
+        n += len(columns[0])
+    end = f.tell()
+    f.seek(start)
+    f.write(npy_header(schema, n, width))
+    f.seek(end)
+    return n
+
+
+WRITERS = {'csv': write_csv, 'npy': write_npy}
+
+
+def export(target, rows, fmt='csv', schema=FILLS, **kwargs):
+    '''
+    target -> path or open file, text for csv and binary for npy
+    rows -> Iterable of Fill or Match, or a FillStore
+    fmt -> csv or npy
+    @returns int number of rows written
+    '''
+    try:
+        writer = WRITERS[fmt]
+    except KeyError:
+        raise ValueError(f'Unknown export format {fmt!r}, expected one of {sorted(WRITERS)}') from None
+    if isinstance(target, (str, bytes)) or hasattr(target, '__fspath__'):
+        with open(target, 'w', newline='') if fmt == 'csv' else open(target, 'wb') as f:
+            return writer(f, rows, schema, **kwargs)
+    return writer(target, rows, schema, **kwargs)
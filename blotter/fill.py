@@ -1,8 +1,53 @@
+import time
 import random
+import collections
+import logging
+import itertools
 import datetime as dt
 
 from .directions import DIRECTIONS
-from .log import Logger, LOGGING_ENABLED
+from .log import Logger, LOGGING_ENABLED, register_event
+
+FIELDS = ('OrderID', 'ClOrderID', 'ExecID', 'PriceLevel', 'OrderFilled', 'ExchangeTicker', 'TransactionTime')
+
+STATE = ('Booked', 'BookedAt', 'BookedPartial', 'BookedPartialAt', 'OpenQuantity', 'Offsets', 'UnrealPnl', 'RealPnl')
+
+# default ExecIDs count up from the clock in microseconds, so a restarted process does not
+# reuse the ids of the fills it restores, a journal restore also moves them past those (seed_exec_ids)
+_exec_ids = itertools.count(time.time_ns() // 1000)
+
+
+def seed_exec_ids(exec_id):
+    '''
+    make the default ExecIDs larger than exec_id, other kinds of id are ignored
+    '''
+    if not isinstance(exec_id, int):
+        return
+    gap = exec_id - next(_exec_ids)
+    if gap >= 0:
+        collections.deque(itertools.islice(_exec_ids, gap + 1), maxlen=0)
+
+
+def format_fill(fields):
+    '''
+    fields -> BaseFill.fields
+    @returns str
+    '''
+    orderid, orderfilled, open_quantity, ticker, pricelevel, pnl, transactiontime = fields
+    direction = 'BUY' if orderfilled > 0 else 'SELL'
+    return f'>{Fill.__name__.upper()}|' + \
+           f"#{orderid}|" + \
+           f"{direction}|" + \
+           f'{open_quantity}/{orderfilled}|' + \
+           f'{ticker}|' + \
+           f'{pricelevel}|' + \
+           f'{round(pnl, 2)}|' + \
+           f'{transactiontime}|'
+
+
+register_event('FILL', format_fill)
+register_event('BOOKED', lambda fields: '\tBOOKED ' + format_fill(fields))
+register_event('BOOKED PARTIAL', lambda fields: '\tBOOKED PARTIAL ' + format_fill(fields))
 
 class _Fill:
     def __init__(self, orderid, ticker, pricelevel, orderfilled, **kwargs):
@@ -21,29 +66,12 @@ class _Fill:
         return '|'.join([a for a in dir(self) if a[0].isupper()])
 
 
-class Fill:
-    def __init__(self, fill):
-        self.OrderID = fill.OrderID
-        self.ClOrderID = fill.ClOrderID
-        self.ExecID = fill.ExecID
-        self.PriceLevel = fill.PriceLevel
-        self.OrderFilled = fill.OrderFilled
-        self.ExchangeTicker = fill.ExchangeTicker
-        self.TransactionTime = fill.TransactionTime
-        #
-        self.Booked = False
-        self.BookedAt = None
-        self.BookedPartial = False
-        self.BookedPartialAt = None
-        self.OpenQuantity = self.OrderFilled
-        self.Offsets = []
-        self.UnrealPnl = 0
-        self.RealPnl = 0
-        self.logger = Logger(self.__class__.__name__)
-
-    @staticmethod
-    def create_from_attrs(*args, **kwargs):
-        return Fill(_Fill(*args, **kwargs))
+class BaseFill:
+    '''
+    booking behaviour shared by Fill and store backed fills
+    '''
+    __slots__ = ()
+    logger = Logger('Fill')
 
     @property
     def headers(self):
@@ -56,35 +84,37 @@ class Fill:
     @property
     def Direction(self):
         if not self.OrderFilled:
-            raise ValueError(f'Received {__class__.__name__} with 0 quantity')
+            raise ValueError(f'Received {Fill.__name__} with 0 quantity')
         return DIRECTIONS.LONG if self.OrderFilled > 0 else DIRECTIONS.SHORT
 
+    @property
+    def fields(self):
+        '''
+        @returns Tuple of the values shown by repr, for deferred log formatting
+        '''
+        return (self.OrderID, self.OrderFilled, self.OpenQuantity, self.ExchangeTicker,
+                self.PriceLevel, self.UnrealPnl + self.RealPnl, self.TransactionTime)
+
     def __repr__(self):
-        direction = 'BUY' if self.Direction.name == DIRECTIONS.LONG.name else 'SELL'
-        return f'>{__class__.__name__.upper()}|' + \
-               f"#{self.OrderID}|" + \
-               f"{direction}|" + \
-               f'{self.OpenQuantity}/{self.OrderFilled}|' + \
-               f'{self.ExchangeTicker}|' + \
-               f'{self.PriceLevel}|' + \
-               f'{round(self.TotalPnl, 2)}|' + \
-               f'{self.TransactionTime}|'
+        self.Direction  # raises on a 0 quantity fill
+        return format_fill(self.fields)
 
     def book(self, pnl, offset):
+        at = dt.datetime.now()
         if self.OpenQuantity == offset.OpenQuantity:
-            self._book(pnl, offset)
-            offset._book(pnl, self)
+            self._book(pnl, offset, at)
+            offset._book(pnl, self, at)
         elif abs(self.OpenQuantity) - abs(offset.OpenQuantity)  < 0:
-            offset._book_partial(pnl, self)
-            self._book(pnl, offset)
+            offset._book_partial(pnl, self, at)
+            self._book(pnl, offset, at)
         else:
-            self._book_partial(pnl, offset)
-            offset._book(pnl, self)
+            self._book_partial(pnl, offset, at)
+            offset._book(pnl, self, at)
 
-    def _book_partial(self, pnl, offset):
+    def _book_partial(self, pnl, offset, at=None):
         self.Offsets.append(offset)
         self.BookedPartial = True
-        self.BookedPartialAt = dt.datetime.now()
+        self.BookedPartialAt = at or dt.datetime.now()
 
         if abs(offset.OpenQuantity) > abs(self.OpenQuantity): # !!!!!!!
             if LOGGING_ENABLED:
@@ -93,23 +123,80 @@ class Fill:
         else:
             self.OpenQuantity += offset.OpenQuantity
         self.RealPnl += pnl
-        
+
         if self.OpenQuantity == 0: # !!!!!!!
             if LOGGING_ENABLED:
                 self.logger.warn('Warning: Partial Booking OpenQuantity Reset ')
             self.Booked = True
 
         if LOGGING_ENABLED:
-            self.logger.debug(f'\tBOOKED PARTIAL {self}')
+            self.logger.event('BOOKED PARTIAL', self.fields, logging.DEBUG)
 
-    def _book(self, pnl, offset):
+    def _book(self, pnl, offset, at=None):
         self.Offsets.append(offset)
         self.Booked = True
         self.BookedAt = self.BookedPartial = True
-        self.BookedPartialAt = dt.datetime.now()
+        self.BookedPartialAt = at or dt.datetime.now()
         self.OpenQuantity = 0
         self.RealPnl += pnl
         offset.RealPnl = 0
         if LOGGING_ENABLED:
-            self.logger.debug(f'\tBOOKED {self}')
+            self.logger.event('BOOKED', self.fields, logging.DEBUG)
+
 
+class Fill(BaseFill):
+    __slots__ = FIELDS + STATE
+
+    def __init__(self, fill):
+        self.OrderID = fill.OrderID
+        self.ClOrderID = fill.ClOrderID
+        self.ExecID = fill.ExecID
+        self.PriceLevel = fill.PriceLevel
+        self.OrderFilled = fill.OrderFilled
+        self.ExchangeTicker = fill.ExchangeTicker
+        self.TransactionTime = fill.TransactionTime
+        #
+        self.Booked = False
+        self.BookedAt = None
+        self.BookedPartial = False
+        self.BookedPartialAt = None
+        self.OpenQuantity = self.OrderFilled
+        self.Offsets = []
+        self.UnrealPnl = 0
+        self.RealPnl = 0
+
+    @classmethod
+    def create(cls, orderid, ticker, pricelevel, orderfilled,
+               ClOrderID=None, ExecID=None, TransactionTime=None):
+        '''
+        build a Fill directly from its attributes
+        @returns Fill
+        '''
+        self = cls.__new__(cls)
+        self.OrderID = orderid
+        self.ClOrderID = orderid if ClOrderID is None else ClOrderID
+        self.ExecID = next(_exec_ids) if ExecID is None else ExecID
+        self.ExchangeTicker = ticker
+        self.PriceLevel = float(pricelevel)
+        self.OrderFilled = self.OpenQuantity = float(orderfilled)
+        self.TransactionTime = dt.datetime.now() if TransactionTime is None else TransactionTime
+        #
+        self.Booked = False
+        self.BookedAt = None
+        self.BookedPartial = False
+        self.BookedPartialAt = None
+        self.Offsets = []
+        self.UnrealPnl = 0
+        self.RealPnl = 0
+        return self
+
+    @staticmethod
+    def create_from_attrs(*args, **kwargs):
+        attrs = {k: v for k,v in kwargs.items() if k in ('ClOrderID', 'ExecID', 'TransactionTime')}
+        return Fill.create(*args, **attrs)
+
+    def __copy__(self):
+        fill = Fill.__new__(Fill)
+        for name in Fill.__slots__:
+            setattr(fill, name, getattr(self, name))
+        return fill
@@ -1,7 +1,5 @@
-import re
-
 from .fill import Fill, _Fill
-from .blot import Blotter
+from .portfolio import Portfolio, DEFAULTS
 
 
 def validate_float(string, default=None):
@@ -9,10 +7,10 @@ def validate_float(string, default=None):
         return default
     return float(string)
 
-def consume():
-    blotters = {}
+def consume(contracts=None):
+    portfolio = Portfolio(dict(contracts or {}))
 
-    defaults = {'contract_multiplier': 1, 'tick_value': 12.5, 'tick_size': 0.0025}
+    defaults = DEFAULTS
     buys = ['B', 'b', 'buy', 'Buy', 'BUY']
     sells = ['S', 's', 'sell', 'Sell', 'SELL']
     actions = buys + sells
@@ -22,7 +20,7 @@ def consume():
 
     while True:
         string = input('> ') 
-        tokens = re.split('\s+', string.strip('\n'))
+        tokens = string.split()
 
         if not tokens:
             continue
@@ -37,22 +35,25 @@ def consume():
 
             print(order_id, ticker, price, quantity)
             f = Fill.create_from_attrs(order_id, ticker, price, quantity)
-            if not blotters.get(f.ExchangeTicker):
+            if f.ExchangeTicker not in portfolio:
                 print(f'> New {f.ExchangeTicker} Blotter ') 
-                kwargs = defaults.copy()
-                for k,v in defaults.items():
-                    tokens = validate_float(input(f"> Enter {k.upper().replace('_',' ')} ({v}): "), 
-                                            default=v)
-                    kwargs[k] = tokens
-                blotters[f.ExchangeTicker] = Blotter(f.ExchangeTicker, **kwargs)
-            blotter = blotters.get(f.ExchangeTicker)
-            blotter.add_fill(f)
-
-        elif tokens[0] in blotters.keys():
+                if f.ExchangeTicker not in portfolio.contracts:
+                    kwargs = defaults.copy()
+                    for k,v in defaults.items():
+                        tokens = validate_float(input(f"> Enter {k.upper().replace('_',' ')} ({v}): "), 
+                                                default=v)
+                        kwargs[k] = tokens
+                    portfolio.contracts[f.ExchangeTicker] = kwargs
+            portfolio.add_fill(f)
+
+        elif tokens[0] in portfolio:
             ticker = tokens[0]
-            blotter = blotters.get(ticker)
+            blotter = portfolio[ticker]
             print(blotter)
 
+        elif tokens[0] in ('P', 'p', 'portfolio', 'PORTFOLIO'):
+            print(portfolio)
+
         else:
             print('Unrecognized input.')
 
@@ -0,0 +1,348 @@
+import os
+import mmap
+import math
+import struct
+import numbers
+import datetime as dt
+
+from .fill import Fill, seed_exec_ids
+from .store import EPOCH, to_micros
+from .log import Logger, LOGGING_ENABLED
+
+MAGIC = b'BLTS'
+VERSION = 1
+
+# record length, PriceLevel, OrderFilled, TransactionTime then OrderID, ClOrderID, ExecID, ExchangeTicker
+RECORD = struct.Struct('<Iddq')
+VALUE = struct.Struct('<cH')
+MIN_RECORD = RECORD.size + 4 * VALUE.size
+# magic, version, journal offset, number of blotters
+HEADER = struct.Struct('<4sHQI')
+# net_position, avg_open_price, realized_pnl, unrealized_pnl, total_pnl, open fills, lots,
+# then realized_ticks and avg_open_ticks so ticks mode restores its exact tick totals
+STATE = struct.Struct('<dddddIIdd')
+# OpenQuantity, RealPnl, UnrealPnl, BookedPartial, BookedPartialAt
+LOT = struct.Struct('<dddBq')
+INDEX = struct.Struct('<I')
+
+
+def pack_value(value):
+    if value is None:
+        tag, data = b'n', b''
+    elif isinstance(value, numbers.Integral):
+        tag, data = b'i', str(int(value)).encode()
+    elif isinstance(value, numbers.Real):
+        tag, data = b'f', repr(float(value)).encode()
+    else:
+        tag, data = b's', str(value).encode()
+    return VALUE.pack(tag, len(data)) + data
+
+
+def unpack_value(buf, offset):
+    tag, size = VALUE.unpack_from(buf, offset)
+    offset += VALUE.size
+    data = bytes(buf[offset:offset + size])
+    offset += size
+    if tag == b'n':
+        return None, offset
+    if tag == b'i':
+        return int(data), offset
+    if tag == b'f':
+        return float(data), offset
+    return data.decode(), offset
+
+
+def from_micros(value):
+    if value:
+        return EPOCH + dt.timedelta(microseconds=value)
+
+
+def pack_fill(fill):
+    '''
+    fill -> Fill
+    @returns bytes
+    '''
+    body = pack_value(fill.OrderID) + pack_value(fill.ClOrderID) + \
+           pack_value(fill.ExecID) + pack_value(fill.ExchangeTicker)
+    return RECORD.pack(RECORD.size + len(body), fill.PriceLevel, fill.OrderFilled,
+                       to_micros(fill.TransactionTime)) + body
+
+
+def unpack_fill(buf, offset):
+    '''
+    @returns Tuple of (Fill, offset of the next record)
+    '''
+    size, pricelevel, orderfilled, transactiontime = RECORD.unpack_from(buf, offset)
+    end = offset + size
+    offset += RECORD.size
+    orderid, offset = unpack_value(buf, offset)
+    clorderid, offset = unpack_value(buf, offset)
+    execid, offset = unpack_value(buf, offset)
+    ticker, offset = unpack_value(buf, offset)
+    if offset != end:
+        raise ValueError(f'Journal record of {size} bytes holds {offset - end + size} bytes of fields')
+    fill = Fill.create(orderid, ticker, pricelevel, orderfilled, ClOrderID=clorderid,
+                       ExecID=execid, TransactionTime=from_micros(transactiontime))
+    return fill, end
+
+
+class Journal:
+    '''
+    append-only binary log of every fill added to its Blotter or Portfolio,
+    with periodic snapshots of the open lots and totals so a restart only
+    replays the fills journaled after the latest snapshot
+    Example:
+        journal = Journal('fills.journal', snapshot_every=10000)
+        portfolio = journal.restore(Portfolio(contracts, journal=journal))
+        portfolio.add_fill(fill)
+    '''
+    def __init__(self, path, snapshot_every=None, sync=False):
+        '''
+        path -> journal file, the snapshot is written next to it as path + '.snapshot'
+        snapshot_every -> snapshot the target every N journaled fills
+        sync -> fsync on every flush
+        '''
+        self.path = path
+        self.snapshot_path = path + '.snapshot'
+        self.snapshot_every = snapshot_every
+        self.sync = sync
+        self.target = None
+        self.recovering = False
+        self.count = 0
+        self.file = None
+        self.logger = Logger(self.__class__.__name__)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open(self):
+        if self.file is None:
+            self.file = open(self.path, 'ab')
+        return self.file
+
+    def append(self, fill):
+        '''
+        fill -> Fill, called by Blotter.update once the fill is booked
+        '''
+        if self.recovering:
+            return
+        (self.file or self.open()).write(pack_fill(fill))
+        self.count += 1
+        if self.snapshot_every and not self.count % self.snapshot_every and self.target is not None:
+            self.snapshot()
+
+    def extend(self, fills):
+        '''
+        fills -> iterable of Fill
+        '''
+        if self.recovering:
+            return
+        before = self.count
+        write = self.open().write
+        for fill in fills:
+            write(pack_fill(fill))
+            self.count += 1
+        every = self.snapshot_every
+        if every and self.count // every > before // every and self.target is not None:
+            self.snapshot()
+
+    def flush(self):
+        '''
+        @returns int size of the journal in bytes
+        '''
+        f = self.open()
+        f.flush()
+        if self.sync:
+            os.fsync(f.fileno())
+        return f.tell()
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    def read(self, offset=0):
+        '''
+        offset -> byte offset of the first record
+        @returns Generator of Fill, stops at a torn trailing record
+        '''
+        for fill, _ in self.records(offset):
+            yield fill
+
+    def records(self, offset=0):
+        '''
+        @returns Generator of (Fill, offset of the next record)
+        '''
+        if not os.path.exists(self.path) or os.path.getsize(self.path) <= offset:
+            return
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            end = len(buf)
+            while offset + RECORD.size <= end:
+                size = INDEX.unpack_from(buf, offset)[0]
+                if size < MIN_RECORD or offset + size > end:
+                    break
+                try:
+                    fill, offset = unpack_fill(buf, offset)
+                except (ValueError, UnicodeDecodeError, struct.error):
+                    break # a record whose fields do not fill its length is torn too
+                yield fill, offset
+
+    def snapshot(self, target=None):
+        '''
+        write the open lots and totals of a Blotter or every Blotter of a Portfolio
+        target -> Blotter or Portfolio, defaults to the one the journal is attached to
+        @returns int journal offset the snapshot covers
+        '''
+        target = self.target if target is None else target
+        offset = self.flush()
+        blotters = list(blotters_of(target))
+        chunks = [HEADER.pack(MAGIC, VERSION, offset, len(blotters))]
+        for blotter in blotters:
+            chunks.append(pack_blotter(blotter))
+        tmp = self.snapshot_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(b''.join(chunks))
+            if self.sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        if LOGGING_ENABLED:
+            self.logger.info(f'SNAPSHOT {len(blotters)} blotters at {offset}')
+        return offset
+
+    def load_snapshot(self):
+        '''
+        @returns Tuple of (journal offset, Dict of ticker -> (state, open fills, lot indices))
+        '''
+        if not os.path.exists(self.snapshot_path):
+            return 0, {}
+        with open(self.snapshot_path, 'rb') as f:
+            buf = f.read()
+        magic, version, offset, count = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{self.snapshot_path} is not a version {VERSION} blotter snapshot')
+        position = HEADER.size
+        states = {}
+        for _ in range(count):
+            ticker, state, position = unpack_blotter(buf, position)
+            states[ticker] = state
+        return offset, states
+
+    def restore(self, target):
+        '''
+        load the latest snapshot into a new Blotter or Portfolio and replay the journal tail
+        target -> Blotter or Portfolio without fills
+        @returns target
+        '''
+        offset, states = self.load_snapshot()
+        is_blotter = hasattr(target, 'ticker')
+        for ticker, state in states.items():
+            for fill in state[1]:
+                seed_exec_ids(fill.ExecID)
+            if is_blotter:
+                if ticker == target.ticker:
+                    restore_blotter(target, state)
+            else:
+                restore_blotter(target.get_blotter(ticker), state)
+                target.apply(target[ticker])
+        self.close()
+        end = offset
+        self.recovering = True
+        try:
+            for fill, end in self.records(offset):
+                seed_exec_ids(fill.ExecID)
+                if not is_blotter or fill.ExchangeTicker == target.ticker:
+                    target.add_fill(fill)
+        finally:
+            self.recovering = False
+        if os.path.exists(self.path) and os.path.getsize(self.path) > end:
+            if LOGGING_ENABLED:
+                self.logger.warn(f'Warning: truncating torn journal record at {end}')
+            os.truncate(self.path, end)
+        if self.target is None:
+            self.target = target
+        if LOGGING_ENABLED:
+            self.logger.info(f'RESTORED {target}')
+        return target
+
+
+def blotters_of(target):
+    if hasattr(target, 'ticker'):
+        return [target]
+    return list(target)
+
+
+def pack_blotter(blotter):
+    '''
+    @returns bytes of the blotter totals, its open fills in OrderID order and its lots in FIFO order
+    '''
+    fills = [f for position in blotter.positions.orders.values() for f in position.fills]
+    index = {f: i for i, f in enumerate(fills)}
+    lots = [index[f] for f in blotter.lots]
+    avg_open_price = math.nan if blotter.avg_open_price is None else blotter.avg_open_price
+    avg_open_ticks = math.nan if blotter.avg_open_ticks is None else blotter.avg_open_ticks
+    chunks = [pack_value(blotter.ticker),
+              STATE.pack(blotter.net_position, avg_open_price, blotter.realized_pnl,
+                         blotter.unrealized_pnl, blotter.total_pnl, len(fills), len(lots),
+                         blotter.realized_ticks, avg_open_ticks)]
+    for f in fills:
+        chunks.append(pack_fill(f))
+        chunks.append(LOT.pack(f.OpenQuantity, f.RealPnl, f.UnrealPnl, bool(f.BookedPartial),
+                               to_micros(f.BookedPartialAt)))
+    chunks.extend(INDEX.pack(i) for i in lots)
+    return b''.join(chunks)
+
+
+def unpack_blotter(buf, offset):
+    '''
+    @returns Tuple of (ticker, (state, open fills, lot indices), offset)
+    '''
+    ticker, offset = unpack_value(buf, offset)
+    state = STATE.unpack_from(buf, offset)
+    offset += STATE.size
+    fills = []
+    for _ in range(state[5]):
+        fill, offset = unpack_fill(buf, offset)
+        fill.OpenQuantity, fill.RealPnl, fill.UnrealPnl, partial, partial_at = LOT.unpack_from(buf, offset)
+        fill.BookedPartial = bool(partial)
+        fill.BookedPartialAt = from_micros(partial_at)
+        offset += LOT.size
+        fills.append(fill)
+    lots = [INDEX.unpack_from(buf, offset + i * INDEX.size)[0] for i in range(state[6])]
+    offset += state[6] * INDEX.size
+    return ticker, (state, fills, lots), offset
+
+
+def restore_blotter(blotter, state):
+    '''
+    blotter -> Blotter without fills
+    state -> Tuple from unpack_blotter
+    '''
+    (net_position, avg_open_price, realized_pnl, unrealized_pnl, total_pnl, _, _,
+     realized_ticks, avg_open_ticks), fills, lots = state
+    blotter.net_position = net_position
+    blotter.avg_open_price = None if math.isnan(avg_open_price) else avg_open_price
+    blotter.realized_pnl = realized_pnl
+    blotter.unrealized_pnl = unrealized_pnl
+    blotter.total_pnl = total_pnl
+    if blotter.ticks:
+        blotter.realized_ticks = realized_ticks
+        blotter.avg_open_ticks = None if math.isnan(avg_open_ticks) else avg_open_ticks
+    if blotter.store is not None:
+        fills = [blotter.store.append(f) for f in fills]
+    elif blotter.history:
+        blotter.trades.extend(fills)
+    for f in fills:
+        blotter.positions.add(f)
+    for i in lots:
+        blotter.lots.add(fills[i])
+    if blotter.times is not None:
+        for f in fills:
+            blotter.times.add(f)
+        blotter.times.mark(blotter)
+    if blotter.snapshots is not None:
+        blotter.snapshots.publish(blotter)
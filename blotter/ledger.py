@@ -0,0 +1,185 @@
+import os
+import mmap
+import struct
+import collections
+from array import array
+
+from .store import to_micros
+from .journal import pack_value, unpack_value, from_micros, VALUE
+from .log import Logger, LOGGING_ENABLED
+
+FIELDS = ('ExchangeTicker', 'OpenExecID', 'CloseExecID', 'OpenOrderID', 'CloseOrderID',
+          'Quantity', 'OpenPrice', 'ClosePrice', 'RealPnl', 'TransactionTime')
+
+Match = collections.namedtuple('Match', FIELDS)
+
+# record length, Quantity, OpenPrice, ClosePrice, RealPnl, TransactionTime then the ids
+RECORD = struct.Struct('<Iddddq')
+MIN_RECORD = RECORD.size + 5 * VALUE.size
+
+
+class Ledger:
+    '''
+    flat closed-trade records, one per FIFO match of a resting lot against a
+    closing fill, so a Blotter can drop booked fills and still answer
+    historical queries, Quantity is signed by the resting lot
+    Example:
+        blotter = Blotter('ZCN19', history=False, ledger=Ledger('matches.ledger'))
+        blotter.ledger.matches(orderid=4)
+    '''
+    def __init__(self, path=None, spill_every=4096):
+        '''
+        path -> spill matches to this file, None keeps them in memory
+        spill_every -> matches kept in memory before they are appended to path
+        '''
+        self.path = path
+        self.spill_every = spill_every
+        self.logger = Logger(self.__class__.__name__)
+        self.spilled, end = 0, 0
+        for _, end in self.records():
+            self.spilled += 1
+        if path is not None and os.path.exists(path) and os.path.getsize(path) > end:
+            # a crash mid spill leaves a torn record, later spills append after the last complete one
+            if LOGGING_ENABLED:
+                self.logger.warn(f'Warning: truncating torn ledger record at {end}')
+            os.truncate(path, end)
+        self.ids = tuple([] for _ in FIELDS[:5])
+        self.values = tuple(array('d') for _ in FIELDS[5:9])
+        self.times = array('q')
+
+    def __len__(self):
+        return self.spilled + len(self.times)
+
+    def __iter__(self):
+        yield from self.read()
+        ids, values, times = self.ids, self.values, self.times
+        for k in range(len(times)):
+            yield Match(*(c[k] for c in ids), *(c[k] for c in values), from_micros(times[k]))
+
+    def record(self, opening, closing, quantity, pnl):
+        '''
+        opening -> resting Fill
+        closing -> incoming Fill
+        quantity -> matched quantity, signed by the resting lot
+        pnl -> realized pnl of the match
+        '''
+        ticker, open_exec, close_exec, open_order, close_order = self.ids
+        ticker.append(closing.ExchangeTicker)
+        open_exec.append(opening.ExecID)
+        close_exec.append(closing.ExecID)
+        open_order.append(opening.OrderID)
+        close_order.append(closing.OrderID)
+        qty, open_px, close_px, real = self.values
+        qty.append(quantity)
+        open_px.append(opening.PriceLevel)
+        close_px.append(closing.PriceLevel)
+        real.append(pnl)
+        self.times.append(to_micros(closing.TransactionTime))
+        if self.path is not None and len(self.times) >= self.spill_every:
+            self.spill()
+
+    def extend_rows(self, store, opens, closes, quantity, pnl):
+        '''
+        matches of a bulk load, rows index the FillStore
+        opens, closes -> resting and incoming rows
+        quantity, pnl -> sequences aligned with the rows
+        '''
+        ticker, open_exec, close_exec, open_order, close_order = self.ids
+        ticker.extend(store.ExchangeTicker[i] for i in closes)
+        open_exec.extend(store.ExecID[i] for i in opens)
+        close_exec.extend(store.ExecID[i] for i in closes)
+        open_order.extend(store.OrderID[i] for i in opens)
+        close_order.extend(store.OrderID[i] for i in closes)
+        qty, open_px, close_px, real = self.values
+        qty.extend(quantity)
+        open_px.extend(store.PriceLevel[i] for i in opens)
+        close_px.extend(store.PriceLevel[i] for i in closes)
+        real.extend(pnl)
+        self.times.extend(store.TransactionTime[i] for i in closes)
+        if self.path is not None and len(self.times) >= self.spill_every:
+            self.spill()
+
+    def spill(self):
+        '''
+        append the in-memory matches to path
+        @returns int number of matches written
+        '''
+        n = len(self.times)
+        if self.path is None or not n:
+            return 0
+        ids, values, times = self.ids, self.values, self.times
+        chunks = []
+        for k in range(n):
+            body = b''.join(pack_value(c[k]) for c in ids)
+            chunks.append(RECORD.pack(RECORD.size + len(body), *(c[k] for c in values), times[k]))
+            chunks.append(body)
+        with open(self.path, 'ab') as f:
+            f.write(b''.join(chunks))
+        for column in ids:
+            column.clear()
+        for column in values + (times,):
+            del column[:]
+        self.spilled += n
+        return n
+
+    def read(self):
+        '''
+        @returns Generator of the spilled Match records, stops at a torn trailing record
+        '''
+        for match, _ in self.records():
+            yield match
+
+    def records(self):
+        '''
+        @returns Generator of (Match, offset of the next record)
+        '''
+        if self.path is None or not os.path.exists(self.path) or not os.path.getsize(self.path):
+            return
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            offset, end = 0, len(buf)
+            while offset + RECORD.size <= end:
+                size, *values, time = RECORD.unpack_from(buf, offset)
+                if size < MIN_RECORD or offset + size > end:
+                    break
+                position = offset + RECORD.size
+                ids = []
+                try:
+                    for _ in range(5):
+                        value, position = unpack_value(buf, position)
+                        ids.append(value)
+                except (ValueError, UnicodeDecodeError, struct.error):
+                    break
+                if position != offset + size:
+                    break # a record whose fields do not fill its length is torn too
+                offset += size
+                yield Match(*ids, *values, from_micros(time)), offset
+
+    def matches(self, ticker=None, execid=None, orderid=None, start=None, end=None):
+        '''
+        ticker -> ExchangeTicker
+        execid, orderid -> match either side
+        start, end -> datetime range of the closing fill, end exclusive
+        @returns List of Match
+        '''
+        found = []
+        for match in self:
+            if ticker is not None and match.ExchangeTicker != ticker:
+                continue
+            if execid is not None and execid not in (match.OpenExecID, match.CloseExecID):
+                continue
+            if orderid is not None and orderid not in (match.OpenOrderID, match.CloseOrderID):
+                continue
+            if start is not None and (match.TransactionTime is None or match.TransactionTime < start):
+                continue
+            if end is not None and (match.TransactionTime is None or match.TransactionTime >= end):
+                continue
+            found.append(match)
+        return found
+
+    def realized_pnl(self, ticker=None):
+        '''
+        @returns float sum of the matched pnl
+        '''
+        if ticker is None and not self.spilled:
+            return sum(self.values[3])
+        return sum(m.RealPnl for m in self.matches(ticker))
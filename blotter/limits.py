@@ -0,0 +1,133 @@
+import collections
+
+from .util import calc_pnl, to_ticks
+
+# reason is None when the order passed, net_position, open_lots and realized_pnl are after the order
+Check = collections.namedtuple('Check', ('passed', 'reason', 'net_position', 'open_lots', 'realized_pnl'))
+
+
+class Limits:
+    '''
+    pre-trade checks of a proposed order against the live state of a
+    Blotter, which is only read, so they can run on the order path
+
+    the order is projected from net_position and the open lot count, and
+    the realized pnl it would lock in is summed over the resting lots it
+    would close in the blotter's matching order, so a check costs the lots
+    the order closes (none for an opening order, one for the head lot, the
+    average policy values the close against avg_open_price without walking)
+
+    an order that reduces the position, or the open lot count, is not
+    stopped by max_position or max_open_lots; once the daily loss is past
+    max_daily_loss only orders reducing the position without locking in a
+    further loss pass
+    Example:
+        limits = Limits(portfolio['ZCN19'], max_position=500, max_open_lots=200, max_daily_loss=25000)
+        check = limits.check(-50, 3.7125)
+        if not check.passed:
+            reject(order, check.reason)
+        limits.roll() # at the start of the next session
+    '''
+    def __init__(self, blotter, max_position=None, max_open_lots=None, max_daily_loss=None):
+        '''
+        blotter -> Blotter
+        max_position -> largest absolute net_position, None for no limit
+        max_open_lots -> most open lots, None for no limit
+        max_daily_loss -> largest loss of realized pnl since the session started, positive, None for no limit
+        '''
+        self.blotter = blotter
+        self.max_position = max_position
+        self.max_open_lots = max_open_lots
+        self.max_daily_loss = max_daily_loss
+        self.start_pnl = blotter.realized_pnl   # realized pnl when the session started
+        #
+        self.checks = 0
+        self.rejects = 0
+
+    def __str__(self):
+        return f'>{self.__class__.__name__.upper()}|' + \
+               f'{self.blotter.ticker}|' + \
+               f'{self.max_position}|' + \
+               f'{self.max_open_lots}|' + \
+               f'{self.max_daily_loss}|' + \
+               f'{self.checks}|' + \
+               f'{self.rejects}|'
+
+    def __repr__(self):
+        return self.__str__()
+
+    def roll(self):
+        '''
+        start a new session, the daily loss is measured from the realized pnl now
+        @returns Limits
+        '''
+        self.start_pnl = self.blotter.realized_pnl
+        return self
+
+    def close(self, quantity, price):
+        '''
+        match quantity against the resting lots as Blotter.close_existing_positions, without booking them
+        @returns Tuple of (realized pnl locked in, lots closed fully, quantity left open)
+        '''
+        blotter = self.blotter
+        lots = blotter.lots
+        direction = -1 if quantity > 0 else 1
+        if blotter.ticks:
+            price = to_ticks(price, blotter.tick_size)
+            scale = blotter.contract_multiplier * blotter.tick_value
+        else:
+            scale = blotter.contract_multiplier / blotter.tick_size * blotter.tick_value
+        if lots.average:
+            # every lot is valued against the average, only the count needs the lots
+            avg = blotter.avg_open_ticks if blotter.ticks else blotter.avg_open_price
+            pnl = calc_pnl(blotter.net_position, avg, quantity, price) * scale
+            if abs(quantity) >= abs(blotter.net_position):
+                return pnl, len(lots), quantity + blotter.net_position
+        else:
+            pnl = 0
+        closed = 0
+        for lot in lots.walk(direction):
+            open_quantity = lot.OpenQuantity
+            if not lots.average:
+                opened = to_ticks(lot.PriceLevel, blotter.tick_size) if blotter.ticks else lot.PriceLevel
+                pnl += calc_pnl(open_quantity, opened, quantity, price) * scale
+            if abs(open_quantity) > abs(quantity):
+                return pnl, closed, 0
+            quantity += open_quantity
+            closed += 1
+            if not quantity:
+                break
+        return pnl, closed, quantity
+
+    def check(self, quantity, price):
+        '''
+        quantity -> signed order quantity, positive buys
+        price -> expected fill price
+        @returns Check
+        '''
+        if not quantity:
+            raise ValueError('Received order with 0 quantity')
+        blotter = self.blotter
+        self.checks += 1
+        position = blotter.net_position
+        lots = len(blotter.lots)
+        locked = 0
+        if position and (position > 0) != (quantity > 0):
+            locked, closed, left = self.close(quantity, price)
+            open_lots = lots - closed + bool(left)
+        else:
+            open_lots = lots + 1
+        net_position = position + quantity
+        realized_pnl = blotter.realized_pnl + locked
+        reason = None
+        if self.max_position is not None and abs(net_position) > self.max_position \
+                and abs(net_position) > abs(position):
+            reason = f'position {net_position} would exceed max_position {self.max_position}'
+        elif self.max_open_lots is not None and open_lots > self.max_open_lots and open_lots > lots:
+            reason = f'{open_lots} open lots would exceed max_open_lots {self.max_open_lots}'
+        elif self.max_daily_loss is not None and self.start_pnl - realized_pnl > self.max_daily_loss \
+                and (locked < 0 or abs(net_position) > abs(position)):
+            reason = f'daily loss {round(self.start_pnl - realized_pnl, 2)} would exceed max_daily_loss {self.max_daily_loss}'
+        if reason is not None:
+            self.rejects += 1
+        return Check(reason is None, reason, net_position, open_lots, realized_pnl)
@@ -1,25 +1,186 @@
 import os
+import json
+import time
+import queue
+import struct
+import marshal
+import datetime as dt
+import atexit
 import logging
+import logging.handlers
 
 LOGGING_ENABLED = os.getenv('LOGGING_ENABLED')=='Y' or False
 VERBOSE = os.getenv('VERBOSE')=='Y' or False
 FILENAME = os.getenv('LOG_LOCATION') or 'blot.log'
 LOG_LEVEL = os.getenv('LOG_LEVEL') or 'DEBUG'
+LOG_ASYNC = os.getenv('LOG_ASYNC')=='Y' or False   # write from a background thread
+LOG_FORMAT = os.getenv('LOG_FORMAT') or 'text'     # text, jsonl or binary
 
-if LOGGING_ENABLED:
+FORMAT = '%(asctime)s %(name)-12s %(levelname)-8s %(message)s'
+DATEFMT = '%m-%d %H:%M'
+FRAME = struct.Struct('<I')
+
+# event kind -> callable formatting the captured fields as text
+FORMATTERS = {}
+
+_queue = None
+_listener = None
+
+
+def register_event(kind, formatter):
+    FORMATTERS[kind] = formatter
+
+
+def format_event(kind, fields):
+    formatter = FORMATTERS.get(kind)
+    if formatter is None:
+        return f'>{kind}|' + '|'.join(map(str, fields)) + '|'
+    return formatter(fields)
+
+
+def format_message(fields):
+    msg, args = fields[0], fields[1:]
+    return msg % args if args else msg
+
+
+register_event('MSG', format_message)
+
+
+class EventMessage:
+    '''
+    log message formatted only when a handler emits it
+    '''
+    __slots__ = ('kind', 'fields')
+
+    def __init__(self, kind, fields):
+        self.kind = kind
+        self.fields = fields
+
+    def __str__(self):
+        return format_event(self.kind, self.fields)
+
+
+class EventHandler(logging.Handler):
+    '''
+    structured events, one json object per line or length prefixed marshal
+    records with datetimes as POSIX timestamps
+    '''
+    def __init__(self, filename, fmt='jsonl'):
+        super().__init__()
+        self.fmt = fmt
+        self.stream = open(filename, 'wb' if fmt == 'binary' else 'w')
+
+    def emit(self, record):
+        msg = record.msg
+        if isinstance(msg, EventMessage) and msg.kind != 'MSG':
+            kind, fields = msg.kind, msg.fields
+        else:
+            kind, fields = 'MSG', (record.getMessage(),)
+        if self.fmt == 'binary':
+            fields = tuple(v.timestamp() if isinstance(v, dt.datetime) else v for v in fields)
+            data = marshal.dumps((record.created, record.name, record.levelno, kind, fields))
+            self.stream.write(FRAME.pack(len(data)) + data)
+        else:
+            event = (record.created, record.name, record.levelname, kind, fields)
+            self.stream.write(json.dumps(event, default=str) + '\n')
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.stream.close()
+        super().close()
+
+
+def read_events(filename):
+    '''
+    filename -> binary event log
+    @returns Generator of (created, logger, level, kind, fields)
+    '''
+    with open(filename, 'rb') as f:
+        while True:
+            header = f.read(FRAME.size)
+            if len(header) < FRAME.size:
+                return
+            yield marshal.loads(f.read(FRAME.unpack(header)[0]))
+
+
+class EventListener(logging.handlers.QueueListener):
+    '''
+    turns the event tuples queued by Logger.event into records on the writer thread
+    '''
+    def handle(self, record):
+        if isinstance(record, tuple):
+            created, name, level, kind, fields = record
+            record = logging.LogRecord(name, level, '', 0, EventMessage(kind, fields), None, None)
+            record.created = created
+            record.msecs = (created - int(created)) * 1000
+        super().handle(record)
+
+
+def get_level():
     try:
-        log_level = getattr(logging, LOG_LEVEL)
-    except Exception as e:
+        return getattr(logging, LOG_LEVEL)
+    except AttributeError:
         print('Invalid log level, defaulting to DEBUG')
-        log_level = logging.DEBUG
+        return logging.DEBUG
 
-    logging.basicConfig(level=log_level,
-                        format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
-                        datefmt='%m-%d %H:%M',
-                        filename=FILENAME,
-                        filemode='w')
 
-    if VERBOSE:  # log to console
+def start_async(filename=FILENAME, fmt=LOG_FORMAT, level=None):
+    '''
+    route every blotter logger through a queue drained by a background thread
+    fmt -> 'text' like the synchronous log, 'jsonl' or 'binary' structured events
+    '''
+    global _queue, _listener
+    if _listener is not None:
+        stop_async()
+    if fmt == 'text':
+        handler = logging.FileHandler(filename, mode='w')
+        handler.setFormatter(logging.Formatter(FORMAT, DATEFMT))
+    else:
+        handler = EventHandler(filename, fmt)
+    handlers = [handler]
+    if VERBOSE:
+        console = logging.StreamHandler()
+        console.setFormatter(logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s'))
+        handlers.append(console)
+    _queue = queue.SimpleQueue()
+    root = logging.getLogger('')
+    root.setLevel(get_level() if level is None else level)
+    root.addHandler(logging.handlers.QueueHandler(_queue))
+    _listener = EventListener(_queue, *handlers)
+    _listener.start()
+    atexit.register(stop_async)
+
+
+def stop_async():
+    '''
+    drain the queue and close the writer
+    '''
+    global _queue, _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    root = logging.getLogger('')
+    for handler in list(root.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler) and handler.queue is _queue:
+            root.removeHandler(handler)
+    for handler in _listener.handlers:
+        handler.close()
+    _queue = _listener = None
+
+
+if LOGGING_ENABLED:
+    if LOG_ASYNC:
+        start_async()
+    else:
+        logging.basicConfig(level=get_level(),
+                            format=FORMAT,
+                            datefmt=DATEFMT,
+                            filename=FILENAME,
+                            filemode='w')
+
+    if VERBOSE and not LOG_ASYNC:  # log to console
         console = logging.StreamHandler()
         console.setLevel(logging.DEBUG)
         console.setFormatter(logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s'))
@@ -29,18 +190,40 @@ class Logger:
     def __init__(self, name):
         self.logger = logging.getLogger(name)
 
-    def info(self, msg):
-        self.logger.info(msg)
+    def info(self, msg, *args):
+        self.log(logging.INFO, msg, args)
+
+    def warn(self, msg, *args):
+        self.log(logging.WARNING, msg, args)
 
-    def warn(self, msg):
-        self.logger.warning(msg)
+    def error(self, msg, *args):
+        self.log(logging.ERROR, msg, args)
 
-    def error(self, msg):
-        self.logger.error(msg)
+    def critical(self, msg, *args):
+        self.log(logging.CRITICAL, msg, args)
 
-    def critical(self, msg):
-        self.logger.critical(msg)
+    def debug(self, msg, *args):
+        self.log(logging.DEBUG, msg, args)
 
-    def debug(self, msg):
-        self.logger.debug(msg)
+    def log(self, level, msg, args=()):
+        '''
+        msg, args -> %-style, args are formatted by the writer when logging asynchronously
+        '''
+        if _queue is None:
+            self.logger.log(level, msg, *args)
+        elif self.logger.isEnabledFor(level):
+            msg = msg if isinstance(msg, str) else str(msg)
+            _queue.put_nowait((time.time(), self.logger.name, level, 'MSG', (msg,) + args))
 
+    def event(self, kind, fields, level=logging.INFO):
+        '''
+        kind -> name of a formatter registered with register_event
+        fields -> tuple of immutable values captured now, formatted by the writer
+        '''
+        logger = self.logger
+        if not logger.isEnabledFor(level):
+            return
+        if _queue is not None:
+            _queue.put_nowait((time.time(), logger.name, level, kind, fields))
+        else:
+            logger.log(level, EventMessage(kind, fields))
@@ -0,0 +1,192 @@
+import heapq
+import itertools
+from collections import deque
+
+from .directions import DIRECTIONS
+
+
+class FifoLots:
+    '''
+    open (not booked) fills queued per direction in arrival order
+    '''
+    name = 'fifo'
+    # closing fills are valued against the resting lot's PriceLevel, not the average open price
+    average = False
+
+    def __init__(self):
+        self.lots = {DIRECTIONS.LONG.value: deque(),
+                     DIRECTIONS.SHORT.value: deque()}
+
+    def __len__(self):
+        return sum(len(q) for q in self.lots.values())
+
+    def __iter__(self):
+        for q in self.lots.values():
+            yield from q
+
+    def add(self, fill):
+        '''
+        fill -> Fill
+        '''
+        self.lots[1 if fill.OrderFilled > 0 else -1].append(fill)
+
+    def peek(self, direction):
+        '''
+        direction -> type(DIRECTIONS).value
+        @returns Fill or None
+        '''
+        q = self.lots[direction]
+        if q:
+            return q[0]
+
+    def pop(self, direction):
+        '''
+        direction -> type(DIRECTIONS).value
+        @returns Fill
+        '''
+        return self.lots[direction].popleft()
+
+    def restore(self, fill):
+        '''
+        undo the pop of fill
+        '''
+        self.lots[1 if fill.OrderFilled > 0 else -1].appendleft(fill)
+
+    def discard(self, fill):
+        '''
+        undo the add of fill, when it is still queued
+        '''
+        q = self.lots[1 if fill.OrderFilled > 0 else -1]
+        if q and q[-1] == fill:
+            q.pop()
+
+    def walk(self, direction):
+        '''
+        direction -> type(DIRECTIONS).value
+        @returns Iterator of the lots in closing order, nothing is removed
+        '''
+        return iter(self.lots[direction])
+
+    def closes_first(self, resting, added):
+        '''
+        @returns bool, True when the resting lot closes before a lot added after it
+        '''
+        return True
+
+
+class AverageLots(FifoLots):
+    '''
+    weighted average cost, closing fills are valued against the Blotter's
+    avg_open_price and consume the lots in arrival order
+    '''
+    name = 'average'
+    average = True
+
+
+class LifoLots(FifoLots):
+    '''
+    open fills stacked per direction, the most recent closes first
+    '''
+    name = 'lifo'
+
+    def __init__(self):
+        self.lots = {DIRECTIONS.LONG.value: [],
+                     DIRECTIONS.SHORT.value: []}
+
+    def peek(self, direction):
+        q = self.lots[direction]
+        if q:
+            return q[-1]
+
+    def pop(self, direction):
+        return self.lots[direction].pop()
+
+    def restore(self, fill):
+        self.lots[1 if fill.OrderFilled > 0 else -1].append(fill)
+
+    def walk(self, direction):
+        return reversed(self.lots[direction])
+
+    def closes_first(self, resting, added):
+        return False
+
+
+class HifoLots(FifoLots):
+    '''
+    highest in, first out: a heap per direction closes the long lot bought
+    highest or the short lot sold lowest first, ties in arrival order
+    '''
+    name = 'hifo'
+
+    def __init__(self):
+        self.lots = {DIRECTIONS.LONG.value: [],
+                     DIRECTIONS.SHORT.value: []}
+        self.seq = itertools.count()
+        self.restored = itertools.count(-1, -1)
+
+    def __iter__(self):
+        # in closing order, so adding them back to a new HifoLots keeps the ties
+        for q in self.lots.values():
+            for _, _, fill in sorted(q, key=lambda entry: entry[:2]):
+                yield fill
+
+    def push(self, fill, seq):
+        direction = 1 if fill.OrderFilled > 0 else -1
+        key = -fill.PriceLevel if direction > 0 else fill.PriceLevel
+        heapq.heappush(self.lots[direction], (key, seq, fill))
+
+    def add(self, fill):
+        self.push(fill, next(self.seq))
+
+    def peek(self, direction):
+        q = self.lots[direction]
+        if q:
+            return q[0][2]
+
+    def pop(self, direction):
+        return heapq.heappop(self.lots[direction])[2]
+
+    def restore(self, fill):
+        # it was the head, so it goes before every lot at the same price
+        self.push(fill, next(self.restored))
+
+    def discard(self, fill):
+        q = self.lots[1 if fill.OrderFilled > 0 else -1]
+        for i, entry in enumerate(q):
+            if entry[2] == fill:
+                q[i] = q[-1]
+                q.pop()
+                heapq.heapify(q)
+                return
+
+    def walk(self, direction):
+        # pops a heap of positions in the lot heap, a child can only follow its parent
+        q = self.lots[direction]
+        frontier = [(q[0], 0)] if q else []
+        while frontier:
+            entry, i = heapq.heappop(frontier)
+            yield entry[2]
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(q):
+                    heapq.heappush(frontier, (q[child], child))
+
+    def closes_first(self, resting, added):
+        if resting.OrderFilled > 0:
+            return resting.PriceLevel >= added.PriceLevel
+        return resting.PriceLevel <= added.PriceLevel
+
+
+POLICIES = {cls.name: cls for cls in (FifoLots, LifoLots, HifoLots, AverageLots)}
+
+
+def get_policy(policy):
+    '''
+    policy -> name in POLICIES or a lots class
+    @returns lots class
+    '''
+    if isinstance(policy, str):
+        try:
+            return POLICIES[policy]
+        except KeyError:
+            raise ValueError(f'Unknown matching policy {policy!r}, expected one of {sorted(POLICIES)}') from None
+    return policy
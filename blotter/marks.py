@@ -0,0 +1,155 @@
+import math
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+NAN = float('nan')
+
+
+class PositionTable:
+    '''
+    one row per Blotter of contiguous position / price / contract columns,
+    so many blotters can be marked to market in one numpy pass
+    Example:
+        table = PositionTable(blotters)
+        table.mark({'ZCN19': 3.71, 'ZSN19': 9.0025})
+    '''
+    def __init__(self, blotters=()):
+        self.index = {}
+        self.tickers = []
+        self.blotters = []
+        self.net_position = array('d')
+        self.avg_open_price = array('d')
+        self.realized_pnl = array('d')
+        self.unrealized_pnl = array('d')
+        self.last_price = array('d')
+        self.contract_multiplier = array('d')
+        self.tick_size = array('d')
+        self.tick_value = array('d')
+        for blotter in blotters:
+            self.add(blotter)
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def add(self, blotter):
+        '''
+        blotter -> Blotter
+        @returns int row
+        '''
+        row = self.index.get(blotter.ticker)
+        if row is not None:
+            return row
+        row = self.index[blotter.ticker] = len(self.tickers)
+        self.tickers.append(blotter.ticker)
+        self.blotters.append(blotter)
+        for column in (self.net_position, self.avg_open_price, self.realized_pnl, self.unrealized_pnl):
+            column.append(0)
+        self.last_price.append(NAN)
+        self.contract_multiplier.append(blotter.contract_multiplier)
+        self.tick_size.append(blotter.tick_size)
+        self.tick_value.append(blotter.tick_value)
+        self.sync(blotter)
+        return row
+
+    def sync(self, blotter):
+        '''
+        copy the blotter's position, average price and pnl into its row
+        @returns int row
+        '''
+        row = self.index[blotter.ticker]
+        self.net_position[row] = blotter.net_position
+        self.avg_open_price[row] = blotter.avg_open_price or 0
+        self.realized_pnl[row] = blotter.realized_pnl
+        self.unrealized_pnl[row] = blotter.unrealized_pnl
+        return row
+
+    def mark_price(self, row):
+        last = self.last_price[row]
+        return self.avg_open_price[row] if math.isnan(last) else last
+
+    def exposure(self, row):
+        return self.net_position[row] * self.mark_price(row) * self.contract_multiplier[row]
+
+    def prices(self, prices):
+        '''
+        prices -> Dict of ticker -> price, or a sequence aligned with tickers (nan skips a row)
+        @returns array of last prices aligned with tickers
+        '''
+        if isinstance(prices, dict):
+            last = array('d', [NAN]) * len(self)
+            index = self.index
+            for ticker, price in prices.items():
+                row = index.get(ticker)
+                if row is not None:
+                    last[row] = price
+            return last
+        if len(prices) != len(self):
+            raise ValueError(f'Expected {len(self)} prices, received {len(prices)}')
+        return prices
+
+    def mark(self, prices, write_back=True):
+        '''
+        prices -> Dict of ticker -> price, or a sequence aligned with tickers (nan skips a row)
+        write_back -> set unrealized_pnl / total_pnl on the marked Blotter objects
+        @returns List of marked rows
+        '''
+        prices = self.prices(prices)
+        if np is not None:
+            rows = self._mark_vectorized(prices)
+        else:
+            rows = self._mark(prices)
+        if write_back:
+            blotters, unrealized = self.blotters, self.unrealized_pnl
+            for row in rows:
+                blotter = blotters[row]
+                blotter.unrealized_pnl = unrealized[row]
+                blotter.total_pnl = blotter.realized_pnl + blotter.unrealized_pnl
+        return rows
+
+    def _mark(self, prices):
+        rows = []
+        for row, price in enumerate(prices):
+            if math.isnan(price):
+                continue
+            self.last_price[row] = price
+            position = self.net_position[row]
+            if position:
+                self.unrealized_pnl[row] = (price - self.avg_open_price[row]) * position \
+                    * self.contract_multiplier[row] / self.tick_size[row] * self.tick_value[row]
+            else:
+                self.unrealized_pnl[row] = 0
+            rows.append(row)
+        return rows
+
+    def _mark_vectorized(self, prices):
+        price = np.asarray(prices, dtype=np.float64)
+        marked = ~np.isnan(price)
+        last = np.frombuffer(self.last_price, dtype=np.float64)
+        unrealized = np.frombuffer(self.unrealized_pnl, dtype=np.float64)
+        position = np.frombuffer(self.net_position, dtype=np.float64)
+        pnl = (price - np.frombuffer(self.avg_open_price, dtype=np.float64)) * position \
+            * np.frombuffer(self.contract_multiplier, dtype=np.float64) \
+            / np.frombuffer(self.tick_size, dtype=np.float64) \
+            * np.frombuffer(self.tick_value, dtype=np.float64)
+        pnl[position == 0] = 0
+        last[marked] = price[marked]
+        unrealized[marked] = pnl[marked]
+        return np.flatnonzero(marked).tolist()
+
+    def totals(self):
+        '''
+        @returns Tuple of (net exposure, gross exposure, unrealized pnl) over every row
+        '''
+        if np is not None and len(self):
+            last = np.frombuffer(self.last_price, dtype=np.float64)
+            price = np.where(np.isnan(last), np.frombuffer(self.avg_open_price, dtype=np.float64), last)
+            exposure = np.frombuffer(self.net_position, dtype=np.float64) * price \
+                * np.frombuffer(self.contract_multiplier, dtype=np.float64)
+            return exposure.sum().item(), np.abs(exposure).sum().item(), \
+                np.frombuffer(self.unrealized_pnl, dtype=np.float64).sum().item()
+        exposures = [self.exposure(row) for row in range(len(self))]
+        return sum(exposures), sum(map(abs, exposures)), sum(self.unrealized_pnl)
@@ -0,0 +1,92 @@
+from .log import Logger, LOGGING_ENABLED
+from .blot import Blotter
+from .fill import Fill
+
+
+class PolicyBlotter:
+    '''
+    one Blotter per lot matching policy fed from a single pass over the
+    fills, every policy books its own copy of each fill
+    Example:
+        books = PolicyBlotter('ZCN19', ('fifo', 'lifo', 'average'))
+        books.initialize_from_list(fills)
+        books['lifo'].realized_pnl
+        books.realized_pnl()
+    '''
+    def __init__(self, ticker, policies=('fifo', 'lifo', 'hifo', 'average'), **kwargs):
+        '''
+        policies -> names in lots.POLICIES or lots classes
+        kwargs -> passed to every Blotter, except journal which would record each fill once per policy
+        '''
+        if 'journal' in kwargs:
+            raise ValueError('PolicyBlotter cannot journal, attach the Journal to a single Blotter')
+        self.ticker = ticker
+        self.blotters = {}
+        for policy in policies:
+            blotter = Blotter(ticker, policy=policy, **kwargs)
+            self.blotters[blotter.lots.name] = blotter
+        self.logger = Logger(self.__class__.__name__)
+
+    def __str__(self):
+        return f'>{self.__class__.__name__.upper()}|' + \
+               f'{self.ticker}|' + \
+               ''.join(f'{name}={round(b.realized_pnl, 2)}|' for name, b in self.blotters.items())
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __getitem__(self, policy):
+        return self.blotters[policy]
+
+    def __iter__(self):
+        return iter(self.blotters.values())
+
+    def __len__(self):
+        return len(self.blotters)
+
+    def add_fill(self, fill):
+        '''
+        fill -> Fill
+        @returns PolicyBlotter
+        '''
+        if fill.ExchangeTicker != self.ticker:
+            msg = f'Warning: attempt to add fill to blotter with incorrect ExchangeTicker ({fill.ExchangeTicker != self.ticker})'
+            if LOGGING_ENABLED:
+                self.logger.error(msg)
+            raise ValueError(msg)
+        blotters = iter(self.blotters.values())
+        # the first policy books the fill itself, the rest a copy of it
+        next(blotters).update(fill)
+        for blotter in blotters:
+            blotter.update(Fill(fill))
+        return self
+
+    def initialize_from_list(self, fills:list):
+        '''
+        fills -> List of Fill
+        @returns PolicyBlotter
+        '''
+        for f in fills:
+            self.add_fill(f)
+        return self
+
+    def update_from_marketdata(self, last_price):
+        '''
+        last_price -> float
+        @returns PolicyBlotter
+        '''
+        for blotter in self.blotters.values():
+            blotter.update_from_marketdata(last_price)
+        return self
+
+    def realized_pnl(self):
+        '''
+        @returns Dict of policy name -> realized_pnl
+        '''
+        return {name: b.realized_pnl for name, b in self.blotters.items()}
+
+    def total_pnl(self):
+        '''
+        @returns Dict of policy name -> total_pnl
+        '''
+        return {name: b.total_pnl for name, b in self.blotters.items()}
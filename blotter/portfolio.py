@@ -0,0 +1,224 @@
+from .log import Logger, LOGGING_ENABLED
+from .blot import Blotter
+from .marks import PositionTable
+from .events import EventBus
+
+DEFAULTS = {'contract_multiplier': 1, 'tick_value': 12.5, 'tick_size': 0.0025}
+
+
+class Portfolio:
+    '''
+    routes fills to one Blotter per ExchangeTicker and keeps firm wide
+    aggregates current by applying each blotter's change as a delta
+    Example:
+        portfolio = Portfolio({'ZSN19': {'tick_value': 50}})
+        portfolio.add_fill(fill)
+        portfolio.update_from_marketdata('ZSN19', 9.0025)
+        portfolio.mark({'ZSN19': 9.0025, 'ZCN19': 3.71})
+        portfolio.total_pnl
+    '''
+    def __init__(self, contracts=None, **kwargs):
+        '''
+        contracts -> Dict of ticker -> Blotter kwargs, "defaults" applies to unlisted tickers
+        kwargs -> passed to every Blotter (e.g. history=False, journal=Journal(path))
+        '''
+        self.contracts = contracts or {}
+        self.kwargs = kwargs
+        journal = kwargs.get('journal')
+        if journal is not None and journal.target is None:
+            journal.target = self
+        self.blotters = {}
+        self.marks = {} # prices for tickers without a blotter yet
+        self.table = PositionTable()
+        #
+        self.net_position = 0
+        self.gross_position = 0
+        self.net_exposure = 0
+        self.gross_exposure = 0
+        self.realized_pnl = 0
+        self.unrealized_pnl = 0
+        self.total_pnl = 0
+        self.logger = Logger(self.__class__.__name__)
+
+    def __str__(self):
+        return f'>{self.__class__.__name__.upper()}|' + \
+               f'{len(self.blotters)}|' + \
+               f'{self.gross_position}|' + \
+               f'{round(self.net_exposure, 2)}|' + \
+               f'{round(self.gross_exposure, 2)}|' + \
+               f'{round(self.total_pnl, 2)}|' + \
+               f'|'
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __getitem__(self, ticker):
+        return self.blotters[ticker]
+
+    def __contains__(self, ticker):
+        return ticker in self.blotters
+
+    def __iter__(self):
+        return iter(self.blotters.values())
+
+    def __len__(self):
+        return len(self.blotters)
+
+    def get_blotter(self, ticker):
+        '''
+        ticker -> str
+        @returns Blotter, created from the contract spec on first use
+        '''
+        blotter = self.blotters.get(ticker)
+        if blotter is None:
+            spec = self.contracts.get(ticker, self.contracts.get('defaults', DEFAULTS))
+            blotter = self.blotters[ticker] = Blotter(ticker, **dict(spec, **self.kwargs))
+            row = self.table.add(blotter)
+            mark = self.marks.pop(ticker, None)
+            if mark is not None:
+                self.table.last_price[row] = mark
+        return blotter
+
+    def subscribe(self, callback, **kwargs):
+        '''
+        receive change events of every Blotter, current and future, through one EventBus,
+        see Blotter.subscribe
+        @returns events.Subscription
+        '''
+        events = self.kwargs.get('events')
+        if events is None:
+            events = self.kwargs['events'] = EventBus()
+            for blotter in self.blotters.values():
+                blotter.events = events
+        return events.subscribe(callback, **kwargs)
+
+    def contribution(self, row):
+        '''
+        @returns Tuple of (net position, gross position, net exposure, gross exposure, realized, unrealized)
+        '''
+        table = self.table
+        net_position = table.net_position[row]
+        exposure = table.exposure(row)
+        return (net_position, abs(net_position), exposure, abs(exposure),
+                table.realized_pnl[row], table.unrealized_pnl[row])
+
+    def apply(self, blotter, last_price=None):
+        '''
+        replace the blotter's previous contribution to the aggregates with its current one
+        last_price -> new mark for the blotter's exposure
+        '''
+        row = self.table.index[blotter.ticker]
+        old = self.contribution(row)
+        if last_price is not None:
+            self.table.last_price[row] = last_price
+        self.table.sync(blotter)
+        new = self.contribution(row)
+        self.net_position += new[0] - old[0]
+        self.gross_position += new[1] - old[1]
+        self.net_exposure += new[2] - old[2]
+        self.gross_exposure += new[3] - old[3]
+        self.realized_pnl += new[4] - old[4]
+        self.unrealized_pnl += new[5] - old[5]
+        self.total_pnl = self.realized_pnl + self.unrealized_pnl
+
+    def add_fill(self, fill):
+        '''
+        fill -> Fill
+        @returns Portfolio
+        '''
+        blotter = self.get_blotter(fill.ExchangeTicker)
+        mark = self.table.last_price[self.table.index[blotter.ticker]]
+        blotter.update(fill, mark if mark == mark else None) # nan until the ticker is marked
+        self.apply(blotter)
+        return self
+
+    def remark(self, blotter):
+        '''
+        mark a blotter whose fills changed at its last price and apply it
+        '''
+        mark = self.table.last_price[self.table.index[blotter.ticker]]
+        if mark == mark: # nan until the ticker is marked
+            blotter.update_from_marketdata(mark)
+        self.apply(blotter)
+
+    def bust(self, ticker, exec_id):
+        '''
+        see Blotter.bust, the blotters need an undo log (Portfolio(undo=N))
+        @returns Fill removed
+        '''
+        fill = self[ticker].bust(exec_id)
+        self.remark(self[ticker])
+        return fill
+
+    def correct(self, ticker, exec_id, PriceLevel=None, OrderFilled=None):
+        '''
+        see Blotter.correct
+        @returns Fill booked in its place
+        '''
+        fill = self[ticker].correct(exec_id, PriceLevel, OrderFilled)
+        self.remark(self[ticker])
+        return fill
+
+    def update(self, fill):
+        return self.add_fill(fill)
+
+    def update_from_marketdata(self, ticker, last_price):
+        '''
+        ticker -> str
+        last_price -> float
+        @returns Portfolio
+        '''
+        blotter = self.blotters.get(ticker)
+        if blotter is None:
+            self.marks[ticker] = last_price
+            return self
+        blotter.update_from_marketdata(last_price)
+        self.apply(blotter, last_price)
+        return self
+
+    def mark(self, prices):
+        '''
+        mark every blotter in one pass over the position table
+        prices -> Dict of ticker -> price, or a sequence aligned with table.tickers (nan skips a ticker)
+        @returns Portfolio
+        '''
+        if isinstance(prices, dict):
+            for ticker, price in prices.items():
+                if ticker not in self.blotters:
+                    self.marks[ticker] = price
+        for row in self.table.mark(prices):
+            blotter = self.table.blotters[row]
+            if blotter.series is not None:
+                blotter.series.sample(blotter)
+            if blotter.snapshots is not None:
+                blotter.snapshots.publish(blotter)
+            if blotter.events is not None:
+                blotter.events.marked(blotter)
+        self.net_exposure, self.gross_exposure, self.unrealized_pnl = self.table.totals()
+        self.total_pnl = self.realized_pnl + self.unrealized_pnl
+        return self
+
+    def initialize_from_list(self, fills:list):
+        '''
+        fills -> List
+        @returns Portfolio
+        '''
+        for f in fills:
+            self.add_fill(f)
+        if LOGGING_ENABLED:
+            self.logger.info(self)
+        return self
+
+    def refresh(self):
+        '''
+        recompute the aggregates from every blotter, discarding accumulated rounding
+        @returns Portfolio
+        '''
+        totals = [0] * 6
+        for blotter in self.blotters.values():
+            contribution = self.contribution(self.table.sync(blotter))
+            totals = [a + b for a, b in zip(totals, contribution)]
+        self.net_position, self.gross_position, self.net_exposure, \
+            self.gross_exposure, self.realized_pnl, self.unrealized_pnl = totals
+        self.total_pnl = self.realized_pnl + self.unrealized_pnl
+        return self
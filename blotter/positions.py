@@ -0,0 +1,117 @@
+import copy
+import itertools
+
+
+class OrderPosition:
+    '''
+    running aggregate of the open fills of one OrderID
+    '''
+    __slots__ = ('fills', 'OpenQuantity', 'OrderFilled', 'Notional', 'UnrealPnl', 'RealPnl', 'Partials')
+
+    def __init__(self):
+        self.fills = {}
+        self.OpenQuantity = 0
+        self.OrderFilled = 0
+        self.Notional = 0
+        self.UnrealPnl = 0
+        self.RealPnl = 0
+        self.Partials = 0
+
+    def add(self, fill):
+        self.fills[fill] = None
+        self.OrderFilled += fill.OrderFilled
+        self.UnrealPnl += fill.UnrealPnl
+        self.apply(fill, fill.OpenQuantity, fill.RealPnl, fill.BookedPartial)
+
+    def apply(self, fill, open_quantity, real_pnl, partial, sign=1):
+        self.Notional += sign * abs(open_quantity) * fill.PriceLevel
+        self.OpenQuantity += sign * open_quantity
+        self.RealPnl += sign * real_pnl
+        self.Partials += sign * bool(partial)
+
+    def snapshot(self):
+        '''
+        @returns Fill
+        '''
+        fills = self.fills
+        first = next(iter(fills))
+        last = next(reversed(fills))
+        position = copy.copy(first)
+        if self.OpenQuantity:
+            position.PriceLevel = self.Notional / abs(self.OpenQuantity)
+        position.OrderFilled = self.OrderFilled
+        position.OpenQuantity = self.OpenQuantity
+        position.BookedPartial = int(self.Partials > 0)
+        position.Offsets = list(itertools.chain.from_iterable(f.Offsets for f in fills))
+        position.UnrealPnl = self.UnrealPnl
+        position.RealPnl = self.RealPnl
+        # store the most recent ExecID, ClOrderID
+        position.ExecID = last.ExecID
+        position.ClOrderID = last.ClOrderID
+        return position
+
+
+class OpenPositions:
+    '''
+    OrderID -> OrderPosition index over the fills that are not booked
+    '''
+    def __init__(self):
+        self.orders = {}
+        # while orders are keyed in TransactionTime order snapshot needs no sort
+        self.ordered = True
+        self.last = None
+
+    def __len__(self):
+        return len(self.orders)
+
+    def add(self, fill):
+        '''
+        fill -> Fill
+        '''
+        position = self.orders.get(fill.OrderID)
+        if position is None:
+            position = self.orders[fill.OrderID] = OrderPosition()
+            if self.ordered:
+                t = fill.TransactionTime
+                if self.last is not None and t < self.last:
+                    self.ordered = False
+                self.last = t
+        position.add(fill)
+
+    def refresh(self, fill, open_quantity, real_pnl, partial):
+        '''
+        re-aggregate a fill after it was (partially) booked
+        fill -> Fill
+        open_quantity, real_pnl, partial -> fill state before booking
+        '''
+        position = self.orders.get(fill.OrderID)
+        if position is None or fill not in position.fills:
+            return
+        if fill.Booked:
+            # the next fill of the order becomes its snapshot and its TransactionTime is later
+            first = next(iter(position.fills)) is fill
+            del position.fills[fill]
+            if not position.fills:
+                del self.orders[fill.OrderID]
+                if not self.orders:
+                    self.ordered, self.last = True, None
+                return
+            if first:
+                self.ordered = False
+            position.OrderFilled -= fill.OrderFilled
+            position.UnrealPnl -= fill.UnrealPnl
+            position.apply(fill, open_quantity, real_pnl, partial, sign=-1)
+            return
+        position.Notional += (abs(fill.OpenQuantity) - abs(open_quantity)) * fill.PriceLevel
+        position.OpenQuantity += fill.OpenQuantity - open_quantity
+        position.RealPnl += fill.RealPnl - real_pnl
+        position.Partials += bool(fill.BookedPartial) - bool(partial)
+
+    def snapshot(self):
+        '''
+        @returns List
+        '''
+        positions = [p.snapshot() for p in self.orders.values()]
+        if self.ordered:
+            return positions
+        return sorted(positions, key=lambda x: x.TransactionTime)
@@ -0,0 +1,166 @@
+import time
+from array import array
+
+COLUMNS = ('time', 'net_position', 'realized_pnl', 'unrealized_pnl', 'total_pnl', 'pnl')
+
+
+class Ring:
+    '''
+    preallocated columns of fixed capacity, the oldest row is overwritten
+    when full, one array per column in COLUMNS
+    '''
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.columns = {name: array('d', bytes(8 * capacity)) for name in COLUMNS}
+        self.head = 0   # next row written
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def last(self):
+        '''
+        @returns int index of the newest row
+        '''
+        return (self.head - 1) % self.capacity
+
+    def push(self, row):
+        '''
+        row -> values in COLUMNS order
+        @returns Tuple of the row overwritten, None while the ring is filling
+        '''
+        i = self.head
+        evicted = None
+        if self.count == self.capacity:
+            evicted = tuple(c[i] for c in self.columns.values())
+        else:
+            self.count += 1
+        for c, value in zip(self.columns.values(), row):
+            c[i] = value
+        self.head = (i + 1) % self.capacity
+        return evicted
+
+    def column(self, name):
+        '''
+        @returns array of the column, oldest row first
+        '''
+        c = self.columns[name]
+        if self.count < self.capacity:
+            return c[:self.count]
+        return c[self.head:] + c[:self.head]
+
+
+class Series:
+    '''
+    intraday position and pnl of a Blotter sampled after every update and
+    mark into bounded rings, level 0 holds the latest rows and every factor
+    rows it overwrites are folded into one row of the next level, so older
+    history is kept at a coarser resolution in a fixed amount of memory
+
+    with bucket seconds, samples falling in the same bucket replace the
+    last row instead of adding one; pnl is the change in total_pnl over a
+    row, the high-water mark and max drawdown of total_pnl are kept as
+    samples arrive
+    Example:
+        blotter = Blotter('ZCN19', series=Series(capacity=390, bucket=60))
+        blotter.series.column('total_pnl')
+        blotter.series.max_drawdown
+    '''
+    def __init__(self, capacity=1024, bucket=None, levels=3, factor=10, clock=time.time):
+        '''
+        capacity -> rows per level
+        bucket -> seconds per level 0 row, None keeps every sample
+        levels -> number of rings, 1 drops the rows level 0 overwrites
+        factor -> level k rows folded into one row of level k + 1
+        clock -> callable returning seconds
+        '''
+        if capacity < 1 or levels < 1 or factor < 1:
+            raise ValueError(f'Series needs capacity, levels and factor >= 1, got {capacity}, {levels}, {factor}')
+        self.bucket = bucket
+        self.factor = factor
+        self.clock = clock
+        self.levels = [Ring(capacity) for _ in range(levels)]
+        # rows waiting to be folded into each level above 0
+        self.pending = [None] * levels
+        self.folded = [0] * levels
+        self.key = None     # bucket of the newest level 0 row
+        self.base = 0       # total_pnl at the end of the row before the newest
+        self.last_total = 0
+        self.samples = 0
+        self.high_water = 0
+        self.max_drawdown = 0
+
+    def __len__(self):
+        return len(self.levels[0])
+
+    def __str__(self):
+        return f'>{self.__class__.__name__.upper()}|' + \
+               f'{self.samples}|' + \
+               f'{len(self)}|' + \
+               f'{round(self.high_water, 2)}|' + \
+               f'{round(self.max_drawdown, 2)}|'
+
+    def __repr__(self):
+        return self.__str__()
+
+    def sample(self, blotter):
+        '''
+        record the blotter totals now
+        blotter -> Blotter
+        '''
+        now = self.clock()
+        total = blotter.total_pnl
+        self.samples += 1
+        if total > self.high_water:
+            self.high_water = total
+        elif self.high_water - total > self.max_drawdown:
+            self.max_drawdown = self.high_water - total
+        key = None if self.bucket is None else now // self.bucket
+        ring = self.levels[0]
+        if key is not None and key == self.key:
+            # the same bucket, its row ends at this sample
+            i = ring.last()
+            for name, value in zip(COLUMNS, (now, blotter.net_position, blotter.realized_pnl,
+                                             blotter.unrealized_pnl, total, total - self.base)):
+                ring.columns[name][i] = value
+        else:
+            self.key = key
+            self.base = self.last_total
+            evicted = ring.push((now, blotter.net_position, blotter.realized_pnl,
+                                 blotter.unrealized_pnl, total, total - self.base))
+            if evicted is not None:
+                self.fold(1, evicted)
+        self.last_total = total
+
+    def fold(self, level, row):
+        '''
+        merge row into the one being built for level, the merged row keeps
+        the newest values and the summed pnl
+        '''
+        if level == len(self.levels):
+            return
+        pending = self.pending[level]
+        if pending is None:
+            self.pending[level] = row
+        else:
+            self.pending[level] = row[:-1] + (pending[-1] + row[-1],)
+        self.folded[level] += 1
+        if self.folded[level] == self.factor:
+            evicted = self.levels[level].push(self.pending[level])
+            self.pending[level] = None
+            self.folded[level] = 0
+            if evicted is not None:
+                self.fold(level + 1, evicted)
+
+    def column(self, name, level=0):
+        '''
+        name -> one of COLUMNS
+        @returns array of the rows held at level, oldest first
+        '''
+        return self.levels[level].column(name)
+
+    def rows(self, level=0):
+        '''
+        @returns List of Tuple in COLUMNS order, oldest first
+        '''
+        return list(zip(*(self.column(name, level) for name in COLUMNS)))
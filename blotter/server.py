@@ -0,0 +1,313 @@
+import json
+import time
+import struct
+import random
+import asyncio
+
+from .fill import Fill
+from .portfolio import Portfolio
+from .conflate import Conflator
+from .stream import parse_time
+from .log import Logger, LOGGING_ENABLED
+
+FRAME = struct.Struct('>I')
+MAX_FRAME = 16 * 1024 * 1024
+# fire and forget, every other message type gets a reply
+INGEST = ('fill', 'fills', 'price')
+
+
+def parse_address(address):
+    '''
+    address -> 'host:port', or 'unix:/path' / a path for a unix socket
+    @returns Tuple of (host, port, path)
+    '''
+    if address.startswith('unix:'):
+        return None, None, address[5:]
+    if '/' in address:
+        return None, None, address
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port), None
+
+
+async def read_frame(reader):
+    '''
+    @returns Dict, None at end of stream
+    '''
+    try:
+        header = await reader.readexactly(FRAME.size)
+    except asyncio.IncompleteReadError:
+        return None
+    size = FRAME.unpack(header)[0]
+    if size > MAX_FRAME:
+        raise ValueError(f'Frame of {size} bytes exceeds {MAX_FRAME}')
+    message = json.loads(await reader.readexactly(size))
+    if not isinstance(message, dict):
+        raise ValueError(f'Expected a json object, received {type(message).__name__}')
+    return message
+
+
+def _default(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+def write_frame(writer, message):
+    data = json.dumps(message, default=_default).encode()
+    writer.write(FRAME.pack(len(data)) + data)
+
+
+class BlotterServer:
+    '''
+    asyncio service around a Portfolio, clients send length prefixed json
+    frames of fills and prices that one ingest task applies in batches,
+    queries are answered between batches in the order they were sent
+    Example:
+        server = BlotterServer(contracts)
+        await server.start('127.0.0.1:7070')
+        await server.serve_forever()
+    '''
+    def __init__(self, contracts=None, portfolio=None, batch_size=1024, queue_size=8192, **kwargs):
+        '''
+        contracts, kwargs -> Portfolio arguments when no portfolio is given
+        batch_size -> messages applied between two yields to the event loop
+        queue_size -> messages buffered before readers stop reading their sockets
+        '''
+        self.portfolio = Portfolio(contracts, **kwargs) if portfolio is None else portfolio
+        self.conflator = Conflator(self.portfolio)
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.queue = None
+        self.server = None
+        self.ingest_task = None
+        self.fills = 0
+        self.prices = 0
+        self.errors = 0
+        self.logger = Logger(self.__class__.__name__)
+
+    async def start(self, address='127.0.0.1:0'):
+        '''
+        address -> see parse_address, port 0 picks a free port
+        @returns str address the server listens on
+        '''
+        self.queue = asyncio.Queue(self.queue_size)
+        self.ingest_task = asyncio.create_task(self.ingest())
+        host, port, path = parse_address(address)
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.handle_connection, path)
+            address = f'unix:{path}'
+        else:
+            self.server = await asyncio.start_server(self.handle_connection, host, port)
+            address = '%s:%s' % self.server.sockets[0].getsockname()[:2]
+        if LOGGING_ENABLED:
+            self.logger.info(f'LISTENING {address}')
+        return address
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.ingest_task is not None:
+            await self.queue.join()
+            self.ingest_task.cancel()
+        self.conflator.flush()
+
+    async def handle_connection(self, reader, writer):
+        queue = self.queue
+        try:
+            while True:
+                message = await read_frame(reader)
+                if message is None:
+                    break
+                if message.get('type') in INGEST:
+                    # blocks while the queue is full, so a fast client is throttled by its socket
+                    await queue.put((message, None))
+                else:
+                    reply = asyncio.get_running_loop().create_future()
+                    await queue.put((message, reply))
+                    write_frame(writer, await reply)
+                    await writer.drain()
+        except (ValueError, ConnectionError) as e:
+            if LOGGING_ENABLED:
+                self.logger.error(f'Closing connection: {e!r}')
+        finally:
+            writer.close()
+
+    async def ingest(self):
+        queue = self.queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            for message, reply in batch:
+                try:
+                    result = self.apply(message)
+                except Exception as e: # one bad message must not stop the ingest task
+                    result = self.reject(message.get('type'), e)
+                if reply is not None and not reply.done():
+                    reply.set_result(result)
+            try:
+                self.conflator.flush()
+            except Exception as e:
+                self.reject('price', e)
+            for _ in batch:
+                queue.task_done()
+            await asyncio.sleep(0)
+
+    def apply(self, message):
+        '''
+        message -> Dict with a type of fill, fills, price, snapshot or positions
+        @returns Dict reply for queries
+        '''
+        kind = message.get('type')
+        try:
+            if kind == 'fill':
+                self.add_row(message.get('OrderID'), message.get('ExchangeTicker'), message.get('PriceLevel'),
+                             message.get('OrderFilled'), message.get('TransactionTime'))
+            elif kind == 'fills':
+                add_row = self.add_row
+                for row in message['rows']:
+                    try:
+                        add_row(*row)
+                    except (ValueError, TypeError) as e:
+                        self.reject(kind, e)
+            elif kind == 'price':
+                price = float(message['PriceLevel'])
+                self.prices += 1
+                self.conflator.update_from_marketdata(message['ExchangeTicker'], price)
+            elif kind == 'snapshot':
+                self.conflator.flush()
+                return self.snapshot(message.get('ExchangeTicker'))
+            elif kind == 'positions':
+                self.conflator.flush()
+                return self.positions(message['ExchangeTicker'])
+            else:
+                raise ValueError(f'Unknown message type {kind!r}')
+        except (ValueError, TypeError, KeyError) as e:
+            return self.reject(kind, e)
+
+    def reject(self, kind, error):
+        self.errors += 1
+        if LOGGING_ENABLED:
+            self.logger.error(f'Rejected {kind} message: {error!r}')
+        return {'type': 'error', 'message': str(error)}
+
+    def add_row(self, orderid, ticker, pricelevel, orderfilled, transactiontime=None):
+        fill = Fill.create(orderid, ticker, pricelevel, orderfilled, TransactionTime=parse_time(transactiontime))
+        self.portfolio.add_fill(fill)
+        self.fills += 1
+
+    def snapshot(self, ticker=None):
+        p = self.portfolio
+        if ticker is None:
+            blotters = list(p)
+        else:
+            blotters = [p[ticker]] if ticker in p else []
+        return {'type': 'snapshot',
+                'fills': self.fills, 'prices': self.prices, 'errors': self.errors,
+                'dropped': self.conflator.dropped, 'pending': self.queue.qsize(),
+                'portfolio': {'blotters': len(p), 'net_position': p.net_position,
+                              'gross_position': p.gross_position, 'net_exposure': p.net_exposure,
+                              'gross_exposure': p.gross_exposure, 'realized_pnl': p.realized_pnl,
+                              'unrealized_pnl': p.unrealized_pnl, 'total_pnl': p.total_pnl},
+                'blotters': [{'ticker': b.ticker, 'net_position': b.net_position,
+                              'avg_open_price': b.avg_open_price, 'realized_pnl': b.realized_pnl,
+                              'unrealized_pnl': b.unrealized_pnl, 'total_pnl': b.total_pnl}
+                             for b in blotters]}
+
+    def positions(self, ticker):
+        positions = self.portfolio[ticker].get_open_positions() if ticker in self.portfolio else []
+        return {'type': 'positions', 'ExchangeTicker': ticker,
+                'positions': [{'OrderID': f.OrderID, 'ExecID': f.ExecID, 'PriceLevel': f.PriceLevel,
+                               'OrderFilled': f.OrderFilled, 'OpenQuantity': f.OpenQuantity,
+                               'RealPnl': f.RealPnl, 'BookedPartial': f.BookedPartial,
+                               'TransactionTime': f.TransactionTime} for f in positions]}
+
+
+async def serve(address, contracts=None, **kwargs):
+    '''
+    run a BlotterServer until cancelled
+    '''
+    server = BlotterServer(contracts, **kwargs)
+    print(f'listening on {await server.start(address)}', flush=True)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+class BlotterClient:
+    '''
+    asyncio client for BlotterServer
+    Example:
+        client = await BlotterClient.connect('127.0.0.1:7070')
+        await client.fill(1, 'ZCN19', 3.7025, 2)
+        await client.snapshot()
+    '''
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, address):
+        host, port, path = parse_address(address)
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def send(self, message):
+        write_frame(self.writer, message)
+        await self.writer.drain()
+
+    async def request(self, message):
+        await self.send(message)
+        return await read_frame(self.reader)
+
+    async def fill(self, orderid, ticker, pricelevel, orderfilled, transactiontime=None):
+        await self.send({'type': 'fill', 'OrderID': orderid, 'ExchangeTicker': ticker,
+                         'PriceLevel': pricelevel, 'OrderFilled': orderfilled,
+                         'TransactionTime': transactiontime})
+
+    async def fills(self, rows):
+        '''
+        rows -> List of [orderid, ticker, pricelevel, orderfilled[, transactiontime]]
+        '''
+        await self.send({'type': 'fills', 'rows': rows})
+
+    async def price(self, ticker, last_price):
+        await self.send({'type': 'price', 'ExchangeTicker': ticker, 'PriceLevel': last_price})
+
+    async def snapshot(self, ticker=None):
+        return await self.request({'type': 'snapshot', 'ExchangeTicker': ticker})
+
+    async def positions(self, ticker):
+        return await self.request({'type': 'positions', 'ExchangeTicker': ticker})
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def generate_load(address, fills=100000, tickers=10, batch_size=500, price_every=10, seed=None):
+    '''
+    send random fills and prices to a BlotterServer
+    @returns Tuple of (fills per second, snapshot reply)
+    '''
+    rng = random.Random(seed)
+    names = [f'T{i:04d}' for i in range(tickers)]
+    client = await BlotterClient.connect(address)
+    start = time.perf_counter()
+    for first in range(0, fills, batch_size):
+        rows = [[first + i, rng.choice(names), round(100 + rng.randint(-40, 40) * 0.25, 2), rng.choice((-3, -2, -1, 1, 2, 3))]
+                for i in range(min(batch_size, fills - first))]
+        await client.fills(rows)
+        if price_every and not (first // batch_size) % price_every:
+            await client.price(rng.choice(names), round(100 + rng.randint(-40, 40) * 0.25, 2))
+    snapshot = await client.snapshot()
+    elapsed = time.perf_counter() - start
+    await client.close()
+    return fills / elapsed, snapshot
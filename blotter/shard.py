@@ -0,0 +1,261 @@
+import zlib
+import collections
+import multiprocessing
+
+from .fill import Fill, _exec_ids
+from .directions import DIRECTIONS
+from .portfolio import Portfolio
+from .log import Logger, LOGGING_ENABLED
+
+SUMMARY = ('ticker', 'net_position', 'avg_open_price', 'realized_pnl', 'unrealized_pnl', 'total_pnl')
+
+
+class BlotterSummary(collections.namedtuple('BlotterSummary', SUMMARY)):
+    '''
+    totals of one Blotter living in a worker process
+    '''
+    __slots__ = ()
+
+    @property
+    def net_direction(self):
+        if not self.net_position:
+            return DIRECTIONS.FLAT
+        return DIRECTIONS.LONG if self.net_position > 0 else DIRECTIONS.SHORT
+
+    def __str__(self):
+        avg_open_price = round(self.avg_open_price, 6) if self.avg_open_price else 'None'
+        return '>BLOTTER|' + \
+               f'{self.net_direction.name}|' + \
+               f'{abs(self.net_position)}|' + \
+               f'{self.ticker}|' + \
+               f'{avg_open_price}|' + \
+               f'{round(self.total_pnl, 2)}|' + \
+               '|'
+
+
+def shard_of(ticker, shards):
+    '''
+    stable across processes, unlike hash()
+    @returns int
+    '''
+    return zlib.crc32(str(ticker).encode()) % shards
+
+
+def _serve(conn, contracts, kwargs):
+    '''
+    worker loop: one Portfolio fed by batches of fill rows over a pipe
+    '''
+    portfolio = Portfolio(contracts, **kwargs)
+    add_fill, create = portfolio.add_fill, Fill.create
+    error = None
+    while True:
+        kind, payload = conn.recv()
+        if kind == 'fills':
+            if error is None:
+                try:
+                    for orderid, ticker, price, quantity, transactiontime, execid, clorderid in payload:
+                        add_fill(create(orderid, ticker, price, quantity, ClOrderID=clorderid,
+                                        ExecID=execid, TransactionTime=transactiontime))
+                except Exception as e:
+                    error = e
+        elif kind == 'mark':
+            if error is None:
+                try:
+                    portfolio.mark(payload)
+                except Exception as e:
+                    error = e
+        elif kind == 'snapshot':
+            summaries = [BlotterSummary(b.ticker, b.net_position, b.avg_open_price, b.realized_pnl,
+                                        b.unrealized_pnl, b.total_pnl) for b in portfolio]
+            totals = (portfolio.net_position, portfolio.gross_position, portfolio.net_exposure,
+                      portfolio.gross_exposure, portfolio.realized_pnl, portfolio.unrealized_pnl)
+            conn.send(error or (summaries, totals))
+        elif kind == 'positions':
+            positions = []
+            if error is None and payload in portfolio:
+                positions = portfolio[payload].get_open_positions()
+                for p in positions:
+                    p.Offsets = []
+            conn.send(error or positions)
+        elif kind == 'stop':
+            conn.close()
+            return
+
+
+class ShardedPortfolio:
+    '''
+    partitions fills by ExchangeTicker over worker processes that each hold a
+    Portfolio, fills go out in batches over one pipe per worker so every
+    ticker keeps its arrival order
+    Example:
+        with ShardedPortfolio(workers=4) as portfolio:
+            portfolio.add_fill(fill)
+            portfolio.snapshot()
+    '''
+    def __init__(self, contracts=None, workers=None, batch_size=4096, **kwargs):
+        '''
+        contracts -> Dict of ticker -> Blotter kwargs, as for Portfolio
+        workers -> number of processes, defaults to the cpu count
+        batch_size -> fills buffered per worker before they are sent
+        kwargs -> passed to every Blotter, must be picklable
+        '''
+        if 'journal' in kwargs or 'ledger' in kwargs or 'snapshots' in kwargs or 'events' in kwargs:
+            raise ValueError('journal, ledger, snapshots and events are per process and not supported by ShardedPortfolio')
+        self.workers = workers or multiprocessing.cpu_count()
+        self.batch_size = batch_size
+        self.batches = [[] for _ in range(self.workers)]
+        self.shards = {}
+        self.conns = []
+        self.processes = []
+        for _ in range(self.workers):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_serve, args=(child, contracts, kwargs), daemon=True)
+            process.start()
+            child.close()
+            self.conns.append(parent)
+            self.processes.append(process)
+        #
+        self.summaries = []
+        self.net_position = 0
+        self.gross_position = 0
+        self.net_exposure = 0
+        self.gross_exposure = 0
+        self.realized_pnl = 0
+        self.unrealized_pnl = 0
+        self.total_pnl = 0
+        self.logger = Logger(self.__class__.__name__)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __str__(self):
+        return f'>{self.__class__.__name__.upper()}|' + \
+               f'{len(self.summaries)}|' + \
+               f'{self.gross_position}|' + \
+               f'{round(self.net_exposure, 2)}|' + \
+               f'{round(self.gross_exposure, 2)}|' + \
+               f'{round(self.total_pnl, 2)}|' + \
+               f'|'
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def shard(self, ticker):
+        shard = self.shards.get(ticker)
+        if shard is None:
+            shard = self.shards[ticker] = shard_of(ticker, self.workers)
+        return shard
+
+    def add_row(self, orderid, ticker, pricelevel, orderfilled, transactiontime=None, execid=None, clorderid=None):
+        '''
+        queue one fill for its ticker's worker, ids default as in Fill.create
+        @returns ShardedPortfolio
+        '''
+        shard = self.shards.get(ticker)
+        if shard is None:
+            shard = self.shard(ticker)
+        batch = self.batches[shard]
+        batch.append((orderid, ticker, pricelevel, orderfilled, transactiontime,
+                      next(_exec_ids) if execid is None else execid, clorderid))
+        if len(batch) >= self.batch_size:
+            self.send(shard)
+        return self
+
+    def add_fill(self, fill):
+        '''
+        fill -> Fill
+        @returns ShardedPortfolio
+        '''
+        return self.add_row(fill.OrderID, fill.ExchangeTicker, fill.PriceLevel, fill.OrderFilled,
+                            fill.TransactionTime, fill.ExecID, fill.ClOrderID)
+
+    def update(self, fill):
+        return self.add_fill(fill)
+
+    def initialize_from_list(self, fills:list):
+        for f in fills:
+            self.add_fill(f)
+        return self
+
+    def send(self, shard):
+        batch = self.batches[shard]
+        if batch:
+            self.conns[shard].send(('fills', batch))
+            self.batches[shard] = []
+
+    def flush(self):
+        for shard in range(self.workers):
+            self.send(shard)
+
+    def mark(self, prices):
+        '''
+        prices -> Dict of ticker -> price
+        @returns ShardedPortfolio
+        '''
+        by_shard = collections.defaultdict(dict)
+        for ticker, price in prices.items():
+            by_shard[self.shard(ticker)][ticker] = price
+        for shard, marks in by_shard.items():
+            self.send(shard)
+            self.conns[shard].send(('mark', marks))
+        return self
+
+    def update_from_marketdata(self, ticker, last_price):
+        return self.mark({ticker: last_price})
+
+    def check(self, shard, reply):
+        if isinstance(reply, Exception):
+            if LOGGING_ENABLED:
+                self.logger.error(f'Worker {shard} failed: {reply!r}')
+            raise reply
+        return reply
+
+    def request(self, shard, kind, payload=None):
+        conn = self.conns[shard]
+        conn.send((kind, payload))
+        return self.check(shard, conn.recv())
+
+    def snapshot(self):
+        '''
+        gather the totals of every Blotter and refresh the aggregates
+        @returns List of BlotterSummary sorted by ticker
+        '''
+        self.flush()
+        for conn in self.conns:
+            conn.send(('snapshot', None))
+        replies = [conn.recv() for conn in self.conns]
+        summaries, totals = [], [0] * 6
+        for shard, reply in enumerate(replies):
+            reply = self.check(shard, reply)
+            summaries.extend(reply[0])
+            totals = [a + b for a, b in zip(totals, reply[1])]
+        self.summaries = sorted(summaries, key=lambda s: s.ticker)
+        self.net_position, self.gross_position, self.net_exposure, \
+            self.gross_exposure, self.realized_pnl, self.unrealized_pnl = totals
+        self.total_pnl = self.realized_pnl + self.unrealized_pnl
+        return self.summaries
+
+    def get_open_positions(self, ticker):
+        '''
+        @returns List of Fill, without Offsets
+        '''
+        shard = self.shard(ticker)
+        self.send(shard)
+        return self.request(shard, 'positions', ticker)
+
+    def close(self):
+        if not self.processes:
+            return
+        self.flush()
+        for conn in self.conns:
+            conn.send(('stop', None))
+            conn.close()
+        for process in self.processes:
+            process.join()
+        self.conns, self.processes = [], []
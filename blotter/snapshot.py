@@ -0,0 +1,232 @@
+import math
+import time
+import struct
+import collections
+from multiprocessing import shared_memory
+
+MAGIC = b'BLOTSNP1'
+# magic, capacity, rows in use
+HEADER = struct.Struct('<8sII')
+HEADER_SIZE = 64
+SEQ = struct.Struct('<Q')
+TICKER = struct.Struct('<32s')
+# net_position, avg_open_price, realized_pnl, unrealized_pnl, total_pnl
+VALUES = struct.Struct('<5d')
+# seqlock counter, ticker written once when the row is added, then the values
+TICKER_OFFSET = SEQ.size
+VALUES_OFFSET = SEQ.size + TICKER.size
+# padded to two cache lines
+ROW_SIZE = 128
+# segments created in this process or inherited from a forked parent, they
+# share its resource tracker, which must keep the creator's registration
+CREATED = set()
+
+Snapshot = collections.namedtuple('Snapshot', ('ticker', 'net_position', 'avg_open_price', 'realized_pnl',
+                                               'unrealized_pnl', 'total_pnl', 'updates'))
+
+
+class SnapshotTable:
+    '''
+    fixed layout table of Blotter totals in shared memory, one row per
+    ticker rewritten in place after every update, for readers in other
+    processes (SnapshotReader)
+
+    each row starts with a seqlock counter, the writer makes it odd while
+    it rewrites the row and even again after, so a reader retries a row
+    read while it changed instead of taking a lock and half the counter is
+    the row's sequence number; a single process writes the table
+    Example:
+        table = SnapshotTable('blotter-snapshots', capacity=512)
+        portfolio = Portfolio(snapshots=table)
+        SnapshotReader('blotter-snapshots').read('ZCN19')
+    '''
+    def __init__(self, name=None, capacity=1024):
+        '''
+        name -> shared memory name, None picks one (see name)
+        capacity -> most tickers the table holds
+        '''
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(name, create=True, size=HEADER_SIZE + capacity * ROW_SIZE)
+        self.name = self.shm.name
+        CREATED.add(self.name)
+        self.buf = self.shm.buf
+        self.index = {}
+        self.seqs = []
+        HEADER.pack_into(self.buf, 0, MAGIC, capacity, 0)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __str__(self):
+        return f'>{self.__class__.__name__.upper()}|' + \
+               f'{self.name}|' + \
+               f'{len(self)}|' + \
+               f'{self.capacity}|'
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, blotter):
+        '''
+        reserve the blotter's row, once when the Blotter is built so a full
+        table or a long ticker is refused before any fill is booked
+        blotter -> Blotter
+        @returns int row of the blotter's ticker
+        '''
+        ticker = blotter.ticker
+        row = self.index.get(ticker)
+        if row is not None:
+            return row
+        row = len(self.index)
+        if row == self.capacity:
+            raise ValueError(f'SnapshotTable {self.name} is full ({self.capacity} tickers)')
+        encoded = str(ticker).encode()
+        if len(encoded) > TICKER.size:
+            raise ValueError(f'Ticker {ticker!r} is longer than {TICKER.size} bytes')
+        offset = HEADER_SIZE + row * ROW_SIZE
+        SEQ.pack_into(self.buf, offset, 0)
+        TICKER.pack_into(self.buf, offset + TICKER_OFFSET, encoded)
+        VALUES.pack_into(self.buf, offset + VALUES_OFFSET, 0, math.nan, 0, 0, 0)
+        self.index[ticker] = row
+        self.seqs.append(0)
+        # readers only look at rows below the count, so the row is written first
+        HEADER.pack_into(self.buf, 0, MAGIC, self.capacity, row + 1)
+        return row
+
+    def publish(self, blotter):
+        '''
+        rewrite the blotter's row
+        blotter -> Blotter added to the table
+        '''
+        row = self.index[blotter.ticker]
+        offset = HEADER_SIZE + row * ROW_SIZE
+        seq = self.seqs[row] + 1
+        avg_open_price = blotter.avg_open_price
+        SEQ.pack_into(self.buf, offset, seq)
+        VALUES.pack_into(self.buf, offset + VALUES_OFFSET, blotter.net_position,
+                         math.nan if avg_open_price is None else avg_open_price, blotter.realized_pnl,
+                         blotter.unrealized_pnl, blotter.total_pnl)
+        self.seqs[row] = seq + 1
+        SEQ.pack_into(self.buf, offset, seq + 1)
+
+    def close(self, unlink=True):
+        '''
+        unlink -> also remove the shared memory, readers attached keep their mapping
+        '''
+        self.buf = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+            CREATED.discard(self.name)
+
+
+def attach(name):
+    '''
+    open an existing segment without leaving it registered with the resource
+    tracker, which would unlink it from under the writer when this process exits
+    @returns SharedMemory
+    '''
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError: # before python 3.13, only this segment is taken back from the tracker
+        pass
+    shm = shared_memory.SharedMemory(name)
+    if shm.name not in CREATED:
+        shared_memory.resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+class SnapshotReader:
+    '''
+    reads a SnapshotTable published by another process without locking it
+    Example:
+        reader = SnapshotReader('blotter-snapshots')
+        reader.read('ZCN19').total_pnl
+        reader.read_all()
+    '''
+    def __init__(self, name, spins=1000):
+        '''
+        name -> SnapshotTable.name
+        spins -> retries of a row before yielding the cpu to the writer
+        '''
+        self.shm = attach(name)
+        self.name = name
+        self.buf = self.shm.buf
+        self.spins = spins
+        magic, self.capacity, _ = HEADER.unpack_from(self.buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{name} is not a SnapshotTable')
+        self.index = {}
+
+    def __len__(self):
+        return HEADER.unpack_from(self.buf, 0)[2]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def read_row(self, row):
+        '''
+        @returns Snapshot of a consistent version of row
+        '''
+        offset = HEADER_SIZE + row * ROW_SIZE
+        buf, spins = self.buf, 0
+        while True:
+            seq = SEQ.unpack_from(buf, offset)[0]
+            if not seq & 1:
+                values = VALUES.unpack_from(buf, offset + VALUES_OFFSET)
+                if SEQ.unpack_from(buf, offset)[0] == seq:
+                    break
+            spins += 1
+            if spins % self.spins == 0:
+                time.sleep(0)
+        net_position, avg_open_price, realized_pnl, unrealized_pnl, total_pnl = values
+        return Snapshot(self.ticker(row), net_position,
+                        None if math.isnan(avg_open_price) else avg_open_price,
+                        realized_pnl, unrealized_pnl, total_pnl, seq // 2)
+
+    def ticker(self, row):
+        ticker = TICKER.unpack_from(self.buf, HEADER_SIZE + row * ROW_SIZE + TICKER_OFFSET)[0]
+        return ticker.rstrip(b'\0').decode()
+
+    def refresh(self):
+        '''
+        index the rows added since the last refresh
+        '''
+        for row in range(len(self.index), len(self)):
+            self.index[self.ticker(row)] = row
+
+    def read(self, ticker):
+        '''
+        ticker -> str
+        @returns Snapshot or None when the ticker was never published
+        '''
+        row = self.index.get(ticker)
+        if row is None:
+            self.refresh()
+            row = self.index.get(ticker)
+            if row is None:
+                return None
+        return self.read_row(row)
+
+    def read_all(self):
+        '''
+        @returns Dict of ticker -> Snapshot
+        '''
+        snapshots = {}
+        for row in range(len(self)):
+            snapshot = self.read_row(row)
+            snapshots[snapshot.ticker] = snapshot
+        return snapshots
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
@@ -0,0 +1,168 @@
+import time
+import bisect
+import functools
+
+# microseconds
+LATENCY = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 50000, 100000)
+DEPTH = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+class Histogram:
+    '''
+    bucket i counts the values <= bounds[i] that no earlier bucket took,
+    the last bucket everything above
+    '''
+    __slots__ = ('bounds', 'counts', 'count', 'sum', 'max')
+
+    def __init__(self, bounds=LATENCY):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        '''
+        @returns upper bound of the bucket holding the q-th value, max for the overflow bucket
+        '''
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {'count': self.count, 'sum': self.sum, 'max': self.max,
+                'p50': self.quantile(0.5), 'p99': self.quantile(0.99),
+                'buckets': dict(zip(self.bounds + ('+Inf',), self.counts))}
+
+
+class Stats:
+    '''
+    counters, gauges and histograms recorded by an instrumented Blotter,
+    one Stats may be shared by every Blotter of a Portfolio
+    Example:
+        stats = Stats()
+        blotter = Blotter('ZCN19', stats=stats)
+        stats.snapshot()['histograms']['update_us']['p99']
+        print(stats.prometheus())
+    '''
+    def __init__(self, labels=None):
+        '''
+        labels -> Dict added to every series of the prometheus dump
+        '''
+        self.labels = dict(labels or {})
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        # gauge name -> {owner: callable} summed when read
+        self.sources = {}
+
+    def incr(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        self.gauges[name] = value
+
+    def track(self, name, owner, f):
+        '''
+        gauge read from f() when a snapshot is taken, summed over owners
+        '''
+        self.sources.setdefault(name, {})[id(owner)] = f
+
+    def untrack(self, owner):
+        for sources in self.sources.values():
+            sources.pop(id(owner), None)
+
+    def read_gauges(self):
+        gauges = dict(self.gauges)
+        for name, sources in self.sources.items():
+            if sources:
+                gauges[name] = sum(f() for f in sources.values())
+        return gauges
+
+    def observe(self, name, value, bounds=LATENCY):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(bounds)
+        histogram.observe(value)
+
+    def timed(self, name, f):
+        '''
+        f -> callable
+        @returns callable recording the latency of f in microseconds as name
+        '''
+        clock, observe = time.perf_counter_ns, self.observe
+
+        @functools.wraps(f)
+        def wrap(*args, **kwargs):
+            start = clock()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                observe(name, (clock() - start) / 1000)
+        return wrap
+
+    def reset(self):
+        self.counters.clear()
+        self.gauges.clear()
+        self.histograms.clear()
+
+    def snapshot(self):
+        '''
+        @returns Dict of counters, gauges and histogram summaries
+        '''
+        return {'counters': dict(self.counters),
+                'gauges': self.read_gauges(),
+                'histograms': {k: h.snapshot() for k, h in self.histograms.items()}}
+
+    def prometheus(self, prefix='blotter'):
+        '''
+        @returns str in the prometheus text exposition format
+        '''
+        lines = []
+        for name, value in sorted(self.counters.items()):
+            lines.append(f'# TYPE {prefix}_{name}_total counter')
+            lines.append(f'{prefix}_{name}_total{_labels(self.labels)} {value}')
+        for name, value in sorted(self.read_gauges().items()):
+            lines.append(f'# TYPE {prefix}_{name} gauge')
+            lines.append(f'{prefix}_{name}{_labels(self.labels)} {value}')
+        for name, h in sorted(self.histograms.items()):
+            lines.append(f'# TYPE {prefix}_{name} histogram')
+            seen = 0
+            for bound, count in zip(h.bounds + ('+Inf',), h.counts):
+                seen += count
+                lines.append(f'{prefix}_{name}_bucket{_labels(self.labels, le=bound)} {seen}')
+            lines.append(f'{prefix}_{name}_sum{_labels(self.labels)} {h.sum}')
+            lines.append(f'{prefix}_{name}_count{_labels(self.labels)} {h.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels.items()) + '}'
+
+
+class TimedLogger:
+    '''
+    Logger proxy recording the time spent in every logging call
+    '''
+    def __init__(self, logger, stats, name='log_us'):
+        self.logger = logger
+        self.stats = stats
+        self.name = name
+
+    def __getattr__(self, attr):
+        return self.stats.timed(self.name, getattr(self.logger, attr))
@@ -0,0 +1,240 @@
+import datetime as dt
+from array import array
+
+from .fill import BaseFill, Fill, FIELDS, STATE
+
+
+EPOCH = dt.datetime(1970, 1, 1)
+
+
+def to_naive(value):
+    '''
+    value -> datetime, an aware one is converted to UTC
+    @returns naive datetime
+    '''
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(dt.timezone.utc).replace(tzinfo=None)
+
+
+def to_micros(value):
+    if value is None:
+        return 0
+    return (to_naive(value) - EPOCH) // dt.timedelta(microseconds=1)
+
+
+def _column(name):
+    def fget(self):
+        return getattr(self.store, name)[self.row]
+    def fset(self, value):
+        getattr(self.store, name)[self.row] = value
+    return property(fget, fset)
+
+
+def _timestamp(name):
+    '''
+    naive datetime stored as integer microseconds since EPOCH, 0 is None
+    '''
+    def fget(self):
+        value = getattr(self.store, name)[self.row]
+        if value:
+            return EPOCH + dt.timedelta(microseconds=value)
+    def fset(self, value):
+        getattr(self.store, name)[self.row] = to_micros(value)
+    return property(fget, fset)
+
+
+def _flag(name):
+    def fget(self):
+        return bool(getattr(self.store, name)[self.row])
+    def fset(self, value):
+        getattr(self.store, name)[self.row] = bool(value)
+    return property(fget, fset)
+
+
+class StoredOffsets:
+    '''
+    list-like view over the offset rows of one stored fill
+    '''
+    __slots__ = ('store', 'rows')
+
+    def __init__(self, store, rows):
+        self.store = store
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        store = self.store
+        return (StoredFill(store, r) for r in self.rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [StoredFill(self.store, r) for r in self.rows[i]]
+        return StoredFill(self.store, self.rows[i])
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def append(self, fill):
+        self.rows.append(fill.row)
+
+    def clear(self):
+        self.rows.clear()
+
+
+class StoredFill(BaseFill):
+    '''
+    Fill API over one row of a FillStore
+    '''
+    __slots__ = ('store', 'row')
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    OrderID = _column('OrderID')
+    ClOrderID = _column('ClOrderID')
+    ExecID = _column('ExecID')
+    PriceLevel = _column('PriceLevel')
+    OrderFilled = _column('OrderFilled')
+    ExchangeTicker = _column('ExchangeTicker')
+    TransactionTime = _timestamp('TransactionTime')
+    Booked = _flag('Booked')
+    BookedPartial = _flag('BookedPartial')
+    BookedPartialAt = _timestamp('BookedPartialAt')
+    OpenQuantity = _column('OpenQuantity')
+    UnrealPnl = _column('UnrealPnl')
+    RealPnl = _column('RealPnl')
+
+    @property
+    def BookedAt(self):
+        return True if self.store.BookedAt[self.row] else None
+
+    @BookedAt.setter
+    def BookedAt(self, value):
+        self.store.BookedAt[self.row] = bool(value)
+
+    @property
+    def Offsets(self):
+        offsets = self.store.Offsets
+        rows = offsets[self.row]
+        if rows is None:
+            rows = offsets[self.row] = self.store.pending_offsets(self.row)
+        return StoredOffsets(self.store, rows)
+
+    @Offsets.setter
+    def Offsets(self, fills):
+        self.store.Offsets[self.row] = [f.row for f in fills]
+
+    def __eq__(self, other):
+        return isinstance(other, StoredFill) and self.store is other.store and self.row == other.row
+
+    def __hash__(self):
+        return hash((id(self.store), self.row))
+
+    def __copy__(self):
+        '''
+        @returns Fill detached from the store
+        '''
+        fill = Fill.__new__(Fill)
+        for name in FIELDS + STATE:
+            setattr(fill, name, getattr(self, name))
+        fill.Offsets = list(fill.Offsets)
+        return fill
+
+
+class FillStore:
+    '''
+    struct-of-arrays fill container, rows are exposed as StoredFill
+    Example:
+        blotter = Blotter('ZCN19', store=FillStore())
+    '''
+    def __init__(self):
+        self.OrderID = []
+        self.ClOrderID = []
+        self.ExecID = []
+        self.ExchangeTicker = []
+        self.TransactionTime = array('q')
+        self.PriceLevel = array('d')
+        self.OrderFilled = array('d')
+        self.OpenQuantity = array('d')
+        self.UnrealPnl = array('d')
+        self.RealPnl = array('d')
+        self.Booked = array('b')
+        self.BookedPartial = array('b')
+        self.BookedAt = array('b')
+        self.BookedPartialAt = array('q')
+        self.Offsets = []
+        self.bulk_offsets = None
+
+    def __len__(self):
+        return len(self.OrderID)
+
+    def __iter__(self):
+        return (StoredFill(self, r) for r in range(len(self)))
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [StoredFill(self, r) for r in range(len(self))[i]]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('FillStore index out of range')
+        return StoredFill(self, i)
+
+    def append(self, fill):
+        '''
+        fill -> Fill
+        @returns StoredFill
+        '''
+        if isinstance(fill, StoredFill) and fill.store is self:
+            return fill
+        self.OrderID.append(fill.OrderID)
+        self.ClOrderID.append(fill.ClOrderID)
+        self.ExecID.append(fill.ExecID)
+        self.ExchangeTicker.append(fill.ExchangeTicker)
+        self.TransactionTime.append(to_micros(fill.TransactionTime))
+        self.PriceLevel.append(fill.PriceLevel)
+        self.OrderFilled.append(fill.OrderFilled)
+        self.OpenQuantity.append(fill.OpenQuantity)
+        self.UnrealPnl.append(fill.UnrealPnl)
+        self.RealPnl.append(fill.RealPnl)
+        self.Booked.append(bool(fill.Booked))
+        self.BookedPartial.append(bool(fill.BookedPartial))
+        self.BookedAt.append(bool(fill.BookedAt))
+        self.BookedPartialAt.append(to_micros(fill.BookedPartialAt))
+        self.Offsets.append(None)
+        return StoredFill(self, len(self.OrderID) - 1)
+
+    def pending_offsets(self, row):
+        '''
+        offsets of a bulk loaded row are only built when first read
+        @returns List
+        '''
+        if self.bulk_offsets is None:
+            return []
+        indptr, counterparts = self.bulk_offsets
+        if row + 1 >= len(indptr):
+            return []
+        return counterparts[indptr[row]:indptr[row + 1]].tolist()
+
+    def truncate(self, n):
+        '''
+        drop every row from n onwards
+        '''
+        for column in vars(self).values():
+            if isinstance(column, (list, array)):
+                del column[n:]
+        if n == 0:
+            self.bulk_offsets = None
@@ -0,0 +1,119 @@
+import csv
+import sys
+import json
+import time
+import datetime as dt
+
+from .fill import Fill
+from .store import to_naive
+from .portfolio import Portfolio, DEFAULTS
+from .shard import ShardedPortfolio
+
+COLUMNS = ('OrderID', 'ExchangeTicker', 'PriceLevel', 'OrderFilled', 'TransactionTime')
+
+
+def load_contracts(path):
+    '''
+    path -> json file of {ticker: {contract_multiplier, tick_value, tick_size}},
+            an optional "defaults" entry applies to unlisted tickers
+    @returns Dict
+    '''
+    with open(path) as f:
+        contracts = json.load(f)
+    defaults = dict(DEFAULTS, **contracts.pop('defaults', {}))
+    contracts = {k: dict(defaults, **v) for k,v in contracts.items()}
+    contracts['defaults'] = defaults
+    return contracts
+
+
+def read_csv(stream):
+    '''
+    stream -> file object of OrderID,ExchangeTicker,PriceLevel,OrderFilled[,TransactionTime]
+    @returns Generator of List, a row as soon as its line is read so a live pipe is not held back
+    '''
+    reader = csv.reader(stream)
+    for row in reader:
+        if row and row[0] == COLUMNS[0] and reader.line_num == 1:
+            continue
+        if row:
+            yield row
+
+
+def read_jsonl(stream):
+    '''
+    stream -> file object with one json object per line keyed like COLUMNS
+    @returns Generator of List, a row per line as it is read
+    '''
+    loads = json.loads
+    for line in stream:
+        if line.strip():
+            row = loads(line)
+            yield [row.get(k) for k in COLUMNS]
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+
+
+def parse_time(value):
+    '''
+    value -> ISO string or datetime, one with an offset is converted to naive UTC
+    @returns datetime or None
+    '''
+    if not value:
+        return None
+    if not isinstance(value, dt.datetime):
+        value = dt.datetime.fromisoformat(value)
+    return to_naive(value)
+
+
+def consume_stream(stream, fmt='csv', contracts=None, snapshot_every=None, snapshot_interval=None,
+                   out=sys.stdout, batch_size=4096, history=False, journal=None, ledger=None,
+                   workers=None):
+    '''
+    non-interactive ingestion of fills from a file object
+    stream -> file object
+    fmt -> 'csv' or 'jsonl'
+    contracts -> Dict from load_contracts
+    snapshot_every -> print blotters every N fills
+    snapshot_interval -> print blotters every N seconds
+    history -> keep booked fills in Blotter.trades, memory then grows with the stream
+    journal -> Journal, restored before the stream is read and appended to as it is
+    ledger -> Ledger receiving every FIFO match
+    batch_size -> fills sent to a shard worker at a time, rows are read and applied one at a time
+    workers -> shard tickers over this many processes, the caller closes the ShardedPortfolio
+    @returns Portfolio or ShardedPortfolio
+    '''
+    if workers:
+        if journal is not None or ledger is not None:
+            raise ValueError('journal and ledger are not supported with workers')
+        portfolio = ShardedPortfolio(contracts, workers=workers, batch_size=batch_size, history=history)
+        add_fill = lambda *row: portfolio.add_row(*row)
+    else:
+        portfolio = Portfolio(contracts, history=history, journal=journal, ledger=ledger)
+        if journal is not None:
+            journal.restore(portfolio)
+        add_fill = lambda *row: portfolio.add_fill(Fill.create(*row[:4], TransactionTime=row[4]))
+    count = 0
+    last = time.monotonic()
+    for orderid, ticker, price, quantity, *rest in READERS[fmt](stream):
+        transactiontime = parse_time(rest[0]) if rest else None
+        add_fill(orderid, ticker, price, quantity, transactiontime)
+        count += 1
+        if snapshot_every and not count % snapshot_every:
+            print_snapshot(portfolio, out)
+        if snapshot_interval and time.monotonic() - last >= snapshot_interval:
+            print_snapshot(portfolio, out)
+            last = time.monotonic()
+    if journal is not None:
+        journal.snapshot(portfolio)
+    if ledger is not None:
+        ledger.spill()
+    print_snapshot(portfolio, out)
+    return portfolio
+
+
+def print_snapshot(portfolio, out=sys.stdout):
+    for blotter in portfolio:
+        print(blotter, file=out)
+    print(portfolio, file=out)
+    out.flush()
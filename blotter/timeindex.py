@@ -0,0 +1,110 @@
+import math
+import bisect
+import collections
+from array import array
+
+from .store import to_micros
+from .ledger import Match
+
+AsOf = collections.namedtuple('AsOf', ('TransactionTime', 'net_position', 'avg_open_price',
+                                       'realized_pnl', 'unrealized_pnl'))
+
+
+class TimeIndex:
+    '''
+    fills ordered by TransactionTime, the FIFO matches and the blotter totals
+    after every update, so time range and as-of questions are bisections
+    instead of a scan of Blotter.trades
+
+    fills arriving late are inserted at their TransactionTime, matches and
+    totals are stamped with the latest TransactionTime seen so far because
+    that is when the blotter booked them
+    Example:
+        blotter = Blotter('ZCN19', time_index=True)
+        blotter.fills_between(dt.datetime(2019, 6, 3, 10), dt.datetime(2019, 6, 3, 10, 5))
+        blotter.as_of(dt.datetime(2019, 6, 3, 14))
+    '''
+    def __init__(self):
+        self.keys = array('q')
+        self.fills = []
+        self.late = 0
+        self.watermark = 0
+        # totals after each update, one entry per distinct watermark
+        self.marks = array('q')
+        self.net = array('d')
+        self.avg = array('d')
+        self.realized = array('d')
+        self.match_keys = array('q')
+        self.matches = []
+
+    def __len__(self):
+        return len(self.fills)
+
+    def add(self, fill):
+        '''
+        fill -> Fill, in arrival order
+        '''
+        key = to_micros(fill.TransactionTime)
+        if not self.keys or key >= self.keys[-1]:
+            self.keys.append(key)
+            self.fills.append(fill)
+        else:
+            i = bisect.bisect_right(self.keys, key)
+            self.keys.insert(i, key)
+            self.fills.insert(i, fill)
+            self.late += 1
+        if key > self.watermark:
+            self.watermark = key
+
+    def record(self, opening, closing, quantity, pnl):
+        '''
+        one FIFO match, arguments as for Ledger.record
+        '''
+        self.match_keys.append(self.watermark)
+        self.matches.append(Match(closing.ExchangeTicker, opening.ExecID, closing.ExecID, opening.OrderID,
+                                  closing.OrderID, quantity, opening.PriceLevel, closing.PriceLevel, pnl,
+                                  closing.TransactionTime))
+
+    def mark(self, blotter):
+        '''
+        record the blotter totals at the current watermark
+        '''
+        avg = math.nan if blotter.avg_open_price is None else blotter.avg_open_price
+        if self.marks and self.marks[-1] == self.watermark:
+            self.net[-1], self.avg[-1], self.realized[-1] = blotter.net_position, avg, blotter.realized_pnl
+            return
+        self.marks.append(self.watermark)
+        self.net.append(blotter.net_position)
+        self.avg.append(avg)
+        self.realized.append(blotter.realized_pnl)
+
+    def span(self, keys, start, end):
+        lo = 0 if start is None else bisect.bisect_left(keys, to_micros(start))
+        hi = len(keys) if end is None else bisect.bisect_left(keys, to_micros(end))
+        return lo, hi
+
+    def between(self, start=None, end=None):
+        '''
+        start, end -> datetime, end exclusive, None leaves that side open
+        @returns List of Fill in TransactionTime order
+        '''
+        lo, hi = self.span(self.keys, start, end)
+        return self.fills[lo:hi]
+
+    def matches_between(self, start=None, end=None):
+        '''
+        @returns List of Match booked in [start, end)
+        '''
+        lo, hi = self.span(self.match_keys, start, end)
+        return self.matches[lo:hi]
+
+    def as_of(self, when):
+        '''
+        when -> datetime
+        @returns AsOf totals after the last update at or before when, unrealized_pnl is None
+        '''
+        i = bisect.bisect_right(self.marks, to_micros(when)) - 1
+        if i < 0:
+            return AsOf(when, 0, None, 0, None)
+        avg = self.avg[i]
+        return AsOf(when, self.net[i], None if math.isnan(avg) else avg, self.realized[i], None)
@@ -14,3 +14,16 @@ def calc_avg_open_price(qty1, px1, qty2, px2):
     num = (px1 * qty1) + (px2 * qty2) 
     return num / (qty1 + qty2)
 
+
+def to_ticks(price, tick_size):
+    '''
+    @returns int number of ticks in price
+    '''
+    return round(price / tick_size)
+
+def from_ticks(ticks, tick_size):
+    '''
+    dividing by the ticks per unit rounds back to the quoted price, 70 / 100.0 == 0.7 where 70 * 0.01 is not
+    @returns float price
+    '''
+    return ticks / (1 / tick_size)
@@ -0,0 +1,194 @@
+import collections
+
+from .util import calc_pnl, calc_avg_open_price, to_ticks, from_ticks
+
+Scenario = collections.namedtuple('Scenario', ('net_position', 'avg_open_price', 'realized_pnl',
+                                               'unrealized_pnl', 'total_pnl'))
+
+
+class Lot:
+    '''
+    an open hypothetical fill
+    '''
+    __slots__ = ('PriceLevel', 'OrderFilled', 'OpenQuantity')
+
+    def __init__(self, pricelevel, orderfilled):
+        self.PriceLevel = pricelevel
+        self.OrderFilled = orderfilled
+        self.OpenQuantity = orderfilled
+
+
+class WhatIf:
+    '''
+    hypothetical fills and marks applied over a Blotter without touching it,
+    resting lots are read in closing order and only the quantity a scenario
+    consumes is held here, so a scenario costs the lots it closes rather
+    than a copy of the book
+
+    the results are those Blotter.update and update_from_marketdata would
+    give for the same fills, a WhatIf is stale once the Blotter updates
+    Example:
+        blotter.what_if([(50, 3.7125)], last_price=3.715).total_pnl
+        scenario = blotter.what_if()
+        scenario.add(-20, 3.72).update_from_marketdata(3.7175)
+        scenario.result()
+    '''
+    def __init__(self, blotter):
+        '''
+        blotter -> Blotter
+        '''
+        self.blotter = blotter
+        self.ticks = blotter.ticks
+        self.net_position = blotter.net_position
+        self.avg_open_price = blotter.avg_open_price
+        self.avg_open_ticks = blotter.avg_open_ticks
+        self.realized_pnl = blotter.realized_pnl
+        self.realized_ticks = blotter.realized_ticks
+        self.unrealized_pnl = blotter.unrealized_pnl
+        self.total_pnl = blotter.total_pnl
+        # hypothetical lots, in the blotter's matching policy
+        self.added = type(blotter.lots)()
+        # direction -> [iterator over the resting lots, head lot, its open quantity left]
+        self.resting = {}
+
+    def __str__(self):
+        return f'>{self.__class__.__name__.upper()}|' + \
+               f'{self.blotter.ticker}|' + \
+               f'{self.net_position}|' + \
+               f'{self.avg_open_price}|' + \
+               f'{round(self.total_pnl, 2)}|'
+
+    def __repr__(self):
+        return self.__str__()
+
+    def head(self, direction):
+        '''
+        @returns the next resting lot and its open quantity left, None when they are all closed
+        '''
+        cursor = self.resting.get(direction)
+        if cursor is None:
+            walk = self.blotter.lots.walk(direction)
+            lot = next(walk, None)
+            cursor = self.resting[direction] = [walk, lot, None if lot is None else lot.OpenQuantity]
+        return cursor
+
+    def close(self, quantity, price):
+        '''
+        match quantity against the resting and hypothetical lots as Blotter.close_existing_positions
+        @returns quantity left open
+        '''
+        direction = -1 if quantity > 0 else 1
+        blotter, lots, added = self.blotter, self.blotter.lots, self.added
+        cursor = self.head(direction)
+        scale = blotter.contract_multiplier if self.ticks else \
+            blotter.contract_multiplier / blotter.tick_size * blotter.tick_value
+        while quantity:
+            lot, extra = cursor[1], added.peek(direction)
+            if lot is not None and (extra is None or lots.closes_first(lot, extra)):
+                open_quantity = cursor[2]
+            elif extra is not None:
+                lot, open_quantity = extra, extra.OpenQuantity
+            else:
+                break
+            if lots.average:
+                opened = self.avg_open_ticks if self.ticks else self.avg_open_price
+            else:
+                opened = to_ticks(lot.PriceLevel, blotter.tick_size) if self.ticks else lot.PriceLevel
+            pnl = calc_pnl(open_quantity, opened, quantity, price) * scale
+            if self.ticks:
+                self.realized_ticks += pnl
+                self.realized_pnl = self.realized_ticks * blotter.tick_value
+            else:
+                self.realized_pnl += pnl
+            if abs(open_quantity) <= abs(quantity):
+                quantity += open_quantity
+                open_quantity = 0
+            else:
+                open_quantity += quantity
+                quantity = 0
+            if lot is extra:
+                extra.OpenQuantity = open_quantity
+                if not open_quantity:
+                    added.pop(direction)
+            elif open_quantity:
+                cursor[2] = open_quantity
+            else:
+                lot = cursor[1] = next(cursor[0], None)
+                cursor[2] = None if lot is None else lot.OpenQuantity
+        return quantity
+
+    def add(self, quantity, price):
+        '''
+        quantity -> signed OrderFilled
+        price -> PriceLevel
+        @returns WhatIf
+        '''
+        quantity, price = float(quantity), float(price)
+        if not quantity:
+            raise ValueError('Received hypothetical fill with 0 quantity')
+        open_quantity, pricelevel = quantity, price
+        is_closing_trade = self.net_position and (self.net_position > 0) != (quantity > 0)
+        if self.ticks:
+            price, avg = to_ticks(price, self.blotter.tick_size), self.avg_open_ticks
+        else:
+            avg = self.avg_open_price
+
+        if is_closing_trade:
+            open_quantity = self.close(quantity, price)
+        elif self.net_position:
+            avg = calc_avg_open_price(self.net_position, avg, quantity, price)
+        else:
+            avg = price
+
+        if is_closing_trade and abs(self.net_position) < abs(open_quantity):
+            avg = price
+        elif is_closing_trade and self.blotter.lots.average and open_quantity:
+            avg = price
+
+        self.total_pnl = self.realized_pnl + self.unrealized_pnl
+        self.net_position += quantity
+
+        if not self.net_position:
+            avg = None
+        if self.ticks:
+            self.avg_open_ticks = avg
+            self.avg_open_price = None if avg is None else from_ticks(avg, self.blotter.tick_size)
+        else:
+            self.avg_open_price = avg
+
+        if open_quantity:
+            lot = Lot(pricelevel, quantity)
+            lot.OpenQuantity = open_quantity
+            self.added.add(lot)
+        return self
+
+    def add_fill(self, fill):
+        '''
+        fill -> Fill, it is only read
+        @returns WhatIf
+        '''
+        return self.add(fill.OrderFilled, fill.PriceLevel)
+
+    def update_from_marketdata(self, last_price):
+        '''
+        last_price -> float
+        @returns WhatIf
+        '''
+        blotter = self.blotter
+        if self.net_position and self.ticks:
+            self.unrealized_pnl = (to_ticks(last_price, blotter.tick_size) - self.avg_open_ticks) * self.net_position \
+                * blotter.contract_multiplier * blotter.tick_value
+        elif self.net_position:
+            self.unrealized_pnl = (last_price - self.avg_open_price) * self.net_position \
+                * blotter.contract_multiplier / blotter.tick_size * blotter.tick_value
+        else:
+            self.unrealized_pnl = 0
+        self.total_pnl = self.realized_pnl + self.unrealized_pnl
+        return self
+
+    def result(self):
+        '''
+        @returns Scenario
+        '''
+        return Scenario(self.net_position, self.avg_open_price, self.realized_pnl,
+                        self.unrealized_pnl, self.total_pnl)
@@ -7,5 +7,6 @@ setup(
    author='Andrew Berger',
    author_email='aberger91@pm.me',
    packages=['blotter'],
+   extras_require={'numpy': ['numpy']},
    test_suite='tests'
 )
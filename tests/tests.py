@@ -1,7 +1,22 @@
+import io
+import os
+import asyncio
+import json
+import struct
 import unittest
 import logging
+import tempfile
 import datetime as dt
-from blotter import Blotter, Fill, DIRECTIONS
+try:
+    import numpy as np
+except ImportError:
+    np = None
+from blotter import Blotter, Fill, FillStore, Portfolio, Conflator, Journal, Ledger, ShardedPortfolio, Stats, PolicyBlotter, SnapshotTable, SnapshotReader, Limits, DIRECTIONS
+from blotter.stream import consume_stream, load_contracts
+from blotter.export import FILLS
+from blotter.events import FillApplied, LotBooked, LotBookedPartial, PositionFlat, PositionFlip, PnlThreshold
+from blotter.server import BlotterServer, BlotterClient
+from blotter import log
 
 logger = logging.getLogger("blotter.log")
 
@@ -230,3 +245,809 @@ class TestBlotter(unittest.TestCase):
         partial = list(filter(lambda x: int(x.OrderID)==1, opens))[0]
         assert(partial.BookedPartial == 1)
 
+
+    @annotate
+    def test_sweep_order_many_lots(self):
+        fills = [Fill.create_from_attrs(i, 'ZCN19', 3.7025, 1) for i in range(5000)]
+        fills.append(Fill.create_from_attrs(5000, 'ZCN19', 3.705, -5000))
+        manager = Blotter('ZCN19').initialize_from_list(fills)
+        assert(round(manager.total_pnl, 2) == 12.5 * 5000)
+        assert(manager.net_position == 0)
+        assert(all(t.Booked for t in manager.trades))
+        assert(len(fills[-1].Offsets) == 5000)
+
+    @annotate
+    def test_fifo_trade_by_direction(self):
+        f = '1,ZCN19,3.7025,2 \n\
+2,ZCN19,3.705,3 \n\
+3,ZCN19,3.705,-3'
+        manager = initialize_from_csvstr(f)
+        fifo = manager.get_fifo_trade_by_direction(DIRECTIONS.LONG.value)
+        assert(int(fifo.OrderID) == 2)
+        assert(fifo.OpenQuantity == 2)
+        assert(manager.get_fifo_trade_by_direction(DIRECTIONS.SHORT.value) is None)
+
+    @annotate
+    def test_open_positions_snapshot_is_stable(self):
+        f = '1,ZCN19,4.005,2 \n\
+1,ZCN19,4.0025,2 \n\
+2,ZCN19,4.005,1 \n\
+3,ZCN19,4.01,-3'
+        manager = initialize_from_csvstr(f)
+        first = manager.get_open_positions()
+        second = manager.get_open_positions()
+        summary = lambda opens: [(x.OrderID, x.OpenQuantity, x.OrderFilled, round(x.PriceLevel, 6)) for x in opens]
+        assert(summary(first) == summary(second))
+        assert(summary(first) == [('1', 1.0, 2.0, 4.0025), ('2', 1.0, 1.0, 4.005)])
+        assert(manager.trades[1].OrderFilled == 2)
+        assert(len(manager.trades[0].Offsets) == 1)
+
+    @annotate
+    def test_fill_direct_constructor(self):
+        when = dt.datetime(2019, 5, 1, 9, 30)
+        a = Fill.create(1, 'ZCN19', '3.7025', '2', TransactionTime=when)
+        b = Fill.create_from_attrs(1, 'ZCN19', 3.7025, -2, TransactionTime=when)
+        assert(not hasattr(a, '__dict__'))
+        assert(a.logger is b.logger)
+        assert(a.ExecID != b.ExecID)
+        assert((a.PriceLevel, a.OrderFilled, a.OpenQuantity) == (3.7025, 2.0, 2.0))
+        assert(b.TransactionTime == when and b.Direction == DIRECTIONS.SHORT)
+
+    @annotate
+    def test_store_backed_blotter(self):
+        f = '1,ZCN19,3.7025,1 \n\
+2,ZCN19,3.7025,-2 \n\
+3,ZCN19,3.7125,3 \n\
+4,ZCN19,3.7025,-4 \n\
+5,ZCN19,3.7075,5'
+        expected = initialize_from_csvstr(f)
+        fills = [Fill.create_from_attrs(*x.split(',')) for x in f.split('\n')]
+        manager = Blotter('ZCN19', store=FillStore()).initialize_from_list(fills)
+        assert(round(manager.total_pnl, 2) == round(expected.total_pnl, 2))
+        assert(manager.net_position == expected.net_position == 3)
+        assert([t.Booked for t in manager.trades] == [t.Booked for t in expected.trades])
+        assert([t.OpenQuantity for t in manager.trades] == [t.OpenQuantity for t in expected.trades])
+        assert([o.ExecID for o in manager.trades[1].Offsets] == [fills[0].ExecID, fills[2].ExecID])
+        assert(manager.trades[0].TransactionTime == fills[0].TransactionTime)
+        assert(repr(manager.trades[-1]).split('|')[:6] == repr(expected.trades[-1]).split('|')[:6])
+
+    @annotate
+    def test_bulk_load_matches_incremental(self):
+        f = '1,ZCN19,3.70,1 \n\
+2,ZCN19,3.7025,1 \n\
+3,ZCN19,3.7075,-3 \n\
+4,ZCN19,3.705,1 \n\
+5,ZCN19,3.7025,4 \n\
+6,ZCN19,3.705,-2 \n\
+7,ZCN19,3.71,-1'
+        expected = initialize_from_csvstr(f)
+        rows = [x.split(',') for x in f.split('\n')]
+        for quantity in (1, 0.5):
+            incremental = Blotter('ZCN19').initialize_from_list(
+                [Fill.create_from_attrs(o, t, p, float(q) * quantity) for o, t, p, q in rows])
+            manager = Blotter('ZCN19').initialize_from_list(
+                [(o, t, p, float(q) * quantity) for o, t, p, q in rows], bulk=True)
+            assert(manager.realized_pnl == incremental.realized_pnl)
+            assert(manager.net_position == incremental.net_position)
+            assert(manager.avg_open_price == incremental.avg_open_price)
+            assert([t.OpenQuantity for t in manager.trades] == [t.OpenQuantity for t in incremental.trades])
+            assert([t.RealPnl for t in manager.trades] == [t.RealPnl for t in incremental.trades])
+            assert([[o.OrderID for o in t.Offsets] for t in manager.trades] == \
+                   [[o.OrderID for o in t.Offsets] for t in incremental.trades])
+        assert(round(expected.total_pnl, 2) == round(manager.total_pnl * 2, 2))
+        manager.add_fill(Fill.create_from_attrs(8, 'ZCN19', 3.70, -0.5))
+        assert(manager.net_position == 0)
+        # prices off the tick grid, through the vectorized (integral) and the scalar pass
+        prices = (3.70639, 3.70151, 3.70635, 3.70868, 3.70523, 3.70741, 3.70671)
+        for quantity in (1, 0.5):
+            fills = [(o, t, p, float(q) * quantity) for (o, t, _, q), p in zip(rows, prices)]
+            incremental = Blotter('ZCN19', contract_multiplier=5000).initialize_from_list(
+                [Fill.create_from_attrs(*f) for f in fills])
+            manager = Blotter('ZCN19', contract_multiplier=5000).initialize_from_list(fills, bulk=True)
+            assert(manager.realized_pnl == incremental.realized_pnl)
+            assert([t.RealPnl for t in manager.trades] == [t.RealPnl for t in incremental.trades])
+
+    @annotate
+    def test_bulk_load_keeps_fill_ids(self):
+        fills = [Fill.create(o, 'ZCN19', p, q, ClOrderID=f'C{o}', ExecID=f'E{o}')
+                 for o, p, q in ((1, 3.7025, 2), (2, 3.705, -1), (3, 3.7075, 1))]
+        manager = Blotter('ZCN19').initialize_from_list(fills, bulk=True)
+        assert([(t.OrderID, t.ClOrderID, t.ExecID) for t in manager.trades] == \
+               [(f.OrderID, f.ClOrderID, f.ExecID) for f in fills])
+        rows = Blotter('ZCN19').initialize_from_list([(1, 'ZCN19', 3.7025, 2, None, 'X1'), (2, 'ZCN19', 3.705, -1)],
+                                                     bulk=True).trades
+        assert(rows[0].ExecID == 'X1' and rows[0].ClOrderID == 1 and rows[1].ExecID not in ('X1', 1, 2))
+
+    @unittest.skipIf(np is None, 'numpy not installed')
+    @annotate
+    def test_bulk_load_from_columns(self):
+        quantity = np.array([5, -1, 1, -2, 1, 3, -2, 1], dtype=float)
+        price = np.array([3.7025, 3.705, 3.7025, 3.705, 3.7025, 3.705, 3.7025, 3.705])
+        times = np.arange('2019-05-01T09:30', 8, dtype='datetime64[m]')
+        manager = Blotter('ZCN19').initialize_from_columns(quantity, price, orderid=np.arange(1, 9), transactiontime=times)
+        assert(round(manager.total_pnl, 2) == 12.5 + 25 + 0)
+        assert(manager.net_position == 6)
+        assert([3, 5, 6, 8] == [int(x.OrderID) for x in manager.get_open_positions()])
+        assert(manager.trades[1].TransactionTime == dt.datetime(2019, 5, 1, 9, 31))
+
+    @annotate
+    def test_bulk_load_requires_empty_blotter(self):
+        manager = initialize_from_csvstr('1,ZCN19,3.7025,1')
+        with self.assertRaises(ValueError):
+            manager.initialize_from_list([(2, 'ZCN19', 3.705, -1)], bulk=True)
+        with self.assertRaises(ValueError):
+            Blotter('ZCN19').initialize_from_list([(2, 'ZCZ19', 3.705, -1)], bulk=True)
+        # history=False keeps trades empty, yet open lots still make the blotter live
+        live = Blotter('ZCN19', history=False).initialize_from_list([Fill.create(1, 'ZCN19', 3.7025, 1)])
+        with self.assertRaises(ValueError):
+            live.initialize_from_list([(2, 'ZCN19', 3.705, -1)], bulk=True)
+        assert(live.net_position == 1 and len(live.lots) == 1)
+
+    @annotate
+    def test_bulk_load_without_history(self):
+        rows = [(1, 'ZCN19', 3.70, 2), (2, 'ZCN19', 3.7025, 1), (3, 'ZCN19', 3.7075, -2), (4, 'ZCN19', 3.705, 1)]
+        incremental = Blotter('ZCN19', history=False).initialize_from_list([Fill.create(*row) for row in rows])
+        for quantity in (1, 0.5):
+            manager = Blotter('ZCN19', history=False).initialize_from_list(
+                [(o, t, p, q * quantity) for o, t, p, q in rows], bulk=True)
+            assert(manager.store is None and len(manager.trades) == 0)
+            assert([type(f) for f in manager.get_open_positions()] == [Fill, Fill])
+        assert(manager.net_position * 2 == incremental.net_position)
+        assert([(f.OrderID, f.OpenQuantity * 2, [o.OrderID for o in f.Offsets]) for f in manager.get_open_positions()] == \
+               [(f.OrderID, f.OpenQuantity, [o.OrderID for o in f.Offsets]) for f in incremental.get_open_positions()])
+        manager.add_fill(Fill.create(5, 'ZCN19', 3.71, -1))
+        assert(manager.net_position == 0 and len(manager.trades) == 0)
+
+    @annotate
+    def test_stream_csv(self):
+        f = 'OrderID,ExchangeTicker,PriceLevel,OrderFilled\n\
+1,ZCN19,3.7025,1\n\
+2,ZSN19,9.00,-2\n\
+3,ZCN19,3.705,-1\n\
+4,ZSN19,8.9975,2\n'
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as contracts:
+            json.dump({'defaults': {'tick_value': 12.5}, 'ZSN19': {'tick_value': 50}}, contracts)
+        out = io.StringIO()
+        blotters = consume_stream(io.StringIO(f), contracts=load_contracts(contracts.name), snapshot_every=2, out=out)
+        os.unlink(contracts.name)
+        assert(round(blotters['ZCN19'].total_pnl, 2) == 12.5)
+        assert(round(blotters['ZSN19'].total_pnl, 2) == 100)
+        assert(blotters['ZCN19'].trades == [])
+        assert(len(out.getvalue().splitlines()) == 3 * (2 + 1))
+
+    @annotate
+    def test_stream_applies_rows_as_they_arrive(self):
+        out, seen = io.StringIO(), []
+        def feed(first, second):
+            # a slow pipe, the second line only arrives after the first was applied and printed
+            yield first
+            seen.append(out.getvalue())
+            yield second
+        csv_rows = feed('1,ZCN19,3.7025,2\n', '2,ZCN19,3.705,-1\n')
+        json_rows = feed(json.dumps({'OrderID': 1, 'ExchangeTicker': 'ZCN19', 'PriceLevel': 3.7025, 'OrderFilled': 2}),
+                         json.dumps({'OrderID': 2, 'ExchangeTicker': 'ZCN19', 'PriceLevel': 3.705, 'OrderFilled': -1}))
+        for fmt, lines in (('csv', csv_rows), ('jsonl', json_rows)):
+            portfolio = consume_stream(lines, fmt=fmt, snapshot_interval=1e-9, out=out)
+            assert('>BLOTTER|LONG|2.0|ZCN19|' in seen[-1] and portfolio['ZCN19'].net_position == 1)
+            out.seek(0)
+            out.truncate()
+
+    @annotate
+    def test_stream_jsonl_history(self):
+        rows = [{'OrderID': 1, 'ExchangeTicker': 'ZCN19', 'PriceLevel': 3.7025, 'OrderFilled': 5},
+                {'OrderID': 2, 'ExchangeTicker': 'ZCN19', 'PriceLevel': 3.705, 'OrderFilled': -2,
+                 'TransactionTime': '2019-05-01T09:30:00'}]
+        f = '\n'.join(json.dumps(r) for r in rows)
+        blotters = consume_stream(io.StringIO(f), fmt='jsonl', out=io.StringIO(), history=True)
+        manager = blotters['ZCN19']
+        assert(round(manager.total_pnl, 2) == 25)
+        assert(manager.net_position == 3)
+        assert(manager.trades[1].TransactionTime == dt.datetime(2019, 5, 1, 9, 30))
+        assert(len(manager.trades[1].Offsets) == 1)
+
+    @annotate
+    def test_ticks_pnl_is_exact(self):
+        rows = [(1, 'X', 1.0, 1), (2, 'X', 1.1, -1), (3, 'X', 1.0, 1), (4, 'X', 1.2, -1), (5, 'X', 0.7, 3)]
+        blotter = Blotter('X', tick_size=0.01, tick_value=0.01, ticks=True)
+        for row in rows:
+            blotter.add_fill(Fill.create(*row))
+        blotter.update_from_marketdata(0.8)
+        assert(blotter.realized_ticks == 30)
+        assert(blotter.realized_pnl == 0.3)
+        assert(blotter.unrealized_pnl == 0.3)
+        assert(blotter.avg_open_price == 0.7)
+        bulk = Blotter('X', tick_size=0.01, tick_value=0.01, ticks=True)
+        bulk.initialize_from_list(rows, bulk=True)
+        assert(bulk.realized_ticks == 30)
+        assert(bulk.realized_pnl == blotter.realized_pnl)
+        assert(bulk.avg_open_price == blotter.avg_open_price)
+
+    @annotate
+    def test_stats_instrumentation(self):
+        stats = Stats({'desk': 'grains'})
+        blotter = Blotter('ZCN19', stats=stats)
+        for row in [(1, 'ZCN19', 3.7025, 2), (2, 'ZCN19', 3.705, 1), (3, 'ZCN19', 3.7075, -4)]:
+            blotter.add_fill(Fill.create(*row))
+        blotter.get_open_positions()
+        blotter.update_from_marketdata(3.71)
+        snapshot = stats.snapshot()
+        assert(snapshot['counters'] == {'fills': 3, 'bookings_full': 2, 'bookings_partial': 2})
+        assert(snapshot['gauges'] == {'open_lots': 1, 'open_orders': 1, 'trades': 3})
+        assert(snapshot['histograms']['lots_walked']['buckets'][2] == 1)
+        assert(snapshot['histograms']['update_us']['count'] == 3)
+        assert(snapshot['histograms']['open_positions_us']['count'] == 1)
+        assert('blotter_lots_walked_bucket{desk="grains",le="2"} 1' in stats.prometheus())
+        blotter.instrument(None)
+        blotter.add_fill(Fill.create(4, 'ZCN19', 3.7075, 1))
+        assert(stats.snapshot()['counters']['fills'] == 3 and 'update' not in vars(blotter))
+
+    @annotate
+    def test_time_index_range_and_as_of(self):
+        at = lambda h, m: dt.datetime(2019, 6, 3, h, m)
+        rows = [(1, 'ZCN19', 3.7025, 2, at(10, 0)), (2, 'ZCN19', 3.705, -1, at(10, 4)),
+                (3, 'ZCN19', 3.7075, -3, at(14, 30)), (4, 'ZCN19', 3.70, 1, at(10, 2))]
+        blotter = Blotter('ZCN19', time_index=True)
+        for orderid, ticker, price, qty, when in rows:
+            blotter.add_fill(Fill.create(orderid, ticker, price, qty, TransactionTime=when))
+        assert([f.OrderID for f in blotter.fills_between(at(10, 0), at(10, 5))] == [1, 4, 2])
+        assert([(m.OpenOrderID, m.CloseOrderID) for m in blotter.matches_between(at(10, 0), at(14, 0))] == [(1, 2)])
+        assert(len(blotter.matches_between(at(14, 0))) == 2)
+        state = blotter.as_of(at(14, 0), last_price=3.71)
+        assert(state.net_position == 1 and state.avg_open_price == 3.7025)
+        assert(round(state.realized_pnl, 2) == 12.5 and round(state.unrealized_pnl, 2) == 37.5)
+        # the late fill is booked at the latest TransactionTime seen, 14:30
+        assert(blotter.as_of(at(14, 30)).net_position == -1)
+        assert(blotter.as_of(at(9, 0)).net_position == 0)
+        with self.assertRaises(ValueError):
+            Blotter('ZCN19').as_of(at(14, 0))
+
+    @annotate
+    def test_bust_and_correct_match_replay(self):
+        rows = [(1, 'ZCN19', 3.7025, 2), (2, 'ZCN19', 3.705, -1), (3, 'ZCN19', 3.7075, -3),
+                (4, 'ZCN19', 3.70, 1), (5, 'ZCN19', 3.7125, 2)]
+        at = dt.datetime(2019, 6, 3, 9, 30)
+        make = lambda rows: [Fill.create(*row, ExecID=f'E{row[0]}', TransactionTime=at) for row in rows]
+        blotter = Blotter('ZCN19', undo=10)
+        blotter.initialize_from_list(make(rows))
+        busted = blotter.bust('E2')
+        assert(busted.ExecID == 'E2' and not busted.Booked)
+        replay = Blotter('ZCN19').initialize_from_list(make(rows[:1] + rows[2:]))
+        for b in (blotter, replay):
+            b.update_from_marketdata(3.71)
+        assert(blotter.fields == replay.fields and blotter.realized_pnl == replay.realized_pnl)
+        assert(repr(blotter.get_open_positions()) == repr(replay.get_open_positions()))
+        assert([t.ExecID for t in blotter.trades] == ['E1', 'E3', 'E4', 'E5'])
+
+        portfolio = Portfolio(undo=10)
+        portfolio.initialize_from_list(make(rows))
+        portfolio.update_from_marketdata('ZCN19', 3.71)
+        corrected = portfolio.correct('ZCN19', 'E3', PriceLevel=3.71, OrderFilled=-2)
+        assert(corrected.PriceLevel == 3.71 and corrected.OrderFilled == -2)
+        expected = Portfolio().initialize_from_list(make(rows[:2] + [(3, 'ZCN19', 3.71, -2)] + rows[3:]))
+        expected.update_from_marketdata('ZCN19', 3.71)
+        assert(round(portfolio.total_pnl, 6) == round(expected.total_pnl, 6))
+        assert(portfolio.net_position == expected.net_position == 2)
+        with self.assertRaises(ValueError):
+            portfolio.bust('ZCN19', 'E9')
+        with self.assertRaises(ValueError):
+            replay.bust('E1')
+        # an invalid correction leaves the book, its trades and the undo log as they were
+        state = (blotter.fields, len(blotter.trades), len(blotter.undo), repr(blotter.get_open_positions()))
+        for amend in ({'OrderFilled': 0}, {'PriceLevel': 'abc'}):
+            with self.assertRaises(ValueError):
+                blotter.correct('E3', **amend)
+            assert(state == (blotter.fields, len(blotter.trades), len(blotter.undo), repr(blotter.get_open_positions())))
+        assert(blotter.correct('E3', OrderFilled=-1).OrderFilled == -1)
+
+    @annotate
+    def test_rejected_fill_is_not_recorded(self):
+        at = dt.datetime(2019, 6, 3, 9, 30)
+        blotter = Blotter('ZCN19', undo=10, time_index=True)
+        blotter.add_fill(Fill.create(1, 'ZCN19', 3.7025, 2, TransactionTime=at))
+        state = (blotter.fields, len(blotter.trades), len(blotter.undo), len(blotter.times))
+        with self.assertRaises(ValueError):
+            blotter.add_fill(Fill.create(2, 'ZCN19', 3.705, 0, TransactionTime=at))
+        assert(state == (blotter.fields, len(blotter.trades), len(blotter.undo), len(blotter.times)))
+
+    @annotate
+    def test_matching_policies(self):
+        rows = [(1, 'ZCN19', 3.70, 1), (2, 'ZCN19', 3.72, 1), (3, 'ZCN19', 3.71, 1), (4, 'ZCN19', 3.73, -1)]
+        books = PolicyBlotter('ZCN19')
+        books.initialize_from_list([Fill.create(*row) for row in rows])
+        realized = {k: round(v, 6) for k, v in books.realized_pnl().items()}
+        assert(realized == {'fifo': 150, 'lifo': 100, 'hifo': 50, 'average': 100})
+        assert([t.OrderID for t in books['hifo'].get_open_positions()] == [1, 3])
+        assert(all(b.net_position == 2 for b in books))
+        books.update_from_marketdata(3.73)
+        assert(round(books.total_pnl()['average'], 6) == 300)
+        # a reversal opens the average cost position at the fill price
+        blotter = Blotter('ZCN19', policy='average')
+        blotter.initialize_from_list([Fill.create(*row) for row in rows[:3] + [(4, 'ZCN19', 3.73, -5)]])
+        assert(blotter.net_position == -2 and blotter.avg_open_price == 3.73)
+        with self.assertRaises(ValueError):
+            Blotter('ZCN19', policy='newest')
+        with self.assertRaises(ValueError):
+            Blotter('ZCN19', policy='lifo').initialize_from_list(rows, bulk=True)
+
+    @annotate
+    def test_what_if_leaves_blotter_untouched(self):
+        rows = [(1, 'ZCN19', 3.70, 2), (2, 'ZCN19', 3.7125, 1), (3, 'ZCN19', 3.705, -1)]
+        hypothetical = [(-3, 3.715), (1, 3.71)]
+        for policy in ('fifo', 'lifo', 'hifo', 'average'):
+            blotter = Blotter('ZCN19', policy=policy).initialize_from_list([Fill.create(*row) for row in rows])
+            before = (blotter.fields, repr(blotter.get_open_positions()))
+            scenario = blotter.what_if(hypothetical, last_price=3.7175).result()
+            assert((blotter.fields, repr(blotter.get_open_positions())) == before)
+            expected = Blotter('ZCN19', policy=policy).initialize_from_list(
+                [Fill.create(*row) for row in rows] + [Fill.create(4 + i, 'ZCN19', px, q) for i, (q, px) in enumerate(hypothetical)])
+            expected.update_from_marketdata(3.7175)
+            assert(scenario.net_position == expected.net_position == 0)
+            assert(round(scenario.realized_pnl, 6) == round(expected.realized_pnl, 6))
+            assert(round(scenario.total_pnl, 6) == round(expected.total_pnl, 6))
+        with self.assertRaises(ValueError):
+            blotter.what_if([(0, 3.71)])
+
+    @annotate
+    def test_series_rings_fold_and_track_drawdown(self):
+        now = [0]
+        blotter = Blotter('ZCN19', series={'capacity': 4, 'levels': 2, 'factor': 2, 'clock': lambda: now[0]})
+        prices = [3.70, 3.7025, 3.705, 3.70, 3.6975, 3.7025, 3.7075, 3.71, 3.705, 3.7125, 3.71]
+        blotter.add_fill(Fill.create(1, 'ZCN19', 3.70, 2))
+        for now[0], price in enumerate(prices, 1):
+            blotter.update_from_marketdata(price)
+        series = blotter.series
+        assert(series.samples == 12 and len(series) == 4)
+        assert(list(series.column('time')) == [8, 9, 10, 11])
+        # level 1 keeps the newest row of every pair level 0 overwrote
+        assert(list(series.column('time', level=1)) == [1, 3, 5, 7])
+        assert(round(sum(series.column('pnl', level=1)) + sum(series.column('pnl')), 6) == round(blotter.total_pnl, 6))
+        assert(round(series.high_water, 6) == 125)
+        assert(round(series.max_drawdown, 6) == 75)
+
+        bucketed = Blotter('ZCN19', series={'bucket': 60, 'clock': lambda: now[0]})
+        for now[0], price in zip((0, 30, 59, 60, 90), prices):
+            bucketed.add_fill(Fill.create(now[0], 'ZCN19', price, 1))
+        assert(list(bucketed.series.column('time')) == [59, 90])
+        assert(list(bucketed.series.column('net_position')) == [3, 5])
+        with self.assertRaises(ValueError):
+            Blotter('ZCN19', series={'capacity': 0})
+
+        # a portfolio takes one sample per fill, at its mark, and samples batch marks too
+        portfolio = Portfolio(series={'clock': lambda: now[0]})
+        portfolio.add_fill(Fill.create(1, 'ZCN19', 3.70, 2))
+        portfolio.mark({'ZCN19': 3.7125})
+        portfolio.add_fill(Fill.create(2, 'ZCN19', 3.71, -1))
+        series = portfolio['ZCN19'].series
+        assert(series.samples == 3 and list(series.column('net_position')) == [2, 2, 1])
+        assert([round(x, 6) for x in series.column('total_pnl')] == [0, 125, 112.5])
+        assert(round(series.max_drawdown, 6) == 12.5)
+
+    @annotate
+    def test_export_views(self):
+        at = dt.datetime(2019, 6, 3, 9, 30)
+        rows = [(1, 'ZCN19', 3.7025, 2), (2, 'ZCN19', 3.705, -1), (3, 'ZCN19', 3.71, 1)]
+        blotters = [Blotter('ZCN19', ledger=Ledger()), Blotter('ZCN19', store=FillStore())]
+        for blotter in blotters:
+            blotter.initialize_from_list([Fill.create(*row, ExecID=row[0], TransactionTime=at) for row in rows])
+        exported = []
+        for blotter in blotters:
+            f = io.StringIO()
+            assert(blotter.export(f, 'closed') == 1)
+            exported.append(f.getvalue())
+        assert(exported[0] == exported[1])
+        header, closed = exported[0].splitlines()
+        assert(header.split(',') == [name for name, _ in FILLS])
+        assert(closed.startswith('2,2,2,ZCN19,2019-06-03 09:30:00,3.705,-1.0,0.0,12.49') and closed.endswith(',True,True'))
+        f = io.StringIO()
+        assert(blotters[0].export(f, 'open') == 2)
+        assert([row.rsplit(',', 2)[1:] for row in f.getvalue().splitlines()[1:]] == [['False', 'True'], ['False', 'False']])
+        with self.assertRaises(ValueError):
+            blotters[0].export(f, 'booked')
+        with self.assertRaises(ValueError):
+            blotters[0].export(f, fmt='parquet')
+        if np is None:
+            return
+        for blotter in blotters:
+            f = io.BytesIO()
+            assert(blotter.export(f, 'trades', 'npy', chunk=2) == 3)
+            f.seek(0)
+            trades = np.load(f)
+            assert(list(trades['ExecID']) == ['1', '2', '3'])
+            assert(list(trades['OpenQuantity']) == [1, 0, 1])
+            assert(trades['TransactionTime'][0] == np.datetime64(at, 'us'))
+        f = io.BytesIO()
+        blotters[0].export(f, 'matches', 'npy')
+        f.seek(0)
+        matches = np.load(f)
+        assert(len(matches) == 1 and matches['RealPnl'][0] == blotters[0].realized_pnl)
+
+    @annotate
+    def test_ledger_records_matches(self):
+        fills = [Fill.create(*x.split(','), ExecID=i) for i, x in enumerate(
+                 ['1,ZCN19,3.7025,5', '2,ZCN19,3.705,-2', '3,ZCN19,3.71,-4', '4,ZCN19,3.70,2'])]
+        with tempfile.TemporaryDirectory() as d:
+            ledger = Ledger(os.path.join(d, 'matches.ledger'), spill_every=2)
+            manager = Blotter('ZCN19', history=False, ledger=ledger).initialize_from_list(fills)
+            assert(len(manager.trades) == 0 and len(ledger) == 3 and ledger.spilled == 2)
+            assert([(m.OpenExecID, m.CloseExecID, m.Quantity) for m in ledger] == [(0, 1, 2), (0, 2, 3), (2, 3, -1)])
+            assert(round(ledger.realized_pnl(), 6) == round(manager.realized_pnl, 6))
+            assert([m.CloseOrderID for m in ledger.matches(orderid='1')] == ['2', '3'])
+            assert(Ledger(ledger.path).spilled == 2)
+            # a spill torn mid record, or a zero filled tail, is cut back to the last complete match
+            size = os.path.getsize(ledger.path)
+            os.truncate(ledger.path, size - 3)
+            reopened = Ledger(ledger.path)
+            assert(reopened.spilled == 1 and os.path.getsize(ledger.path) < size - 3)
+            with open(ledger.path, 'ab') as f:
+                f.write(bytes(64))
+            reopened = Ledger(ledger.path)
+            assert(reopened.spilled == 1 and [m.CloseExecID for m in reopened] == [1])
+            reopened.record(fills[0], fills[3], 1, 2.5)
+            reopened.spill()
+            assert([m.CloseExecID for m in Ledger(ledger.path)] == [1, 3])
+
+    @annotate
+    def test_compact_drops_booked_fills(self):
+        f = '1,ZCN19,3.7025,2 \n\
+2,ZCN19,3.705,-1 \n\
+3,ZCN19,3.705,-1 \n\
+4,ZCN19,3.70,3'
+        manager = initialize_from_csvstr(f)
+        assert(manager.compact() == 3)
+        assert([t.OrderID for t in manager.trades] == ['4'])
+        assert(manager.net_position == 3 and round(manager.total_pnl, 2) == 25)
+
+
+class TestPortfolio(unittest.TestCase):
+    def fills(self):
+        return [Fill.create(1, 'ZCN19', 3.7025, 2),
+                Fill.create(2, 'ZSN19', 9.00, -1),
+                Fill.create(3, 'ZCN19', 3.705, -1),
+                Fill.create(4, 'ZWN19', 5.00, 3),
+                Fill.create(5, 'ZSN19', 8.995, 1)]
+
+    def test_routes_fills_by_ticker(self):
+        portfolio = Portfolio({'ZSN19': {'tick_value': 50}}).initialize_from_list(self.fills())
+        assert(len(portfolio) == 3)
+        assert(portfolio['ZCN19'].net_position == 1)
+        assert(portfolio['ZSN19'].tick_value == 50 and portfolio['ZCN19'].tick_value == 12.5)
+        assert(round(portfolio.realized_pnl, 2) == 12.5 + 100)
+        assert(portfolio.net_position == 4 and portfolio.gross_position == 4)
+
+    def test_aggregates_track_marks(self):
+        portfolio = Portfolio().initialize_from_list(self.fills())
+        portfolio.update_from_marketdata('ZCN19', 3.71)
+        portfolio.update_from_marketdata('ZWN19', 4.99)
+        portfolio.update_from_marketdata('ZSN19', 9.01)
+        portfolio.add_fill(Fill.create(6, 'ZWN19', 4.98, -1))
+        total = sum(b.total_pnl for b in portfolio)
+        assert(round(portfolio.total_pnl, 6) == round(total, 6))
+        assert(round(portfolio.net_exposure, 6) == round(3.71 * 1 + 4.99 * 2, 6))
+        incremental = (portfolio.net_exposure, portfolio.gross_exposure, portfolio.total_pnl)
+        refreshed = portfolio.refresh()
+        assert([round(x, 6) for x in incremental] == \
+               [round(x, 6) for x in (refreshed.net_exposure, refreshed.gross_exposure, refreshed.total_pnl)])
+
+    def test_unrealized_uses_contract_scaling(self):
+        portfolio = Portfolio({'ZSN19': {'tick_value': 50}}).initialize_from_list(self.fills())
+        portfolio.update_from_marketdata('ZCN19', 3.71)
+        assert(round(portfolio['ZCN19'].unrealized_pnl, 6) == round((3.71 - 3.7025) / 0.0025 * 12.5, 6))
+
+    def test_batch_mark_matches_scalar(self):
+        prices = {'ZCN19': 3.6975, 'ZSN19': 9.0125, 'ZWN19': 5.0225, 'ZMN19': 300.0}
+        scalar = Portfolio({'ZSN19': {'tick_value': 50}}).initialize_from_list(self.fills())
+        for ticker, price in prices.items():
+            scalar.update_from_marketdata(ticker, price)
+        batch = Portfolio({'ZSN19': {'tick_value': 50}}).initialize_from_list(self.fills()).mark(prices)
+        assert([b.unrealized_pnl for b in batch] == [b.unrealized_pnl for b in scalar])
+        assert(round(batch.total_pnl, 6) == round(scalar.total_pnl, 6))
+        assert(round(batch.net_exposure, 6) == round(scalar.net_exposure, 6))
+        batch.add_fill(Fill.create(6, 'ZMN19', 299.0, 1))
+        assert(batch['ZMN19'].unrealized_pnl == 1 / 0.0025 * 12.5)
+        table = batch.table
+        fallback = table._mark([float('nan'), float('nan'), 4.98, float('nan')])
+        assert(fallback == [2] and table.unrealized_pnl[2] == (4.98 - 5.0) * 3 / 0.0025 * 12.5)
+
+    def test_conflator_keeps_latest_price(self):
+        now = [0.0]
+        portfolio = Portfolio().initialize_from_list(self.fills())
+        conflator = Conflator(portfolio, interval=1, clock=lambda: now[0])
+        for price in (3.70, 3.7125, 3.71):
+            conflator.update_from_marketdata('ZCN19', price)
+        conflator.update_from_marketdata('ZWN19', 4.99)
+        assert(conflator.received == 4 and conflator.dropped == 2 and len(conflator) == 2)
+        assert(portfolio['ZCN19'].unrealized_pnl == 0)
+        now[0] = 1
+        conflator.update_from_marketdata('ZWN19', 4.995)
+        assert(len(conflator) == 0 and conflator.flushes == 1 and conflator.dropped == 3)
+        expected = Portfolio().initialize_from_list(self.fills())
+        expected.update_from_marketdata('ZCN19', 3.71).update_from_marketdata('ZWN19', 4.995)
+        assert(round(portfolio.total_pnl, 6) == round(expected.total_pnl, 6))
+        assert(conflator.flush() == 0 and conflator.flushes == 1)
+        # a quiet period after a burst, poll applies the last prices without another tick
+        conflator.update_from_marketdata('ZCN19', 3.6975)
+        assert(conflator.poll() == 0 and len(conflator) == 1)
+        now[0] = 2
+        assert(conflator.poll() == 1 and conflator.poll() == 0)
+        assert(portfolio['ZCN19'].unrealized_pnl == (3.6975 - 3.7025) / 0.0025 * 12.5)
+
+    def test_sharded_matches_portfolio(self):
+        fills = self.fills() + [Fill.create(6, 'ZWN19', 4.98, -4), Fill.create(7, 'ZCN19', 3.7, 3, ClOrderID='C7')]
+        expected = Portfolio().initialize_from_list(fills).mark({'ZCN19': 3.71, 'ZWN19': 4.99})
+        with ShardedPortfolio(workers=2, batch_size=2) as sharded:
+            sharded.initialize_from_list(fills).mark({'ZCN19': 3.71, 'ZWN19': 4.99})
+            summaries = sharded.snapshot()
+            positions = sharded.get_open_positions('ZCN19')
+        assert([(s.ticker, s.net_position, s.avg_open_price, s.total_pnl) for s in summaries] == \
+               sorted((b.ticker, b.net_position, b.avg_open_price, b.total_pnl) for b in expected))
+        assert(round(sharded.total_pnl, 6) == round(expected.total_pnl, 6))
+        assert(sharded.gross_position == expected.gross_position)
+        assert([(p.OrderID, p.ClOrderID, p.ExecID) for p in positions] == \
+               [(p.OrderID, p.ClOrderID, p.ExecID) for p in expected['ZCN19'].get_open_positions()])
+        # a bad mark is reported by the worker instead of killing it
+        with ShardedPortfolio(workers=1) as sharded:
+            sharded.initialize_from_list(fills).mark({'ZCN19': 'abc'})
+            with self.assertRaises(TypeError):
+                sharded.snapshot()
+            assert(sharded.processes[0].is_alive())
+
+    def test_snapshots_published_to_shared_memory(self):
+        with SnapshotTable(capacity=4) as table, SnapshotReader(table.name) as reader:
+            portfolio = Portfolio(snapshots=table).initialize_from_list(self.fills())
+            assert(reader.read('ZCN19').updates == 2 and reader.read('ZMN19') is None)
+            portfolio.mark({'ZCN19': 3.71, 'ZWN19': 4.99})
+            snapshots = reader.read_all()
+            assert(sorted(snapshots) == ['ZCN19', 'ZSN19', 'ZWN19'])
+            for blotter in portfolio:
+                snapshot = snapshots[blotter.ticker]
+                assert((snapshot.net_position, snapshot.avg_open_price, snapshot.realized_pnl, snapshot.total_pnl) == \
+                       (blotter.net_position, blotter.avg_open_price, blotter.realized_pnl, blotter.total_pnl))
+            assert(snapshots['ZSN19'].avg_open_price is None and snapshots['ZCN19'].updates == 3)
+            portfolio.add_fill(Fill.create(9, 'ZMN19', 1.0, 1))
+            expected = portfolio.net_position
+            # the row is reserved when the Blotter is built, a full table refuses it before the fill is booked
+            with self.assertRaises(ValueError):
+                portfolio.add_fill(Fill.create(10, 'ZLN19', 1.0, 1))
+            assert('ZLN19' not in portfolio.blotters and portfolio.net_position == expected)
+        with SnapshotTable(capacity=4) as table:
+            with self.assertRaises(ValueError):
+                Blotter('Z' * 33, snapshots=table)
+            assert(len(table) == 0)
+        with self.assertRaises(ValueError):
+            ShardedPortfolio(workers=1, snapshots=table)
+
+    def test_events_delivered_in_batches(self):
+        portfolio, batches, positions, crossings = Portfolio(), [], [], []
+        portfolio.subscribe(batches.append, size=4)
+        portfolio.subscribe(positions.extend, kinds=(PositionFlat, PositionFlip), size=1)
+        portfolio.initialize_from_list(self.fills())
+        portfolio.subscribe(crossings.extend, kinds=(PnlThreshold,), thresholds=(20,), size=1)
+        portfolio.mark({'ZCN19': 3.71}).update_from_marketdata('ZCN19', 3.70)
+        assert([[type(e) for e in batch] for batch in batches] == \
+               [[FillApplied, FillApplied, LotBookedPartial, LotBooked, FillApplied],
+                [FillApplied, LotBooked, LotBooked, FillApplied, PositionFlat]])
+        assert(batches[0][2].open_quantity == 1 and round(batches[0][3].real_pnl, 2) == 12.5)
+        assert([(e.ticker, e.previous, round(e.realized_pnl, 2)) for e in positions] == [('ZSN19', -1, 25)])
+        assert([(e.ticker, e.threshold, round(e.total_pnl, 2), e.above) for e in crossings] == \
+               [('ZCN19', 20, 50, True), ('ZCN19', 20, 0, False)])
+        now = [0.0]
+        blotter = Blotter('ZCN19')
+        timed = []
+        subscription = blotter.subscribe(timed.append, interval=1, clock=lambda: now[0])
+        blotter.add_fill(Fill.create(1, 'ZCN19', 3.7025, 1))
+        blotter.add_fill(Fill.create(2, 'ZCN19', 3.705, -2))
+        assert(timed == [] and len(subscription) == 5)
+        now[0] = 1
+        blotter.update_from_marketdata(3.7)
+        assert([type(e) for e in timed[0]] == [FillApplied, LotBooked, LotBookedPartial, FillApplied, PositionFlip])
+        blotter.add_fill(Fill.create(3, 'ZCN19', 3.7, 1))
+        blotter.events.unsubscribe(subscription)
+        assert(len(timed) == 2 and subscription.delivered == 9 and len(blotter.events) == 0)
+        with self.assertRaises(ValueError):
+            ShardedPortfolio(workers=1, events=blotter.events)
+
+    def test_raising_subscriber_keeps_book_and_journal(self):
+        def fail(batch):
+            raise RuntimeError('subscriber down')
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'fills.journal')
+            with Journal(path) as journal:
+                portfolio = Portfolio(journal=journal)
+                subscription = portfolio.subscribe(fail, size=1)
+                portfolio.initialize_from_list(self.fills())
+                portfolio.update_from_marketdata('ZCN19', 3.71)
+            assert(subscription.errors == 5 and subscription.delivered == 0 and len(subscription) == 0)
+            assert(portfolio.net_position == 4 and round(portfolio.total_pnl, 6) == round(sum(b.total_pnl for b in portfolio), 6))
+            restored = Journal(path).restore(Portfolio())
+            assert([(b.ticker, b.net_position) for b in restored] == [(b.ticker, b.net_position) for b in portfolio])
+
+    def test_limits_project_orders_without_booking(self):
+        portfolio = Portfolio().initialize_from_list(self.fills() + [Fill.create(6, 'ZCN19', 3.71, 2)])
+        blotter = portfolio['ZCN19']
+        limits = Limits(blotter, max_position=4, max_open_lots=2, max_daily_loss=100)
+        state = (blotter.net_position, blotter.realized_pnl, [(f.OrderID, f.OpenQuantity) for f in blotter.lots])
+        check = limits.check(-2, 3.70)
+        # closes the rest of order 1 at -12.5 and one of order 6 at -50
+        assert(check.passed and check.net_position == 1 and check.open_lots == 1)
+        assert(round(check.realized_pnl - blotter.realized_pnl, 2) == -12.5 - 50)
+        assert(limits.check(2, 3.70).reason == 'position 5.0 would exceed max_position 4')
+        assert(limits.check(1, 3.70).reason == '3 open lots would exceed max_open_lots 2')
+        assert(limits.check(-3, 3.68).reason.startswith('daily loss 412.5 would exceed'))
+        assert(limits.check(-3, 3.71).passed and limits.check(-8, 3.71).passed is False)
+        assert(state == (blotter.net_position, blotter.realized_pnl, [(f.OrderID, f.OpenQuantity) for f in blotter.lots]))
+        assert(limits.checks == 6 and limits.rejects == 4)
+        blotter.update(Fill.create(7, 'ZCN19', 3.68, -3))
+        assert(limits.check(1, 3.68).passed is False and limits.roll().check(1, 3.68).passed)
+        with self.assertRaises(ValueError):
+            limits.check(0, 3.7)
+
+
+class TestJournal(unittest.TestCase):
+    def fills(self, start=0):
+        prices = (3.7025, 3.705, 3.7, 3.71, 9.0, 8.995)
+        quantities = (2, -1, -3, 1, 4, -2, -1)
+        return [Fill.create(start + i, ('ZCN19', 'ZSN19')[i % 2], prices[i % 6], quantities[i % 7],
+                            ExecID=start + i, TransactionTime=dt.datetime(2019, 6, 3, 9, 30, i))
+                for i in range(40)]
+
+    def state(self, portfolio):
+        return [(b.ticker, b.net_position, b.avg_open_price, round(b.realized_pnl, 6),
+                 [(p.OrderID, p.OpenQuantity, p.RealPnl, p.BookedPartial) for p in b.get_open_positions()],
+                 [f.ExecID for f in b.lots]) for b in portfolio]
+
+    def test_restore_snapshot_and_tail(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'fills.journal')
+            with Journal(path, snapshot_every=15) as journal:
+                live = Portfolio(journal=journal).initialize_from_list(self.fills())
+            assert(os.path.exists(path + '.snapshot'))
+            journal = Journal(path)
+            restored = journal.restore(Portfolio(journal=journal))
+            assert(self.state(restored) == self.state(live))
+            assert(round(restored.realized_pnl, 6) == round(live.realized_pnl, 6))
+            for f in self.fills(100):
+                restored.add_fill(f)
+            journal.close()
+            expected = Portfolio().initialize_from_list(self.fills() + self.fills(100))
+            assert(self.state(Journal(path).restore(Portfolio())) == self.state(expected))
+
+    def test_offset_timestamps_journaled_as_utc(self):
+        rows = 'OrderID,ExchangeTicker,PriceLevel,OrderFilled,TransactionTime\n' + \
+               '1,ZCN19,3.7025,2,2019-06-03T09:30:00-05:00\n' + \
+               '2,ZCN19,3.705,-1,2019-06-03T14:31:00+00:00\n'
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'fills.journal')
+            with Journal(path) as journal:
+                live = consume_stream(io.StringIO(rows), journal=journal, out=io.StringIO())
+            restored = Journal(path).restore(Portfolio())
+            assert(self.state(restored) == self.state(live))
+            assert([f.TransactionTime for f in restored['ZCN19'].get_open_positions()] == [dt.datetime(2019, 6, 3, 14, 30)])
+
+    def test_restore_moves_default_exec_ids_past_the_book(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'fills.journal')
+            ahead = Fill.create(0, 'ZCN19', 3.7, 1).ExecID + 10**6
+            with Journal(path) as journal:
+                Blotter('ZCN19', journal=journal).initialize_from_list(
+                    [Fill.create(1, 'ZCN19', 3.7025, 2, ExecID=ahead), Fill.create(2, 'ZCN19', 3.705, -1, ExecID='E2')])
+            blotter = Journal(path).restore(Blotter('ZCN19', undo=5))
+            fill = Fill.create(3, 'ZCN19', 3.71, 1)
+            assert(fill.ExecID > ahead)
+            blotter.add_fill(fill)
+            assert(blotter.bust(fill.ExecID) is not None and blotter.net_position == 1)
+
+    def test_restore_ticks_exactly(self):
+        rows = [(1, 'X', 1.0, 1), (2, 'X', 1.07, -1), (3, 'X', 1.0, 1), (4, 'X', 1.01, 2)]
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'fills.journal')
+            with Journal(path) as journal:
+                live = Blotter('X', tick_size=0.01, tick_value=0.01, ticks=True, journal=journal)
+                live.initialize_from_list([Fill.create(*row) for row in rows])
+                journal.snapshot()
+            restored = Journal(path).restore(Blotter('X', tick_size=0.01, tick_value=0.01, ticks=True))
+        assert(live.realized_ticks == restored.realized_ticks == 7)
+        assert(live.avg_open_ticks == restored.avg_open_ticks and live.avg_open_price == restored.avg_open_price)
+
+    def test_restore_truncates_torn_record(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'fills.journal')
+            with Journal(path) as journal:
+                Blotter('ZCN19', journal=journal).initialize_from_list(self.fills()[::2])
+            size = os.path.getsize(path)
+            with open(path, 'ab') as f:
+                f.write(b'\x40\x00\x00\x00torn')
+            blotter = Journal(path).restore(Blotter('ZCN19'))
+            assert(os.path.getsize(path) == size)
+            assert(len(blotter.trades) == 20)
+            # a zero filled tail, and a record whose fields run past its length
+            for tail in (b'\x00' * 64, struct.pack('<Iddq', 40, 1.0, 1.0, 0) + b'i\x40\x00' + b'1' * 20):
+                with open(path, 'ab') as f:
+                    f.write(tail)
+                blotter = Journal(path).restore(Blotter('ZCN19'))
+                assert(os.path.getsize(path) == size and len(blotter.trades) == 20)
+
+
+class TestServer(unittest.TestCase):
+    def test_server_round_trip(self):
+        rows = [[1, 'ZCN19', 3.7025, 2], [2, 'ZSN19', 9.00, -1], [3, 'ZCN19', 3.705, -1],
+                [4, 'ZCN19', 3.70, -3, '2019-06-03T09:30:00'], [5, 'ZCN19', 3.70, 0]]
+
+        async def session(address):
+            server = BlotterServer(queue_size=2, batch_size=2)
+            address = await server.start(address)
+            client = await BlotterClient.connect(address)
+            await client.fills(rows[:2])
+            await client.fill(*rows[2])
+            await client.fills(rows[3:])
+            await client.price('ZCN19', 3.6975)
+            await client.price('ZCN19', 3.695)
+            snapshot = await client.snapshot('ZCN19')
+            positions = await client.positions('ZCN19')
+            error = await client.request({'type': 'unknown'})
+            await client.close()
+            await server.close()
+            return snapshot, positions, error
+
+        with tempfile.TemporaryDirectory() as d:
+            snapshot, positions, error = asyncio.run(session(f'unix:{d}/blotter.sock'))
+        expected = Portfolio().initialize_from_list([Fill.create(*r[:4]) for r in rows[:4]])
+        expected.update_from_marketdata('ZCN19', 3.695)
+        blotter = snapshot['blotters'][0]
+        assert(snapshot['fills'] == 4 and snapshot['errors'] == 1 and snapshot['prices'] == 2)
+        assert(blotter['net_position'] == -2 and blotter['total_pnl'] == expected['ZCN19'].total_pnl)
+        assert(snapshot['portfolio']['total_pnl'] == expected.total_pnl)
+        assert([p['OrderID'] for p in positions['positions']] == [4])
+        assert(positions['positions'][0]['TransactionTime'] == '2019-06-03T09:30:00')
+        assert(error['type'] == 'error')
+
+    def test_server_rejects_malformed_price(self):
+        async def session():
+            server = BlotterServer()
+            client = await BlotterClient.connect(await server.start())
+            await client.fill(1, 'ZCN19', 3.7025, 2)
+            await client.price('ZCN19', 'abc')
+            await client.price('ZCN19', None)
+            await client.price('ZCN19', 3.71)
+            snapshot = await asyncio.wait_for(client.snapshot('ZCN19'), 5)
+            await client.close()
+            await server.close()
+            return snapshot
+
+        snapshot = asyncio.run(session())
+        assert(snapshot['errors'] == 2 and snapshot['prices'] == 1)
+        assert(snapshot['blotters'][0]['unrealized_pnl'] == (3.71 - 3.7025) * 2 / 0.0025 * 12.5)
+
+
+class TestLog(unittest.TestCase):
+    def test_async_binary_events(self):
+        root = logging.getLogger('')
+        level = root.level
+        fill = Fill.create(1, 'ZCN19', 3.7025, 2, TransactionTime=dt.datetime(2019, 6, 3, 9, 30))
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'blot.log')
+            log.start_async(path, fmt='binary', level=logging.INFO)
+            try:
+                logger = log.Logger('Fill')
+                logger.event('FILL', fill.fields)
+                fill.OpenQuantity = 0
+                logger.event('BOOKED', fill.fields, logging.DEBUG)
+                logger.warn('Warning: %s', 'OVERFLOW')
+            finally:
+                log.stop_async()
+                root.setLevel(level)
+            events = list(log.read_events(path))
+        assert([(e[2], e[3]) for e in events] == [(logging.INFO, 'FILL'), (logging.WARNING, 'MSG')])
+        assert(events[0][4][:5] == (1, 2.0, 2.0, 'ZCN19', 3.7025))
+        assert(events[1][4] == ('Warning: OVERFLOW',))
+        assert(log.format_event('FILL', fill.fields) == repr(fill))
+
+
+class TestBench(unittest.TestCase):
+    def test_suite_runs_every_case(self):
+        from benchmarks.bench import run_suite, generate_fills, CASES
+        rows = list(generate_fills(500, tickers=3, partial=0.5, reuse=0.1, seed=1))
+        assert(rows == list(generate_fills(500, tickers=3, partial=0.5, reuse=0.1, seed=1)))
+        results = run_suite([500], tickers=3, memory=False, out=None)['results']
+        assert([r['name'] for r in results] == [c.name for c in CASES])
+        assert(all(r['ops'] and r['ops_per_sec'] for r in results))
+        json.dumps(results)